@@ -3,6 +3,10 @@ ASGI config for researchlens project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Django does not handle the lifespan protocol of ASGI, so the application answers it itself: the connection pool of the
+async mappers belongs to the event loop of the server process and is closed when the server shuts down (see
+async_object_relational_mapper.py). All other connections are handled by Django.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -13,4 +17,22 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'researchlens.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# The mappers can only be imported once Django is set up
+from .async_object_relational_mapper import close_pool, start_pool  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await start_pool()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_pool()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -0,0 +1,214 @@
+"""
+This module provides asynchronous versions of the read methods of the paper mappers, which are used by the async views
+when the application is served by an ASGI server. The statements run on psycopg 3 async connections from a pool that
+belongs to the event loop of the server process: while a statement waits for PostgreSQL, the event loop serves other
+requests, so one process can handle many concurrent slow queries instead of blocking one worker per request.
+
+The pool is tied to the lifespan of the ASGI application (see asgi.py), which runs on the event loop of the server.
+Requests that run on another event loop (runserver and WSGI servers run async views in a new event loop per request)
+get a connection of their own that is closed after the request, so no pool is left behind with a finished loop.
+
+The statements and the hydration of the rows are the same as in the synchronous mappers (see PaperListQuery, the
+related-paper statements and PaperHydrator in object_relational_mapper.py); only the way they are executed differs.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+
+from .object_relational_mapper import (
+    NEIGHBOUR_PAPERS_QUERY, PAPER_EMBEDDING_QUERY, PAPERS_BY_IDS_QUERY, RELATED_IDS_QUERY, PaperHydrator,
+    PaperListQuery, vector_search_statements,
+)
+from .sql_instrumentation import instrument_mapper, record_statement
+
+# The event loop of the ASGI server (set on the lifespan startup) and the task that opens its pool on the first request
+_pool_loop = None
+_pool_task = None
+
+
+def conninfo():
+    """Build the connection string of the async connections from the default database settings."""
+
+    from psycopg.conninfo import make_conninfo
+
+    database = settings.DATABASES['default']
+    return make_conninfo(
+        dbname=database['NAME'], user=database['USER'], password=database['PASSWORD'], host=database['HOST'],
+        port=database['PORT'],
+    )
+
+
+async def _configure(db_connection):
+    """Register the pgvector types on a new connection."""
+
+    try:
+        from pgvector.psycopg import register_vector_async
+        await register_vector_async(db_connection)
+    except Exception as e:
+        # The vector extension does not exist yet, the vectors are read in their text form
+        print(f"Could not register the pgvector types: {e}")
+
+
+async def _open_pool():
+    from psycopg import AsyncClientCursor
+    from psycopg_pool import AsyncConnectionPool
+
+    pool = AsyncConnectionPool(
+        conninfo(),
+        min_size=settings.ASYNC_DB_POOL_MIN_SIZE,
+        max_size=settings.ASYNC_DB_POOL_MAX_SIZE,
+        timeout=settings.ASYNC_DB_POOL_TIMEOUT,
+        # The reads do not need a transaction (the vector search opens its own). The parameters are bound on the client
+        # like with Django's connection, so that the statements behave the same as in the synchronous mappers.
+        kwargs={'autocommit': True, 'cursor_factory': AsyncClientCursor},
+        configure=_configure,
+        open=False,
+    )
+    await pool.open()
+    return pool
+
+
+async def start_pool():
+    """Serve the requests that run on the current event loop from a connection pool. Called on the lifespan startup of
+    the ASGI application; the pool is opened by the first request, so that the server starts without the database."""
+
+    global _pool_loop, _pool_task
+    _pool_loop = asyncio.get_running_loop()
+    _pool_task = None
+
+
+async def close_pool():
+    """Close the connection pool. Called on the lifespan shutdown of the ASGI application."""
+
+    global _pool_loop, _pool_task
+    task, _pool_loop, _pool_task = _pool_task, None, None
+    if task is None:
+        return
+    try:
+        pool = await task
+    except Exception:
+        # The pool was never opened
+        return
+    await pool.close()
+
+
+async def get_pool():
+    """Return the connection pool of the ASGI server, or None if the request runs on another event loop. The pool is
+    opened once; concurrent first requests wait for the same pool."""
+
+    global _pool_task
+    if _pool_loop is None or _pool_loop is not asyncio.get_running_loop():
+        return None
+    if _pool_task is None:
+        _pool_task = _pool_loop.create_task(_open_pool())
+    task = _pool_task
+    try:
+        return await task
+    except Exception:
+        # Try to open the pool again with the next request (e.g. if the database was not reachable)
+        if _pool_task is task:
+            _pool_task = None
+        raise
+
+
+@asynccontextmanager
+async def connection():
+    """Yield an async connection for the statements of a request: a pooled one on the event loop of the ASGI server,
+    otherwise one that is opened for the request and closed afterwards."""
+
+    pool = await get_pool()
+    if pool is not None:
+        async with pool.connection() as pooled_connection:
+            yield pooled_connection
+        return
+
+    from psycopg import AsyncClientCursor, AsyncConnection
+
+    request_connection = await AsyncConnection.connect(
+        conninfo(), autocommit=True, cursor_factory=AsyncClientCursor
+    )
+    try:
+        await _configure(request_connection)
+        yield request_connection
+    finally:
+        await request_connection.close()
+
+
+async def _fetchall(db_connection, sql, params):
+    """Execute a statement on an async connection, record it for the SQL instrumentation and return all rows."""
+
+    start = time.perf_counter()
+    async with db_connection.cursor() as cursor:
+        await cursor.execute(sql, params)
+        rows = await cursor.fetchall() if cursor.description else []
+    record_statement(sql, params, len(rows), time.perf_counter() - start)
+    return rows
+
+
+@instrument_mapper
+class AsyncPaperMapper:
+    """This class is responsible for reading pages of the paper list asynchronously (see PaperMapper.get)."""
+
+    async def get(self, page=1, page_size=10, search="", start_date=None, end_date=None, categories=None,
+                  order="date", after=None, count="exact"):
+        """Fetch a page with papers and their authors. Takes the same arguments and returns the same (total count,
+        papers) tuple as PaperMapper.get."""
+
+        query = PaperListQuery(page, page_size, search, start_date, end_date, categories, order, after, count)
+        async with connection() as db_connection:
+            total_count = None
+            count_statement = query.count_statement()
+            if count_statement:
+                rows = await _fetchall(db_connection, *count_statement)
+                total_count = query.total_count(rows[0])
+                if total_count == 0:
+                    return 0, []
+
+            rows = await _fetchall(db_connection, *query.page_statement())
+
+        # Construct the Paper and Author objects from the rows
+        return total_count, PaperHydrator().hydrate(rows)
+
+
+@instrument_mapper
+class AsyncRelatedPaperMapper:
+    """This class is responsible for reading the related papers of a paper asynchronously (see RelatedPaperMapper)."""
+
+    async def get_related_ids(self, paper_id, limit=10, ef_search=None, probes=None, exact=False):
+        """Return the ids of the `limit` papers closest to the paper (see RelatedPaperMapper.get_related_ids)."""
+
+        async with connection() as db_connection:
+            # The search parameters are set for the transaction only
+            async with db_connection.transaction():
+                rows = await _fetchall(db_connection, PAPER_EMBEDDING_QUERY, [paper_id])
+                if not rows or rows[0][0] is None:
+                    return []
+
+                for statement in vector_search_statements(ef_search, probes, exact):
+                    await _fetchall(db_connection, *statement)
+
+                rows = await _fetchall(db_connection, RELATED_IDS_QUERY, [paper_id, rows[0][0], limit])
+                return [row[0] for row in rows]
+
+    async def get(self, paper_id, ef_search=None, probes=None):
+        """Fetch the related papers of a paper (see RelatedPaperMapper.get)."""
+
+        async with connection() as db_connection:
+            # Read the materialized neighbours of the paper together with their authors in one round trip
+            rows = await _fetchall(db_connection, NEIGHBOUR_PAPERS_QUERY, [paper_id, settings.RELATED_PAPERS_K])
+
+        # Only papers that were not processed by the similarity stage yet fall back to the live vector search
+        if not rows:
+            related_ids = await self.get_related_ids(
+                paper_id, limit=settings.RELATED_PAPERS_K, ef_search=ef_search, probes=probes
+            )
+            if not related_ids:
+                return []
+            async with connection() as db_connection:
+                rows = await _fetchall(db_connection, PAPERS_BY_IDS_QUERY, [related_ids])
+
+        # Construct the Paper and Author objects from the rows
+        return PaperHydrator().hydrate(rows)
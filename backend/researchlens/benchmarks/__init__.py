@@ -0,0 +1,7 @@
+"""
+This package contains the benchmark suite of ResearchLens. `corpus.py` grows a synthetic corpus (e.g. 10k, 100k or 1M
+papers) from the example data in `sql_exports`, `scenarios.py` defines the measured operations (paper list queries,
+related papers and the preprocessing stages) and `runner.py` runs them and writes the results as JSON, so that runs can
+be compared across commits. The suite is used through the `generate_corpus` and `run_benchmarks` management commands
+and runs against the configured (local) PostgreSQL database with pgvector.
+"""
@@ -0,0 +1,304 @@
+"""
+This module generates a synthetic corpus for the benchmarks. It starts from the example data in `sql_exports` (which
+is imported if the database is empty) and adds synthetic papers until the corpus has the requested size. The synthetic
+papers follow the seed data:
+
+- Every synthetic paper is derived from a seed paper (its cluster centre): the embedding is the centre's embedding plus
+  Gaussian noise, so the embeddings form clusters like real topics do, and the text is mixed from the centre's abstract
+  and another abstract of the same category, so search terms and embeddings stay related.
+- The categories follow the category mix of the seed papers.
+- The publication dates are skewed towards recent years, like the growth of arXiv.
+- The number of authors per paper follows a geometric distribution and the authors are drawn from a Zipf distribution
+  over a pool of names built from the seed authors, so a few authors have many papers and most have few.
+
+The generator is deterministic for a given random seed. The synthetic papers have the arXiv ids `synthetic.<n>`, so the
+corpus can be grown step by step (e.g. from 10k to 100k papers).
+"""
+
+import json
+import os
+import re
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from ..models import normalize_text
+from ..pgvector_types import to_matrix, EMBEDDING_DIMENSION
+
+# Named corpus sizes
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# Seed files in the order they have to be imported
+SEED_FILES = ('researchlens_author.sql', 'researchlens_paper.sql', 'researchlens_paper_authors.sql')
+DEFAULT_SEED_DIR = os.path.join(settings.BASE_DIR.parent, 'sql_exports')
+
+SYNTHETIC_PREFIX = 'synthetic.'
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_WORD = re.compile(r'[A-Za-z]{5,}')
+
+
+def parse_size(value):
+    """Parse a corpus size like '10k', '1m' or '25000'."""
+
+    value = str(value).lower()
+    if value in SIZES:
+        return SIZES[value]
+    return int(value)
+
+
+def import_seed(seed_dir=DEFAULT_SEED_DIR):
+    """Import the example data from `sql_exports` if the database has no papers yet. Returns True if it was imported."""
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM researchlens_paper)")
+        if cursor.fetchone()[0]:
+            return False
+
+        with transaction.atomic():
+            for file_name in SEED_FILES:
+                with open(os.path.join(seed_dir, file_name)) as seed_file:
+                    cursor.execute(seed_file.read())
+            # The dumps contain explicit ids, so the sequences have to be moved past them
+            for table in ('researchlens_author', 'researchlens_paper', 'researchlens_paper_authors'):
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT COALESCE(max(id), 1) FROM {table}))"
+                )
+            cursor.execute(
+                "UPDATE researchlens_paper SET needs_embedding = embedding IS NULL, "
+                "needs_keywords = keywords = '[]'::jsonb"
+            )
+
+            # The mappers read the text as it is stored, so it is normalized like the ingest does (see
+            # PaperMapper.bulk_ingest). The authors come first: updating the titles and abstracts afterwards also
+            # recomputes the search vectors (with the author names) of all papers.
+            cursor.execute("SELECT id, name FROM researchlens_author")
+            authors = [(author_id, normalize_text(name)) for author_id, name in cursor.fetchall()]
+            cursor.execute(
+                "UPDATE researchlens_author a SET name = v.name "
+                "FROM unnest(%s::bigint[], %s::text[]) AS v(id, name) WHERE a.id = v.id AND a.name <> v.name",
+                [[author_id for author_id, _ in authors], [name for _, name in authors]]
+            )
+            cursor.execute("SELECT id, title, abstract FROM researchlens_paper")
+            papers = [(paper_id, normalize_text(title), normalize_text(abstract))
+                      for paper_id, title, abstract in cursor.fetchall()]
+            cursor.execute(
+                "UPDATE researchlens_paper p SET title = v.title, abstract = v.abstract "
+                "FROM unnest(%s::bigint[], %s::text[], %s::text[]) AS v(id, title, abstract) WHERE p.id = v.id",
+                [[paper[0] for paper in papers], [paper[1] for paper in papers], [paper[2] for paper in papers]]
+            )
+    return True
+
+
+class Seed:
+    """This class is responsible for loading the seed papers (with embeddings) and author names the synthetic corpus
+    is derived from."""
+
+    def __init__(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT title, abstract, categories, published_date, embedding FROM researchlens_paper "
+                "WHERE embedding IS NOT NULL AND arxiv_id NOT LIKE %s ORDER BY id",
+                [SYNTHETIC_PREFIX + '%']
+            )
+            rows = cursor.fetchall()
+            cursor.execute("SELECT name FROM researchlens_author ORDER BY id")
+            author_names = [row[0] for row in cursor.fetchall()]
+
+        if not rows:
+            raise ValueError("There are no seed papers with embeddings, import the sql_exports first")
+
+        self.titles = [row[0] for row in rows]
+        self.abstracts = [' '.join(row[1].split()) for row in rows]
+        self.categories = [row[2] for row in rows]
+        self.dates = [row[3] for row in rows]
+        self.embeddings = to_matrix([row[4] for row in rows])
+        self.sentences = [_SENTENCE_END.split(abstract) for abstract in self.abstracts]
+
+        # Seed papers per category, to mix abstracts of the same category
+        self.by_category = {}
+        for index, category in enumerate(self.categories):
+            self.by_category.setdefault(category, []).append(index)
+
+        # First and last names of the seed authors, combined into a larger pool of synthetic names
+        parts = [name.split() for name in author_names if len(name.split()) >= 2]
+        self.first_names = sorted({part[0] for part in parts}) or ['Alex']
+        self.last_names = sorted({part[-1] for part in parts}) or ['Smith']
+
+    def __len__(self):
+        return len(self.titles)
+
+
+class CorpusGenerator:
+    """This class is responsible for generating synthetic papers from the seed and storing them with set-based
+    statements in batches."""
+
+    def __init__(self, seed, random_seed=42, noise=0.04, author_pool_size=None, batch_size=5000):
+        self.seed = seed
+        self.random_seed = random_seed
+        self.noise = noise
+        self.author_pool_size = author_pool_size
+        self.batch_size = batch_size
+        self.end_date = date.today()
+
+    def author_name(self, index):
+        """Return the name of the author with the given index in the synthetic author pool."""
+
+        first = self.seed.first_names[index % len(self.seed.first_names)]
+        rest = index // len(self.seed.first_names)
+        last = self.seed.last_names[rest % len(self.seed.last_names)]
+        generation = rest // len(self.seed.last_names)
+        return f"{first} {last}" + (f" {generation + 1}" if generation else "")
+
+    def generate(self, start, count, author_pool_size):
+        """Generate the synthetic papers with the numbers start..start+count-1. The result only depends on the random
+        seed and the numbers, so a corpus can be grown in steps. Returns a list of entry dicts with the embedding and
+        keywords of every paper."""
+
+        rng = np.random.default_rng([self.random_seed, start])
+        centres = rng.integers(0, len(self.seed), count)
+
+        # Embeddings: the centre plus noise, normalised like the sentence-transformer output
+        embeddings = self.seed.embeddings[centres] + rng.normal(0, self.noise, (count, EMBEDDING_DIMENSION))
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings.astype(np.float32)
+
+        # Publication dates skewed towards recent years, at most 30 years back
+        days_back = np.minimum(rng.exponential(365 * 5, count), 365 * 30).astype(int)
+        # Authors per paper (1 to 30) and their indexes in the author pool (Zipf distributed popularity)
+        author_counts = np.minimum(rng.geometric(0.35, count), 30)
+        author_indexes = (rng.zipf(1.5, int(author_counts.sum())) - 1) % author_pool_size
+
+        entries = []
+        offset = 0
+        for i, centre in enumerate(centres.tolist()):
+            category = self.seed.categories[centre]
+            other = self.seed.by_category[category][rng.integers(0, len(self.seed.by_category[category]))]
+            sentences = self.seed.sentences[centre]
+            other_sentences = self.seed.sentences[other]
+            abstract = ' '.join(sentences[:max(1, len(sentences) // 2)] + other_sentences[len(other_sentences) // 2:])
+            title_words = self.seed.titles[centre].split()
+            title = ' '.join(title_words[j] for j in rng.permutation(len(title_words)))
+            words = sorted(set(_WORD.findall(abstract.lower())))
+            keywords = [words[j] for j in rng.choice(len(words), min(5, len(words)), replace=False)] if words else []
+
+            names = list(dict.fromkeys(self.author_name(int(index))
+                                       for index in author_indexes[offset:offset + author_counts[i]]))
+            offset += author_counts[i]
+
+            number = start + i
+            entries.append({
+                'arxiv_id': f'{SYNTHETIC_PREFIX}{number:07d}',
+                'title': title,
+                'abstract': abstract,
+                'published_date': self.end_date - timedelta(days=int(days_back[i])),
+                'categories': category,
+                'link': f'http://arxiv.org/abs/{SYNTHETIC_PREFIX}{number:07d}',
+                'authors': names,
+                'keywords': keywords,
+                'embedding': embeddings[i],
+            })
+        return entries
+
+    def store(self, entries):
+        """Store generated papers, their authors and the paper-author links. The papers are stored with their
+        embeddings and keywords, so they are not picked up by the preprocessing stages."""
+
+        author_names = list(dict.fromkeys(name for entry in entries for name in entry['authors']))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO researchlens_author (name) SELECT * FROM unnest(%s::text[]) ON CONFLICT (name) DO NOTHING",
+                [author_names]
+            )
+            cursor.execute("SELECT name, id FROM researchlens_author WHERE name = ANY(%s)", [author_names])
+            author_ids = dict(cursor.fetchall())
+
+            cursor.execute(
+                "INSERT INTO researchlens_paper (arxiv_id, title, abstract, published_date, categories, link, keywords, "
+                "embedding, needs_embedding, needs_keywords) "
+                "SELECT v.arxiv_id, v.title, v.abstract, v.published_date, v.categories, v.link, v.keywords::jsonb, "
+                "v.embedding::vector, FALSE, FALSE "
+                "FROM unnest(%s::text[], %s::text[], %s::text[], %s::date[], %s::text[], %s::text[], %s::text[], "
+                "%s::text[]) AS v(arxiv_id, title, abstract, published_date, categories, link, keywords, embedding) "
+                "ON CONFLICT (arxiv_id) DO NOTHING "
+                "RETURNING arxiv_id, id",
+                [[entry['arxiv_id'] for entry in entries],
+                 [entry['title'] for entry in entries],
+                 [entry['abstract'] for entry in entries],
+                 [entry['published_date'] for entry in entries],
+                 [entry['categories'] for entry in entries],
+                 [entry['link'] for entry in entries],
+                 [json.dumps(entry['keywords']) for entry in entries],
+                 ['[' + ','.join(map(str, entry['embedding'].tolist())) + ']' for entry in entries]]
+            )
+            paper_ids = dict(cursor.fetchall())
+
+            link_paper_ids, link_author_ids = [], []
+            for entry in entries:
+                if entry['arxiv_id'] not in paper_ids:
+                    continue
+                for name in entry['authors']:
+                    link_paper_ids.append(paper_ids[entry['arxiv_id']])
+                    link_author_ids.append(author_ids[name])
+            cursor.execute(
+                "INSERT INTO researchlens_paper_authors (paper_id, author_id) "
+                "SELECT * FROM unnest(%s::bigint[], %s::bigint[]) ON CONFLICT (paper_id, author_id) DO NOTHING",
+                [link_paper_ids, link_author_ids]
+            )
+        return len(paper_ids)
+
+    def grow(self, size, progress=print):
+        """Add synthetic papers until the corpus has `size` papers. Returns the number of added papers."""
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM researchlens_paper")
+            total = cursor.fetchone()[0]
+            cursor.execute("SELECT count(*) FROM researchlens_paper WHERE arxiv_id LIKE %s", [SYNTHETIC_PREFIX + '%'])
+            synthetic = cursor.fetchone()[0]
+
+        missing = size - total
+        if missing <= 0:
+            return 0
+        # The pool grows with the corpus, so the number of papers per author stays realistic at every size
+        author_pool_size = self.author_pool_size or max(1000, size // 2)
+
+        added = 0
+        start_time = time.perf_counter()
+        for start in range(synthetic, synthetic + missing, self.batch_size):
+            count = min(self.batch_size, synthetic + missing - start)
+            added += self.store(self.generate(start, count, author_pool_size))
+            seconds = time.perf_counter() - start_time
+            progress(f"Added {added}/{missing} synthetic papers ({added / seconds:.0f} papers/s)")
+
+        with connection.cursor() as cursor:
+            # Fresh statistics, so that the planner sees the new table sizes
+            cursor.execute("ANALYZE researchlens_paper, researchlens_author, researchlens_paper_authors")
+        return added
+
+
+def corpus_stats():
+    """Return the size of the corpus, recorded with every benchmark run."""
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT (SELECT count(*) FROM researchlens_paper), "
+            "(SELECT count(*) FROM researchlens_paper WHERE embedding IS NOT NULL), "
+            "(SELECT count(*) FROM researchlens_author), "
+            "(SELECT count(*) FROM researchlens_paper_authors), "
+            "(SELECT count(*) FROM researchlens_paperneighbour), "
+            "(SELECT count(DISTINCT paper_id) FROM researchlens_paperneighbour), "
+            "pg_total_relation_size('researchlens_paper')"
+        )
+        row = cursor.fetchone()
+    return {
+        'papers': row[0],
+        'embedded_papers': row[1],
+        'authors': row[2],
+        'paper_authors': row[3],
+        'neighbour_rows': row[4],
+        'papers_with_neighbours': row[5],
+        'paper_table_mb': round(row[6] / (1024 * 1024), 1),
+    }
@@ -0,0 +1,119 @@
+"""
+This module runs a load test against a running server, to compare the synchronous (WSGI workers) and the asynchronous
+(ASGI workers) deployment of the API. `concurrency` clients send requests in a closed loop (the next request is sent
+when the previous one was answered) for `duration` seconds. The requests are a mix of paper list searches, paper list
+pages and related papers, with parameters drawn from the corpus in the database (see BenchmarkContext), so that both
+deployments receive the same requests. For every endpoint the throughput, the errors and the latency percentiles (p50,
+p95, p99) are reported. Run the server with RESPONSE_CACHE_TTL=0, so that the requests reach the database.
+"""
+
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+
+import requests
+
+from .corpus import corpus_stats
+from .runner import git_commit, percentile
+from .scenarios import BenchmarkContext
+
+ENDPOINTS = ('papers_search', 'papers_page', 'related_papers')
+
+# Number of requests drawn up front, the clients cycle through them
+REQUEST_POOL_SIZE = 2000
+
+
+def request_paths(ctx, count=REQUEST_POOL_SIZE):
+    """Draw `count` (endpoint, path) pairs from the corpus, cycling through the endpoints."""
+
+    paths = []
+    for i in range(count):
+        endpoint = ENDPOINTS[i % len(ENDPOINTS)]
+        if endpoint == 'papers_search':
+            path = f"/api/paper/?{urlencode({'search': ctx.search_term()})}"
+        elif endpoint == 'papers_page':
+            path = f"/api/paper/?{urlencode({'page': ctx.random.randint(1, 100), 'categories': ctx.category()})}"
+        else:
+            path = f"/api/related/{ctx.paper_id()}/"
+        paths.append((endpoint, path))
+    return paths
+
+
+def summarize(latencies, errors, seconds):
+    """Summarize the latencies (in milliseconds) and errors of one endpoint."""
+
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / seconds, 1),
+    }
+    if latencies:
+        summary.update({
+            'p50_ms': round(percentile(latencies, 0.50), 1),
+            'p95_ms': round(percentile(latencies, 0.95), 1),
+            'p99_ms': round(percentile(latencies, 0.99), 1),
+            'mean_ms': round(statistics.fmean(latencies), 1),
+            'max_ms': round(max(latencies), 1),
+        })
+    return summary
+
+
+def run_load_test(base_url, concurrency=50, duration=30, timeout=60, random_seed=42, label='', progress=print):
+    """Run the load test and return the result document (in the format of run_benchmarks, so that two runs can be
+    compared with runner.compare)."""
+
+    base_url = base_url.rstrip('/')
+    paths = request_paths(BenchmarkContext(random_seed=random_seed))
+    lock = threading.Lock()
+    latencies = {endpoint: [] for endpoint in ENDPOINTS}
+    errors = {endpoint: 0 for endpoint in ENDPOINTS}
+
+    def client(index, stop_at):
+        session = requests.Session()
+        local_latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        local_errors = {endpoint: 0 for endpoint in ENDPOINTS}
+        position = index
+        while time.perf_counter() < stop_at:
+            endpoint, path = paths[position % len(paths)]
+            position += concurrency
+            start = time.perf_counter()
+            try:
+                ok = session.get(base_url + path, timeout=timeout).status_code == 200
+            except requests.RequestException:
+                ok = False
+            if ok:
+                local_latencies[endpoint].append((time.perf_counter() - start) * 1000)
+            else:
+                local_errors[endpoint] += 1
+
+        with lock:
+            for endpoint in ENDPOINTS:
+                latencies[endpoint] += local_latencies[endpoint]
+                errors[endpoint] += local_errors[endpoint]
+
+    progress(f"Running {concurrency} clients against {base_url} for {duration} s")
+    start = time.perf_counter()
+    stop_at = start + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(client, index, stop_at) for index in range(concurrency)]:
+            future.result()
+    seconds = time.perf_counter() - start
+
+    results = {endpoint: summarize(latencies[endpoint], errors[endpoint], seconds) for endpoint in ENDPOINTS}
+    results['all'] = summarize(
+        [latency for endpoint in ENDPOINTS for latency in latencies[endpoint]], sum(errors.values()), seconds
+    )
+    return {
+        'label': label,
+        'url': base_url,
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'concurrency': concurrency,
+        'duration_seconds': round(seconds, 1),
+        'random_seed': random_seed,
+        'corpus': corpus_stats(),
+        'scenarios': results,
+    }
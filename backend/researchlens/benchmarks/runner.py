@@ -0,0 +1,156 @@
+"""
+This module runs the benchmark scenarios and compares results. Every scenario is run a few times without measuring
+(warm-up, so that the caches of PostgreSQL and the models are filled) and then `repeat` times. For every scenario the
+wall time (min, median, p95, mean and max in milliseconds) and the SQL statements and database time per run are recorded.
+The result is written as JSON together with the git commit, the corpus size and the settings that influence the
+measured code, so that runs of different commits can be compared with `compare`.
+"""
+
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+from django.conf import settings
+
+from ..sql_instrumentation import track_queries
+from .corpus import corpus_stats
+from .scenarios import SCENARIOS, BenchmarkContext
+
+# Settings that change the measured code paths, recorded with every run
+RECORDED_SETTINGS = (
+    'VECTOR_SEARCH_EF_SEARCH', 'VECTOR_SEARCH_PROBES', 'RELATED_PAPERS_K', 'SIMILARITY_THRESHOLD',
+    'SIMILARITY_BLOCK_SIZE', 'EMBEDDING_BACKEND', 'EMBEDDING_BATCH_SIZE', 'EMBEDDING_PROCESSES',
+    'KEYWORD_EMBEDDING_CACHE_SIZE', 'AUTHOR_CACHE_SIZE',
+)
+
+
+def git_commit():
+    """Return the current git commit of the code, or None outside of a git checkout."""
+
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(values, fraction):
+    """Return the percentile of the values (nearest rank)."""
+
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_scenario(function, ctx, repeat, warmup):
+    """Run one scenario and return its timings in milliseconds and its statements per run."""
+
+    for _ in range(warmup):
+        function(ctx)
+
+    timings, statements, database_ms = [], 0, 0.0
+    for _ in range(repeat):
+        # Slow statements are not logged (or explained) while measuring
+        with track_queries(function.__name__, slow_query_ms=0) as stats:
+            start = time.perf_counter()
+            function(ctx)
+            timings.append((time.perf_counter() - start) * 1000)
+        statements += stats.statements
+        database_ms += stats.seconds * 1000
+
+    return {
+        'runs': repeat,
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'statements_per_run': round(statements / repeat, 1),
+        'database_ms_per_run': round(database_ms / repeat, 3),
+    }
+
+
+def related_path(corpus):
+    """Return the path the related_papers scenario measures: 'materialized' if every embedded paper has its neighbour
+    list, 'live' if no paper has one (RelatedPaperMapper.get falls back to the vector search) and 'mixed' otherwise."""
+
+    if corpus['papers_with_neighbours'] == 0:
+        return 'live'
+    if corpus['papers_with_neighbours'] >= corpus['embedded_papers']:
+        return 'materialized'
+    return 'mixed'
+
+
+def run_benchmarks(names=None, repeat=20, warmup=3, with_models=False, random_seed=42, progress=print):
+    """Run the given scenarios (default: all that do not need the models, or all with `with_models`) and return the
+    result document."""
+
+    names = names or [name for name, (_, needs_models) in SCENARIOS.items() if with_models or not needs_models]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(unknown)}")
+
+    corpus = corpus_stats()
+    ctx = BenchmarkContext(random_seed=random_seed)
+    results = {}
+    for name in names:
+        function, needs_models = SCENARIOS[name]
+        if needs_models and not with_models:
+            progress(f"Skipping {name} (needs the models, use --with-models)")
+            continue
+        results[name] = run_scenario(function, ctx, repeat, warmup)
+        if name == 'related_papers':
+            # Without the neighbour table the scenario measures the live vector search, so the path is recorded
+            results[name]['path'] = related_path(corpus)
+            if results[name]['path'] != 'materialized':
+                progress(f"Warning: {corpus['papers_with_neighbours']} of {corpus['embedded_papers']} embedded papers "
+                         "have neighbours, related_papers partly measures the live vector search. Run "
+                         "`python manage.py rebuild_neighbours` first.")
+        progress(f"{name}: median {results[name]['median_ms']} ms, p95 {results[name]['p95_ms']} ms, "
+                 f"{results[name]['statements_per_run']} statements")
+
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'repeat': repeat,
+        'warmup': warmup,
+        'random_seed': random_seed,
+        'corpus': corpus,
+        'settings': {name: getattr(settings, name, None) for name in RECORDED_SETTINGS},
+        'scenarios': results,
+    }
+
+
+def compare(baseline, current, metric='median_ms'):
+    """Compare two result documents. Returns one row per scenario that is part of both, with the change of the metric
+    in percent (negative values are improvements). Scenarios that measured different paths (see related_path) are
+    marked with both paths."""
+
+    rows = []
+    for name, result in current['scenarios'].items():
+        if name not in baseline['scenarios']:
+            continue
+        before = baseline['scenarios'][name][metric]
+        after = result[metric]
+        change = (after - before) / before * 100 if before else 0.0
+        row = {'scenario': name, 'before': before, 'after': after, 'change_percent': round(change, 1)}
+        paths = (baseline['scenarios'][name].get('path'), result.get('path'))
+        if paths[0] != paths[1]:
+            row['paths'] = paths
+        rows.append(row)
+    return rows
+
+
+def load(path):
+    with open(path) as result_file:
+        return json.load(result_file)
+
+
+def save(document, path):
+    with open(path, 'w') as result_file:
+        json.dump(document, result_file, indent=2, default=str)
@@ -0,0 +1,234 @@
+"""
+This module defines the benchmark scenarios. A scenario is a function that performs one measured operation with
+parameters drawn from the benchmark context (random papers, search terms, dates and categories of the corpus):
+
+- Paper list: first page, full-text search (by date and by relevance), date and category filters, a deep page with
+  OFFSET and with the keyset cursor, and the estimated count.
+- Related papers: the served (materialized) neighbours, the approximate vector search and the exact search.
+- Preprocessing stages: parsing an Atom feed, storing a page, embedding, keyword extraction and the similarity graph.
+  The stages that write run in a transaction that is rolled back, so the corpus does not change between runs. The
+  embedding and keyword stages need the models and only run with `--with-models`.
+"""
+
+import random
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+
+from django.db import connection, transaction
+
+from ..object_relational_mapper import PaperMapper, RelatedPaperMapper
+from ..pipeline import ATOM, iter_entries
+from .corpus import Seed, CorpusGenerator
+
+# Papers per page of the paper list, and papers per batch of the preprocessing stages
+PAGE_SIZE = 10
+STAGE_BATCH_SIZE = 100
+# Numbers of the synthetic stage papers, far above the numbers used by the corpus generator
+STAGE_FIRST_NUMBER = 90_000_000
+
+
+class BenchmarkContext:
+    """This class is responsible for drawing the parameters of the scenarios from the corpus. All draws use one random
+    generator with a fixed seed, so two runs on the same corpus measure the same queries."""
+
+    def __init__(self, random_seed=42, samples=100):
+        self.random_seed = random_seed
+        self.random = random.Random(random_seed)
+        self.paper_ids = RelatedPaperMapper().get_sample_ids(samples)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT min(published_date), max(published_date) FROM researchlens_paper")
+            self.first_date, self.last_date = cursor.fetchone()
+            cursor.execute("SELECT DISTINCT categories FROM researchlens_paper")
+            self.categories = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                "SELECT abstract FROM researchlens_paper WHERE id = ANY(%s)", [self.paper_ids]
+            )
+            abstracts = [row[0] for row in cursor.fetchall()]
+
+            # A deep page (page 1000, or the last page of a small corpus) and the keyset of the paper before it
+            cursor.execute("SELECT count(*) FROM researchlens_paper")
+            total = cursor.fetchone()[0]
+            self.deep_page = max(2, min(1000, total // PAGE_SIZE))
+            cursor.execute(
+                "SELECT published_date, id FROM researchlens_paper ORDER BY published_date DESC, id DESC "
+                "OFFSET %s LIMIT 1",
+                [(self.deep_page - 1) * PAGE_SIZE - 1]
+            )
+            self.deep_keyset = cursor.fetchone()
+
+        # Search terms: longer words of the sampled abstracts
+        words = {word.strip('.,;:()').lower() for abstract in abstracts for word in abstract.split()}
+        self.search_terms = sorted(word for word in words if len(word) >= 7 and word.isalpha()) or ['model']
+        self._stage_entries = None
+        self._stage_feed = None
+
+    def paper_id(self):
+        return self.random.choice(self.paper_ids)
+
+    def search_term(self):
+        return self.random.choice(self.search_terms)
+
+    def category(self):
+        return self.random.choice(self.categories)
+
+    def date_range(self, days=90):
+        span = max(0, (self.last_date - self.first_date).days - days)
+        start = self.first_date + timedelta(days=self.random.randint(0, span))
+        return start, start + timedelta(days=days)
+
+    def stage_entries(self):
+        """Return a batch of synthetic entries (with arXiv ids that are not in the corpus) for the preprocessing stages.
+        The batch is generated once, so that the runs do not measure the generator. The stages that store the batch roll
+        back their transaction, so the same batch can be stored again by the next run."""
+
+        if self._stage_entries is None:
+            generator = CorpusGenerator(Seed(), random_seed=self.random_seed)
+            self._stage_entries = generator.generate(STAGE_FIRST_NUMBER, STAGE_BATCH_SIZE, author_pool_size=10_000)
+        return self._stage_entries
+
+    def stage_feed(self):
+        """Return the stage batch serialized as an Atom feed."""
+
+        if self._stage_feed is None:
+            self._stage_feed = atom_feed(self.stage_entries())
+        return self._stage_feed
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is rolled back at the end."""
+
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def atom_feed(entries):
+    """Serialize entries into an Atom feed like the one returned by the arXiv API."""
+
+    feed = ET.Element(f'{ATOM}feed')
+    for entry in entries:
+        element = ET.SubElement(feed, f'{ATOM}entry')
+        ET.SubElement(element, f'{ATOM}id').text = entry['link']
+        ET.SubElement(element, f'{ATOM}published').text = f"{entry['published_date'].isoformat()}T00:00:00Z"
+        ET.SubElement(element, f'{ATOM}title').text = entry['title']
+        ET.SubElement(element, f'{ATOM}summary').text = entry['abstract']
+        for name in entry['authors']:
+            ET.SubElement(ET.SubElement(element, f'{ATOM}author'), f'{ATOM}name').text = name
+    return ET.tostring(feed, encoding='utf-8')
+
+
+# Paper list
+
+def papers_first_page(ctx):
+    PaperMapper().get(page=1, page_size=PAGE_SIZE)
+
+
+def papers_search(ctx):
+    PaperMapper().get(page=1, page_size=PAGE_SIZE, search=ctx.search_term())
+
+
+def papers_search_relevance(ctx):
+    PaperMapper().get(page=1, page_size=PAGE_SIZE, search=ctx.search_term(), order="relevance")
+
+
+def papers_date_range(ctx):
+    start_date, end_date = ctx.date_range()
+    PaperMapper().get(page=1, page_size=PAGE_SIZE, start_date=start_date, end_date=end_date)
+
+
+def papers_category(ctx):
+    PaperMapper().get(page=1, page_size=PAGE_SIZE, categories=ctx.category())
+
+
+def papers_deep_page_offset(ctx):
+    PaperMapper().get(page=ctx.deep_page, page_size=PAGE_SIZE)
+
+
+def papers_deep_page_cursor(ctx):
+    PaperMapper().get(page_size=PAGE_SIZE, after=ctx.deep_keyset, count="none")
+
+
+def papers_count_estimated(ctx):
+    PaperMapper().get(page=1, page_size=PAGE_SIZE, search=ctx.search_term(), count="estimated")
+
+
+# Related papers
+
+def related_papers(ctx):
+    RelatedPaperMapper().get(ctx.paper_id())
+
+
+def related_ann_search(ctx):
+    RelatedPaperMapper().get_related_ids(ctx.paper_id())
+
+
+def related_exact_search(ctx):
+    RelatedPaperMapper().get_related_ids(ctx.paper_id(), exact=True)
+
+
+# Preprocessing stages
+
+def stage_parse(ctx):
+    for _ in iter_entries(BytesIO(ctx.stage_feed()), 'Computer Science'):
+        pass
+
+
+def stage_store(ctx):
+    with rolled_back():
+        PaperMapper().bulk_ingest(ctx.stage_entries())
+
+
+def _store_pending(ctx):
+    """Store the stage batch (inside a rolled back transaction) and return it as papers."""
+
+    papers, _ = PaperMapper().bulk_ingest(ctx.stage_entries())
+    return papers
+
+
+def stage_embedding(ctx):
+    from ..embedding import EmbeddingStage
+
+    with rolled_back():
+        EmbeddingStage().run(_store_pending(ctx))
+
+
+def stage_keywords(ctx):
+    from ..keywords import KeywordStage
+
+    with rolled_back():
+        KeywordStage().run(_store_pending(ctx))
+
+
+def stage_similarity(ctx):
+    from ..similarity import SimilarityGraphBuilder
+
+    entries = ctx.stage_entries()
+    with rolled_back():
+        papers, _ = PaperMapper().bulk_ingest(entries)
+        embeddings = [entry['embedding'] for entry in entries]
+        PaperMapper().bulk_update_embeddings([paper.id for paper in papers], embeddings)
+        SimilarityGraphBuilder().build([paper.id for paper in papers], embeddings)
+
+
+# Name -> (function, needs the models)
+SCENARIOS = {
+    'papers_first_page': (papers_first_page, False),
+    'papers_search': (papers_search, False),
+    'papers_search_relevance': (papers_search_relevance, False),
+    'papers_date_range': (papers_date_range, False),
+    'papers_category': (papers_category, False),
+    'papers_deep_page_offset': (papers_deep_page_offset, False),
+    'papers_deep_page_cursor': (papers_deep_page_cursor, False),
+    'papers_count_estimated': (papers_count_estimated, False),
+    'related_papers': (related_papers, False),
+    'related_ann_search': (related_ann_search, False),
+    'related_exact_search': (related_exact_search, False),
+    'stage_parse': (stage_parse, False),
+    'stage_store': (stage_store, False),
+    'stage_embedding': (stage_embedding, True),
+    'stage_keywords': (stage_keywords, True),
+    'stage_similarity': (stage_similarity, False),
+}
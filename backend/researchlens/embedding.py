@@ -0,0 +1,74 @@
+"""
+This module contains the embedding stage of the ResearchLens preprocessing pipeline. Instead of encoding one abstract at
+a time and writing it back with a separate UPDATE, the stage encodes the pending abstracts in configurable batches
+(optionally spread over several CPU processes) and writes all vectors back to the database with a single statement.
+"""
+
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .model_registry import registry
+from .object_relational_mapper import PaperMapper
+
+
+class EmbeddingStage:
+    """This class is responsible for computing the document embeddings of papers and storing them in the database.
+    The batch size and the number of encoder processes default to the EMBEDDING_BATCH_SIZE and EMBEDDING_PROCESSES
+    settings. More than one encoder process needs a process that may start children, i.e. not a prefork child (see
+    ModelRegistry.get_encode_pool); in a prefork worker the pool itself spreads the work over the cores."""
+
+    def __init__(self, encoder=None, batch_size=None, processes=None, paper_mapper=None):
+        self.encoder = encoder if encoder is not None else registry.get_encoder()
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        processes = processes if processes is not None else settings.EMBEDDING_PROCESSES
+        # 0 means "use all CPU cores"
+        self.processes = processes if processes > 0 else (os.cpu_count() or 1)
+        if self.processes > 1 and multiprocessing.current_process().daemon:
+            raise ImproperlyConfigured(
+                f"EMBEDDING_PROCESSES={processes} cannot be used in a prefork worker process, whose children are "
+                "daemonic and cannot start the encoder processes. Use EMBEDDING_PROCESSES=1 with CELERY_CONCURRENCY and "
+                "TORCH_THREADS_PER_PROCESS, or run the worker with CELERY_POOL=solo or threads."
+            )
+        self.paper_mapper = paper_mapper if paper_mapper is not None else PaperMapper()
+
+    def encode(self, texts):
+        """Encode the given texts and return a float32 matrix with one row per text."""
+
+        if not texts:
+            return np.empty((0, self.encoder.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        if self.processes > 1 and len(texts) > self.batch_size:
+            # Spread the batches over several processes. Small inputs are encoded in-process, because starting
+            # the work on the pool costs more than it saves.
+            pool = registry.get_encode_pool(self.processes)
+            embeddings = self.encoder.encode_multi_process(texts, pool, batch_size=self.batch_size)
+        else:
+            embeddings = self.encoder.encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
+
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def run(self, papers):
+        """Compute and store the embeddings of the given papers. The embedding of every paper object is set as well,
+        so that later stages can reuse it. Returns a dict with the number of documents and the throughput."""
+
+        start = time.perf_counter()
+        embeddings = self.encode([paper.abstract for paper in papers])
+        for paper, embedding in zip(papers, embeddings):
+            paper.embedding = embedding
+
+        # Write all vectors back in one statement
+        self.paper_mapper.bulk_update_embeddings([paper.id for paper in papers], embeddings)
+        seconds = time.perf_counter() - start
+
+        stats = {
+            'documents': len(papers),
+            'seconds': round(seconds, 3),
+            'docs_per_second': round(len(papers) / seconds, 1) if seconds > 0 else 0.0,
+        }
+        print(f"Embedding stage: {stats}")
+        return stats
@@ -0,0 +1,84 @@
+"""
+This module provides the selectable encoder backends for the document embeddings. Besides the stock PyTorch
+sentence-transformer, the model can be dynamically quantized to int8 with PyTorch or exported to ONNX (optionally
+quantized to int8 as well) and run with ONNX Runtime, which is considerably faster on CPU-only worker nodes. All
+backends return a SentenceTransformer object, so the rest of the pipeline (including KeyBERT) does not need to know
+which backend is in use. The module also contains a parity check that compares a backend against the PyTorch vectors.
+"""
+
+import os
+import time
+
+import numpy as np
+
+# Supported values of the EMBEDDING_BACKEND setting
+ENCODER_BACKENDS = ('torch', 'torch-int8', 'onnx', 'onnx-int8')
+
+
+def load_encoder(model_name, backend='torch', export_dir=None, quantization_config='avx2'):
+    """Load the sentence-transformer with the given backend. The ONNX backends need the optional
+    `optimum[onnxruntime]` package. Exported ONNX models are stored in `export_dir`, so that the export only happens
+    once per machine."""
+
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}', expected one of {', '.join(ENCODER_BACKENDS)}")
+
+    if backend == 'torch':
+        return SentenceTransformer(model_name, device='cpu')
+
+    if backend == 'torch-int8':
+        import torch
+
+        # Dynamic quantization stores the weights of all linear layers as int8 and quantizes activations on the fly
+        model = SentenceTransformer(model_name, device='cpu')
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+
+    try:
+        import optimum.onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise ImportError(f"The '{backend}' encoder backend requires `pip install optimum[onnxruntime]`") from e
+
+    export_path = os.path.join(export_dir or '.', model_name.replace('/', '__'))
+    onnx_file = 'model.onnx'
+    if backend == 'onnx-int8':
+        onnx_file = f'model_qint8_{quantization_config}.onnx'
+
+    if not os.path.exists(os.path.join(export_path, 'onnx', onnx_file)):
+        # Export the model to ONNX (and quantize it) once and keep the result on disk
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        model = SentenceTransformer(model_name, device='cpu', backend='onnx')
+        model.save_pretrained(export_path)
+        if backend == 'onnx-int8':
+            export_dynamic_quantized_onnx_model(model, quantization_config, export_path)
+
+    return SentenceTransformer(export_path, device='cpu', backend='onnx', model_kwargs={'file_name': f'onnx/{onnx_file}'})
+
+
+def parity_check(encoder, reference, texts, batch_size=64):
+    """Encode the texts with the given encoder and the reference encoder (usually the PyTorch model) and report how
+    far the vectors drift apart (1 - cosine similarity) and how many documents per CPU-second each encoder manages."""
+
+    def timed_encode(model):
+        start = time.process_time()
+        embeddings = np.asarray(model.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+        return embeddings, time.process_time() - start
+
+    candidate_vectors, candidate_seconds = timed_encode(encoder)
+    reference_vectors, reference_seconds = timed_encode(reference)
+
+    # Cosine similarity of each pair of vectors
+    candidate_vectors /= np.linalg.norm(candidate_vectors, axis=1, keepdims=True)
+    reference_vectors /= np.linalg.norm(reference_vectors, axis=1, keepdims=True)
+    drift = 1.0 - np.sum(candidate_vectors * reference_vectors, axis=1)
+
+    return {
+        'documents': len(texts),
+        'mean_cosine_drift': float(drift.mean()),
+        'max_cosine_drift': float(drift.max()),
+        'docs_per_cpu_second': round(len(texts) / candidate_seconds, 1) if candidate_seconds > 0 else 0.0,
+        'reference_docs_per_cpu_second': round(len(texts) / reference_seconds, 1) if reference_seconds > 0 else 0.0,
+    }
@@ -0,0 +1,115 @@
+"""
+This module provides an optional on-disk cache of arXiv API responses. Every response is stored under the SHA-256 hash of
+its query URL, so a page that was fetched once is read from disk when a crawl is repeated. The cache has three modes
+(ARXIV_CACHE_MODE setting):
+
+- 'off': every page is requested from arXiv (default).
+- 'record': pages are served from the cache if present; all other pages are requested and written to the cache.
+- 'replay': pages are only served from the cache, the network is never used. Pages that were not recorded fail like
+  an unreachable API. This turns the cache into a local stand-in for arXiv, so that re-ingests and benchmarks run at
+  disk speed and with reproducible input.
+
+Responses are written while they are streamed to the parser, and a file only becomes visible once the complete body
+was read, so an interrupted download never ends up in the cache. Note that the arXiv feed changes over time, so the
+cache returns the pages as they were when they were recorded.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+
+CACHE_MODES = ('off', 'record', 'replay')
+
+
+class RecordingStream:
+    """This class is responsible for copying a response stream to the cache while it is read. The copy is moved into
+    place when the stream is closed after it was read to the end, and discarded otherwise."""
+
+    def __init__(self, stream, path):
+        self.stream = stream
+        self.path = path
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        handle, self._temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self._file = os.fdopen(handle, 'wb')
+        self._complete = False
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if data:
+            self._file.write(data)
+        else:
+            self._complete = True
+        return data
+
+    def close(self):
+        self.stream.close()
+        if self._file.closed:
+            return
+        self._file.close()
+        if self._complete:
+            os.replace(self._temp_path, self.path)
+        else:
+            os.remove(self._temp_path)
+
+
+class FeedCache:
+    """This class is responsible for storing and serving arXiv API responses by the hash of their query URL (see the
+    module docstring for the modes)."""
+
+    def __init__(self, directory, mode='off'):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown arXiv cache mode '{mode}', expected one of {', '.join(CACHE_MODES)}")
+        self.directory = str(directory)
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    @property
+    def offline(self):
+        """Whether the network must not be used."""
+
+        return self.mode == 'replay'
+
+    def path(self, url):
+        """Return the path of the cached response of the URL. The files are spread over subdirectories by the first two
+        characters of the hash, so no directory gets too large."""
+
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], f'{digest}.xml')
+
+    def contains(self, url):
+        return self.enabled and os.path.exists(self.path(url))
+
+    def open(self, url):
+        """Return a file object with the cached response of the URL, or None if it is not cached."""
+
+        if not self.enabled:
+            return None
+        try:
+            stream = open(self.path(url), 'rb')
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return stream
+
+    def record(self, url, stream):
+        """Wrap a response stream, so that the response is stored in the cache while it is read (record mode only)."""
+
+        if self.mode != 'record':
+            return stream
+        return RecordingStream(stream, self.path(url))
+
+    def stats(self):
+        return {'mode': self.mode, 'hits': self.hits, 'misses': self.misses}
+
+
+# One cache per process, configured by the ARXIV_CACHE_DIR and ARXIV_CACHE_MODE settings
+feed_cache = FeedCache(settings.ARXIV_CACHE_DIR, settings.ARXIV_CACHE_MODE)
@@ -0,0 +1,184 @@
+"""
+This module tracks the progress of preprocessing jobs. A job is identified by the id of its `run_data_preprocess` task
+and its work is spread over sub-tasks in several worker processes, so the progress is kept in the shared Redis cache:
+counters of the work done (pages fetched, papers inserted, embeddings and keywords computed, similarity pairs written)
+and the wall time and number of items of every stage, measured with lightweight timers around the stages. Besides the
+per-job values (which expire after JOB_PROGRESS_TTL seconds), the same values are added to process-independent totals,
+which are exported in the Prometheus text format by the metrics endpoint.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Stages of the preprocessing pipeline, in order
+STAGES = ('fetch', 'store', 'embedding', 'keywords', 'similarity')
+
+# Counters of the work done by a job
+COUNTERS = (
+    'pages_total', 'pages_fetched', 'pages_failed', 'papers_stored', 'papers_inserted', 'entries_failed',
+    'embeddings_done', 'keywords_done', 'similarity_pairs', 'neighbours_updated',
+)
+
+METRICS_PREFIX = 'researchlens:metrics'
+
+
+class StageTimer:
+    """This class is responsible for measuring the wall time of one run of a stage. Set `items` to the number of items
+    the stage processed; the time and the items are recorded when the block is left."""
+
+    def __init__(self, progress, stage, items=0):
+        self.progress = progress
+        self.stage = stage
+        self.items = items
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.progress.record_stage(self.stage, time.perf_counter() - self._start, self.items)
+        return False
+
+
+class JobProgress:
+    """This class is responsible for recording and reading the progress of one preprocessing job. Without a job id,
+    only the totals are updated. Errors of the cache are logged and ignored, so that an unavailable cache does not stop
+    the preprocessing."""
+
+    def __init__(self, job_id=None):
+        self.job_id = job_id
+
+    def _key(self, name):
+        return f'researchlens:job:{self.job_id}:{name}'
+
+    def _increment(self, name, delta):
+        keys = [(f'{METRICS_PREFIX}:{name}', None)]
+        if self.job_id:
+            keys.append((self._key(name), settings.JOB_PROGRESS_TTL))
+        for key, timeout in keys:
+            cache.add(key, 0, timeout=timeout)
+            cache.incr(key, delta)
+
+    def start(self, **counters):
+        """Mark the job as started and set initial counters (e.g. the number of pages)."""
+
+        try:
+            values = {self._key('state'): 'started', self._key('started_at'): time.time()}
+            values.update({self._key(name): value for name, value in counters.items()})
+            cache.set_many(values, timeout=settings.JOB_PROGRESS_TTL)
+        except Exception as e:
+            print(f"Could not record the job progress: {e}")
+
+    def set_state(self, state, error=None):
+        """Set the state of the job, e.g. 'ingesting', 'enriching', 'similarity', 'done' or 'failed'. A failed job can
+        record the error that stopped it."""
+
+        try:
+            values = {self._key('state'): state}
+            if error is not None:
+                values[self._key('error')] = error
+            if state in ('done', 'failed'):
+                values[self._key('finished_at')] = time.time()
+            cache.set_many(values, timeout=settings.JOB_PROGRESS_TTL)
+        except Exception as e:
+            print(f"Could not record the job progress: {e}")
+
+    def incr(self, counter, delta=1):
+        """Add `delta` to one of the COUNTERS of the job."""
+
+        if not delta:
+            return
+        try:
+            self._increment(counter, int(delta))
+        except Exception as e:
+            print(f"Could not record the job progress: {e}")
+
+    def record_stage(self, stage, seconds, items=0):
+        """Add the wall time (stored in milliseconds) and the number of items of one run of a stage."""
+
+        try:
+            self._increment(f'stage:{stage}:ms', int(seconds * 1000))
+            self._increment(f'stage:{stage}:runs', 1)
+            if items:
+                self._increment(f'stage:{stage}:items', int(items))
+        except Exception as e:
+            print(f"Could not record the job progress: {e}")
+
+    def timer(self, stage, items=0):
+        """Return a StageTimer for a run of the stage, to be used in a with statement."""
+
+        return StageTimer(self, stage, items)
+
+    def snapshot(self):
+        """Return the progress of the job, or None if the job is unknown (or expired)."""
+
+        names = ['state', 'error', 'started_at', 'finished_at', *COUNTERS]
+        for stage in STAGES:
+            names += [f'stage:{stage}:ms', f'stage:{stage}:runs', f'stage:{stage}:items']
+        values = cache.get_many([self._key(name) for name in names])
+        if self._key('state') not in values:
+            return None
+        value = lambda name: values.get(self._key(name), 0)
+
+        started_at = values.get(self._key('started_at'))
+        finished_at = values.get(self._key('finished_at'))
+        end = finished_at or time.time()
+        return {
+            'task_id': self.job_id,
+            'state': values[self._key('state')],
+            'error': values.get(self._key('error')),
+            'elapsed_seconds': round(end - started_at, 3) if started_at else None,
+            **{name: value(name) for name in COUNTERS},
+            'stages': {stage: stage_summary(value(f'stage:{stage}:ms'), value(f'stage:{stage}:runs'),
+                                            value(f'stage:{stage}:items')) for stage in STAGES},
+        }
+
+
+def stage_summary(milliseconds, runs, items):
+    """Summarize the recorded values of a stage with its throughput."""
+
+    seconds = milliseconds / 1000
+    return {
+        'seconds': round(seconds, 3),
+        'runs': runs,
+        'items': items,
+        'items_per_second': round(items / seconds, 1) if seconds > 0 else 0.0,
+    }
+
+
+def prometheus_metrics():
+    """Return the totals of all preprocessing jobs in the Prometheus text exposition format."""
+
+    names = [f'{METRICS_PREFIX}:{name}' for name in COUNTERS]
+    for stage in STAGES:
+        names += [f'{METRICS_PREFIX}:stage:{stage}:ms', f'{METRICS_PREFIX}:stage:{stage}:runs',
+                  f'{METRICS_PREFIX}:stage:{stage}:items']
+    values = cache.get_many(names)
+    value = lambda name: values.get(f'{METRICS_PREFIX}:{name}', 0)
+
+    lines = [
+        '# HELP researchlens_preprocess_total Work done by the preprocessing jobs.',
+        '# TYPE researchlens_preprocess_total counter',
+    ]
+    lines += [f'researchlens_preprocess_total{{counter="{name}"}} {value(name)}'
+              for name in COUNTERS if name != 'pages_total']
+    lines += [
+        '# HELP researchlens_stage_seconds_total Wall time spent in each preprocessing stage.',
+        '# TYPE researchlens_stage_seconds_total counter',
+    ]
+    lines += [f'researchlens_stage_seconds_total{{stage="{stage}"}} {value(f"stage:{stage}:ms") / 1000}'
+              for stage in STAGES]
+    lines += [
+        '# HELP researchlens_stage_runs_total Number of runs of each preprocessing stage.',
+        '# TYPE researchlens_stage_runs_total counter',
+    ]
+    lines += [f'researchlens_stage_runs_total{{stage="{stage}"}} {value(f"stage:{stage}:runs")}' for stage in STAGES]
+    lines += [
+        '# HELP researchlens_stage_items_total Items processed by each preprocessing stage.',
+        '# TYPE researchlens_stage_items_total counter',
+    ]
+    lines += [f'researchlens_stage_items_total{{stage="{stage}"}} {value(f"stage:{stage}:items")}' for stage in STAGES]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,117 @@
+"""
+This module contains the keyword extraction stage of the ResearchLens preprocessing pipeline. KeyBERT embeds every
+document and every candidate word to rank the candidates. Since the embedding stage already computed the document
+embeddings, we hand them to KeyBERT instead of letting it encode every abstract a second time. The candidate words of a
+batch are embedded once for the whole batch and kept in a bounded cache, so words that occur in many abstracts (or in
+later batches) are not encoded again.
+"""
+
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from sklearn.feature_extraction.text import CountVectorizer
+
+from .model_registry import registry
+from .object_relational_mapper import PaperMapper
+
+
+class KeywordStage:
+    """This class is responsible for extracting the keywords of papers in batches and storing them in the database."""
+
+    def __init__(self, keyword_model=None, encoder=None, top_n=10, cache_size=None, paper_mapper=None):
+        self.keyword_model = keyword_model if keyword_model is not None else registry.get_keyword_model()
+        self.encoder = encoder if encoder is not None else registry.get_encoder()
+        self.top_n = top_n
+        self.cache_size = cache_size or settings.KEYWORD_EMBEDDING_CACHE_SIZE
+        self.paper_mapper = paper_mapper if paper_mapper is not None else PaperMapper()
+        # Least recently used cache of candidate word -> embedding
+        self._word_embeddings = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def embed_words(self, words):
+        """Return the embeddings of the given candidate words. Only words that are not in the cache are encoded."""
+
+        missing = [word for word in words if word not in self._word_embeddings]
+        self.cache_hits += len(words) - len(missing)
+        self.cache_misses += len(missing)
+        if missing:
+            vectors = self.encoder.encode(missing, batch_size=settings.EMBEDDING_BATCH_SIZE, convert_to_numpy=True)
+            for word, vector in zip(missing, vectors):
+                self._word_embeddings[word] = vector
+
+        embeddings = []
+        for word in words:
+            self._word_embeddings.move_to_end(word)
+            embeddings.append(self._word_embeddings[word])
+
+        # Evict the least recently used words
+        while len(self._word_embeddings) > self.cache_size:
+            self._word_embeddings.popitem(last=False)
+
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def run(self, papers, doc_embeddings=None):
+        """Extract and store the keywords of the given papers. `doc_embeddings` maps paper ids to the embeddings computed
+        by the embedding stage; papers that were loaded with their embedding use it, all others are encoded here."""
+
+        start = time.perf_counter()
+        if not papers:
+            return {'documents': 0, 'seconds': 0.0}
+
+        doc_embeddings = doc_embeddings or {}
+        docs = [paper.abstract for paper in papers]
+
+        # Reuse the document embeddings and only encode the papers that do not have an embedding yet
+        doc_embeddings = {
+            **{paper.id: paper.embedding for paper in papers if paper.embedding is not None}, **doc_embeddings
+        }
+        missing = [i for i, paper in enumerate(papers) if paper.id not in doc_embeddings]
+        missing_vectors = self.encoder.encode([docs[i] for i in missing], convert_to_numpy=True) if missing else []
+        vectors = {i: vector for i, vector in zip(missing, missing_vectors)}
+        embeddings = np.asarray(
+            [vectors[i] if i in vectors else doc_embeddings[paper.id] for i, paper in enumerate(papers)],
+            dtype=np.float32
+        )
+
+        # The candidate words of the whole batch. KeyBERT refits the same vectorizer on the same documents, so the
+        # vocabulary (and thus the order of the word embeddings) matches.
+        vectorizer = CountVectorizer(ngram_range=(1, 1), stop_words='english')
+        try:
+            words = vectorizer.fit(docs).get_feature_names_out()
+        except ValueError:
+            # Only stop words in the batch, there is nothing to extract
+            words = []
+
+        if len(words) > 0:
+            keywords = self.keyword_model.extract_keywords(
+                docs,
+                vectorizer=vectorizer,
+                doc_embeddings=embeddings,
+                word_embeddings=self.embed_words(list(words)),
+                top_n=self.top_n
+            )
+            # KeyBERT unwraps the result if there is only one document
+            if len(docs) == 1:
+                keywords = [keywords]
+        else:
+            keywords = [[] for _ in docs]
+
+        for paper, paper_keywords in zip(papers, keywords):
+            paper.keywords = [kw[0] for kw in paper_keywords]
+
+        # Write all keywords back in one statement
+        self.paper_mapper.bulk_update_keywords([paper.id for paper in papers], [paper.keywords for paper in papers])
+        seconds = time.perf_counter() - start
+
+        stats = {
+            'documents': len(papers),
+            'seconds': round(seconds, 3),
+            'docs_per_second': round(len(papers) / seconds, 1) if seconds > 0 else 0.0,
+            'word_cache_hits': self.cache_hits,
+            'word_cache_misses': self.cache_misses,
+        }
+        print(f"Keyword stage: {stats}")
+        return stats
@@ -0,0 +1,52 @@
+"""
+Management command that measures the recall@k of the approximate nearest neighbour index used for related papers.
+For a sample of papers, the neighbours returned by the index are compared with the exact neighbours (sequential scan)
+and the mean recall and query times are reported. Usage:
+
+    python manage.py check_ann_recall --samples 100 --k 10 --ef-search 40
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from researchlens.object_relational_mapper import RelatedPaperMapper
+
+
+class Command(BaseCommand):
+    help = "Compare the approximate related-paper search with the exact search (recall@k and latency)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=100, help="Number of papers used as queries")
+        parser.add_argument('--k', type=int, default=10, help="Number of neighbours per query")
+        parser.add_argument('--ef-search', type=int, default=None, help="HNSW ef_search (default: settings)")
+        parser.add_argument('--probes', type=int, default=None, help="IVFFlat probes (default: settings)")
+        parser.add_argument('--min-recall', type=float, default=0.0, help="Fail if the mean recall is lower")
+
+    def handle(self, *args, **options):
+        mapper = RelatedPaperMapper()
+        paper_ids = mapper.get_sample_ids(options['samples'])
+        if not paper_ids:
+            raise CommandError("There are no papers with embeddings")
+
+        recalls, exact_seconds, approximate_seconds = [], 0.0, 0.0
+        for paper_id in paper_ids:
+            start = time.perf_counter()
+            exact = mapper.get_related_ids(paper_id, limit=options['k'], exact=True)
+            exact_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            approximate = mapper.get_related_ids(paper_id, limit=options['k'], ef_search=options['ef_search'],
+                                                 probes=options['probes'])
+            approximate_seconds += time.perf_counter() - start
+
+            if exact:
+                recalls.append(len(set(exact) & set(approximate)) / len(exact))
+
+        recall = sum(recalls) / len(recalls) if recalls else 0.0
+        self.stdout.write(f"queries: {len(paper_ids)}")
+        self.stdout.write(f"recall@{options['k']}: {recall:.4f}")
+        self.stdout.write(f"exact_ms_per_query: {1000 * exact_seconds / len(paper_ids):.2f}")
+        self.stdout.write(f"approximate_ms_per_query: {1000 * approximate_seconds / len(paper_ids):.2f}")
+        if recall < options['min_recall']:
+            raise CommandError(f"Recall {recall:.4f} is below {options['min_recall']}")
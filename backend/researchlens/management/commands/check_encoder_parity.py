@@ -0,0 +1,43 @@
+"""
+Management command that compares an encoder backend with the PyTorch reference model. It reports the cosine drift
+between the vectors of both encoders and their throughput in documents per CPU-second. Usage:
+
+    python manage.py check_encoder_parity --backend onnx-int8 --samples 256
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from researchlens.encoders import ENCODER_BACKENDS, load_encoder, parity_check
+from researchlens.model_registry import EMBEDDING_MODEL_NAME
+from researchlens.object_relational_mapper import PaperMapper
+
+# Used when the database does not contain any papers yet
+FALLBACK_TEXTS = [
+    "We propose a transformer-based model for the retrieval of scientific documents.",
+    "The stability of the numerical scheme is proven for hyperbolic conservation laws.",
+    "We study the asymptotic behaviour of random matrices with heavy-tailed entries.",
+    "A Bayesian hierarchical model is used to estimate regional unemployment rates.",
+]
+
+
+class Command(BaseCommand):
+    help = "Compare an encoder backend against the PyTorch sentence-transformer (cosine drift and throughput)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default=settings.EMBEDDING_BACKEND, choices=ENCODER_BACKENDS)
+        parser.add_argument('--samples', type=int, default=256, help="Number of abstracts to encode")
+        parser.add_argument('--max-drift', type=float, default=0.02, help="Fail if the mean cosine drift is larger")
+
+    def handle(self, *args, **options):
+        texts = PaperMapper().get_sample_abstracts(options['samples']) or FALLBACK_TEXTS
+
+        reference = load_encoder(EMBEDDING_MODEL_NAME, 'torch')
+        encoder = load_encoder(EMBEDDING_MODEL_NAME, options['backend'], export_dir=settings.ENCODER_EXPORT_DIR,
+                               quantization_config=settings.ONNX_QUANTIZATION_CONFIG)
+        report = parity_check(encoder, reference, texts)
+
+        for key, value in report.items():
+            self.stdout.write(f"{key}: {value}")
+        if report['mean_cosine_drift'] > options['max_drift']:
+            raise CommandError(f"Mean cosine drift {report['mean_cosine_drift']:.4f} exceeds {options['max_drift']}")
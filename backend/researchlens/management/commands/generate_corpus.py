@@ -0,0 +1,42 @@
+"""
+Management command that grows the database to a synthetic benchmark corpus. The example data in `sql_exports` is
+imported first if the database is empty, then synthetic papers derived from it are added until the corpus has the
+requested size. Growing is incremental, so a 100k corpus can be grown to 1m later. Usage:
+
+    python manage.py generate_corpus --size 100k
+    python manage.py rebuild_neighbours   # materialize the neighbours of the synthetic papers
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from researchlens.benchmarks.corpus import (
+    DEFAULT_SEED_DIR, CorpusGenerator, Seed, corpus_stats, import_seed, parse_size,
+)
+
+
+class Command(BaseCommand):
+    help = "Grow the database to a synthetic benchmark corpus (e.g. 10k, 100k or 1m papers)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', default='10k', help="Number of papers: 10k, 100k, 1m or a number")
+        parser.add_argument('--seed-dir', default=DEFAULT_SEED_DIR, help="Directory with the sql_exports")
+        parser.add_argument('--random-seed', type=int, default=42, help="Seed of the random generator")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Papers stored per transaction")
+
+    def handle(self, *args, **options):
+        try:
+            size = parse_size(options['size'])
+        except ValueError:
+            raise CommandError(f"Invalid size: {options['size']}")
+
+        if import_seed(options['seed_dir']):
+            self.stdout.write(f"Imported the example data from {options['seed_dir']}")
+
+        try:
+            seed = Seed()
+        except ValueError as e:
+            raise CommandError(str(e))
+        generator = CorpusGenerator(seed, random_seed=options['random_seed'], batch_size=options['batch_size'])
+        added = generator.grow(size, progress=self.stdout.write)
+        self.stdout.write(f"Added {added} synthetic papers")
+        self.stdout.write(f"Corpus: {corpus_stats()}")
@@ -0,0 +1,52 @@
+"""
+Management command that runs a load test against a running server and writes the throughput and latency percentiles
+as JSON. It is used to compare the synchronous and the asynchronous deployment: run it once against each deployment
+(with the same corpus and RESPONSE_CACHE_TTL=0) and compare the results. Usage:
+
+    python manage.py load_test --url http://localhost:8000 --concurrency 100 --label sync --output sync.json
+    python manage.py load_test --url http://localhost:8000 --concurrency 100 --label async --compare sync.json
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from researchlens.benchmarks import runner
+from researchlens.benchmarks.load_test import run_load_test
+
+
+class Command(BaseCommand):
+    help = "Load test the paper list and related-paper endpoints of a running server."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000', help="Base URL of the server")
+        parser.add_argument('--concurrency', type=int, default=50, help="Number of concurrent clients")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds the clients send requests")
+        parser.add_argument('--timeout', type=float, default=60, help="Seconds after which a request fails")
+        parser.add_argument('--random-seed', type=int, default=42, help="Seed of the request parameters")
+        parser.add_argument('--label', default='', help="Name of the deployment, e.g. sync or async")
+        parser.add_argument('--output', default=None, help="File the results are written to")
+        parser.add_argument('--compare', default=None, help="Results of an earlier run to compare with")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['duration'] <= 0:
+            raise CommandError("--concurrency and --duration must be positive")
+
+        document = run_load_test(
+            options['url'], concurrency=options['concurrency'], duration=options['duration'],
+            timeout=options['timeout'], random_seed=options['random_seed'], label=options['label'],
+            progress=self.stdout.write
+        )
+        for endpoint, result in document['scenarios'].items():
+            self.stdout.write(f"{endpoint}: {result}")
+
+        if options['output']:
+            runner.save(document, options['output'])
+            self.stdout.write(f"Wrote the results to {options['output']}")
+
+        if options['compare']:
+            baseline = runner.load(options['compare'])
+            self.stdout.write(f"Compared with {baseline.get('label') or baseline.get('commit')}:")
+            for metric in ('requests_per_second', 'p99_ms'):
+                for row in runner.compare(baseline, document, metric=metric):
+                    self.stdout.write(
+                        f"{row['scenario']} {metric}: {row['before']} -> {row['after']} ({row['change_percent']:+.1f}%)"
+                    )
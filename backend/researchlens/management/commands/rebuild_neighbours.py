@@ -0,0 +1,29 @@
+"""
+Management command that computes the materialized top-k neighbours (and similar pairs) of all papers that already have
+an embedding, e.g. after upgrading an existing database. New papers are processed by the preprocessing pipeline. Usage:
+
+    python manage.py rebuild_neighbours --block-size 1024
+"""
+
+from django.core.management.base import BaseCommand
+
+from researchlens.object_relational_mapper import PaperMapper
+from researchlens.similarity import SimilarityGraphBuilder
+
+
+class Command(BaseCommand):
+    help = "Compute the top-k neighbours of all embedded papers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--block-size', type=int, default=None, help="Number of papers compared at once")
+
+    def handle(self, *args, **options):
+        paper_mapper = PaperMapper()
+        builder = SimilarityGraphBuilder(block_size=options['block_size'], paper_mapper=paper_mapper)
+
+        # Each block is treated as a batch of new papers and compared against the whole corpus
+        processed = 0
+        for ids, embeddings in paper_mapper.iter_embedding_blocks(builder.block_size):
+            builder.build(ids, embeddings)
+            processed += len(ids)
+            self.stdout.write(f"Processed {processed} papers")
@@ -0,0 +1,51 @@
+"""
+Management command that runs the benchmark scenarios against the current database (see `generate_corpus`) and writes
+the results as JSON. With `--compare`, the results are compared with an earlier run, e.g. of the main branch. Usage:
+
+    python manage.py run_benchmarks --repeat 20 --output results.json
+    python manage.py run_benchmarks --scenarios papers_search,related_papers --compare main.json
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from researchlens.benchmarks import runner
+
+
+class Command(BaseCommand):
+    help = "Run the benchmark scenarios and write the timings as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default='', help="Comma-separated scenario names (default: all)")
+        parser.add_argument('--repeat', type=int, default=20, help="Measured runs per scenario")
+        parser.add_argument('--warmup', type=int, default=3, help="Runs per scenario before measuring")
+        parser.add_argument('--random-seed', type=int, default=42, help="Seed of the scenario parameters")
+        parser.add_argument('--with-models', action='store_true', help="Include the embedding and keyword stages")
+        parser.add_argument('--output', default=None, help="File the results are written to")
+        parser.add_argument('--compare', default=None, help="Results of an earlier run to compare with")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1")
+        names = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+
+        try:
+            document = runner.run_benchmarks(
+                names, repeat=options['repeat'], warmup=options['warmup'], with_models=options['with_models'],
+                random_seed=options['random_seed'], progress=self.stdout.write
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            runner.save(document, options['output'])
+            self.stdout.write(f"Wrote the results to {options['output']}")
+
+        if options['compare']:
+            baseline = runner.load(options['compare'])
+            self.stdout.write(f"Compared with {baseline.get('commit')} ({baseline['corpus']['papers']} papers):")
+            for row in runner.compare(baseline, document):
+                # Timings of different paths (e.g. materialized vs live related papers) are not comparable
+                paths = f", paths {row['paths'][0]} -> {row['paths'][1]}" if 'paths' in row else ""
+                self.stdout.write(
+                    f"{row['scenario']}: {row['before']} ms -> {row['after']} ms ({row['change_percent']:+.1f}%{paths})"
+                )
@@ -0,0 +1,36 @@
+"""
+This module adapts middleware that is only synchronous to the ASGI deployment. Django runs synchronous middleware of an
+async request in its single thread for synchronous code, which would serialize all requests of a process and cancel
+the benefit of the async views. The static files of WhiteNoise are looked up in memory, so the lookup can run directly
+on the event loop.
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """This class is responsible for serving the static files like WhiteNoiseMiddleware, in synchronous (WSGI) as well
+    as asynchronous (ASGI) request handling."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
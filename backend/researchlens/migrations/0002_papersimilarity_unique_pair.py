@@ -0,0 +1,33 @@
+"""
+This migration adds a unique constraint on the (source, target) pair of the paper similarities. The similarity stage
+writes all pairs of a batch with a single INSERT ... ON CONFLICT DO NOTHING, which relies on this constraint. Existing
+duplicate pairs are removed first.
+"""
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('researchlens', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            --Remove duplicate pairs and keep the oldest row of each pair
+            DELETE FROM researchlens_papersimilarity s
+            USING researchlens_papersimilarity d
+            WHERE s.source_paper_id = d.source_paper_id
+              AND s.target_paper_id = d.target_paper_id
+              AND s.id > d.id;
+            --Each pair of papers is stored only once
+            ALTER TABLE researchlens_papersimilarity
+                ADD CONSTRAINT researchlens_papersimilarity_source_target_uniq UNIQUE (source_paper_id, target_paper_id);
+            """,
+            reverse_sql="""
+            ALTER TABLE researchlens_papersimilarity DROP CONSTRAINT researchlens_papersimilarity_source_target_uniq;
+            """,
+        ),
+    ]
@@ -0,0 +1,42 @@
+"""
+This migration adds the unique constraints needed by the bulk ingest path, which writes authors and paper-author links
+with INSERT ... ON CONFLICT. Author names and (paper, author) pairs become unique; the arXiv id of a paper is already
+unique since the initial migration. Duplicate authors are merged into the author with the smallest id first.
+"""
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('researchlens', '0002_papersimilarity_unique_pair'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            --Point the links of duplicate authors to the author with the smallest id and remove the duplicates
+            UPDATE researchlens_paper_authors pa
+            SET author_id = d.keep_id
+            FROM (SELECT id, min(id) OVER (PARTITION BY name) AS keep_id FROM researchlens_author) d
+            WHERE pa.author_id = d.id AND d.id <> d.keep_id;
+            DELETE FROM researchlens_author a
+            USING researchlens_author b
+            WHERE a.name = b.name AND a.id > b.id;
+            --Remove duplicate paper-author links
+            DELETE FROM researchlens_paper_authors a
+            USING researchlens_paper_authors b
+            WHERE a.paper_id = b.paper_id AND a.author_id = b.author_id AND a.id > b.id;
+            --Each author name and each paper-author pair is stored only once
+            ALTER TABLE researchlens_author
+                ADD CONSTRAINT researchlens_author_name_uniq UNIQUE (name);
+            ALTER TABLE researchlens_paper_authors
+                ADD CONSTRAINT researchlens_paper_authors_paper_author_uniq UNIQUE (paper_id, author_id);
+            """,
+            reverse_sql="""
+            ALTER TABLE researchlens_paper_authors DROP CONSTRAINT researchlens_paper_authors_paper_author_uniq;
+            ALTER TABLE researchlens_author DROP CONSTRAINT researchlens_author_name_uniq;
+            """,
+        ),
+    ]
@@ -0,0 +1,83 @@
+"""
+This migration adds a precomputed full-text search vector to the papers. The vector covers the title (weight A), the
+abstract (weight B) and the names of all authors of the paper (weight C) and is indexed with a GIN index. Triggers keep
+the vector up to date when a paper is inserted, its title or abstract changes, or its authors change. Before, the
+search evaluated to_tsvector for every paper-author row on every request and could not use an index.
+"""
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('researchlens', '0003_unique_author_and_paper_author'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            ALTER TABLE researchlens_paper ADD COLUMN search_vector tsvector;
+            
+            --Computes the search vector of a paper from its title, abstract and the names of its authors
+            CREATE OR REPLACE FUNCTION researchlens_paper_search_vector(paper_title TEXT, paper_abstract TEXT, paper_id BIGINT)
+            RETURNS tsvector AS $$
+                SELECT setweight(to_tsvector('english', coalesce(paper_title, '')), 'A')
+                    || setweight(to_tsvector('english', coalesce(paper_abstract, '')), 'B')
+                    || setweight(to_tsvector('english', coalesce((
+                        SELECT string_agg(a.name, ' ')
+                        FROM researchlens_paper_authors pa
+                        INNER JOIN researchlens_author a ON pa.author_id = a.id
+                        WHERE pa.paper_id = researchlens_paper_search_vector.paper_id
+                    ), '')), 'C');
+            $$ LANGUAGE sql STABLE;
+            
+            --Keeps the search vector up to date when a paper is inserted or its title or abstract changes
+            CREATE OR REPLACE FUNCTION researchlens_paper_search_vector_trigger() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := researchlens_paper_search_vector(NEW.title, NEW.abstract, NEW.id);
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+            
+            CREATE TRIGGER researchlens_paper_search_vector_update
+                BEFORE INSERT OR UPDATE OF title, abstract ON researchlens_paper
+                FOR EACH ROW EXECUTE FUNCTION researchlens_paper_search_vector_trigger();
+            
+            --Keeps the search vector up to date when the authors of papers change. The triggers run once per statement
+            --and refresh all affected papers at once, so a bulk insert of links updates each paper only once.
+            CREATE OR REPLACE FUNCTION researchlens_paper_authors_search_vector_trigger() RETURNS trigger AS $$
+            BEGIN
+                UPDATE researchlens_paper p
+                SET search_vector = researchlens_paper_search_vector(p.title, p.abstract, p.id)
+                WHERE p.id IN (SELECT DISTINCT paper_id FROM changed_links);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            
+            CREATE TRIGGER researchlens_paper_authors_search_vector_insert
+                AFTER INSERT ON researchlens_paper_authors
+                REFERENCING NEW TABLE AS changed_links
+                FOR EACH STATEMENT EXECUTE FUNCTION researchlens_paper_authors_search_vector_trigger();
+            
+            CREATE TRIGGER researchlens_paper_authors_search_vector_delete
+                AFTER DELETE ON researchlens_paper_authors
+                REFERENCING OLD TABLE AS changed_links
+                FOR EACH STATEMENT EXECUTE FUNCTION researchlens_paper_authors_search_vector_trigger();
+            
+            --Compute the search vector of the existing papers and index it
+            UPDATE researchlens_paper SET search_vector = researchlens_paper_search_vector(title, abstract, id);
+            CREATE INDEX researchlens_paper_search_vector_idx ON researchlens_paper USING GIN (search_vector);
+            """,
+            reverse_sql="""
+            DROP INDEX IF EXISTS researchlens_paper_search_vector_idx;
+            DROP TRIGGER IF EXISTS researchlens_paper_authors_search_vector_delete ON researchlens_paper_authors;
+            DROP TRIGGER IF EXISTS researchlens_paper_authors_search_vector_insert ON researchlens_paper_authors;
+            DROP TRIGGER IF EXISTS researchlens_paper_search_vector_update ON researchlens_paper;
+            DROP FUNCTION IF EXISTS researchlens_paper_authors_search_vector_trigger();
+            DROP FUNCTION IF EXISTS researchlens_paper_search_vector_trigger();
+            DROP FUNCTION IF EXISTS researchlens_paper_search_vector(TEXT, TEXT, BIGINT);
+            ALTER TABLE researchlens_paper DROP COLUMN IF EXISTS search_vector;
+            """,
+        ),
+    ]
@@ -0,0 +1,25 @@
+"""
+This migration adds an index on the publication date and id of the papers. The paper list is ordered by these two
+columns and paginated with a keyset on them, so the database can read a page directly from the index.
+"""
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('researchlens', '0004_paper_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            CREATE INDEX IF NOT EXISTS researchlens_paper_published_date_id_idx
+                ON researchlens_paper (published_date DESC, id DESC);
+            """,
+            reverse_sql="""
+            DROP INDEX IF EXISTS researchlens_paper_published_date_id_idx;
+            """,
+        ),
+    ]
@@ -0,0 +1,29 @@
+"""
+This migration adds an approximate nearest neighbour index (HNSW) on the paper embeddings. The index uses the cosine
+distance, which matches the sentence-transformer used for the embeddings, so that related papers no longer need a
+sequential scan over all 384-dimensional vectors. The recall of the index can be checked with
+`python manage.py check_ann_recall`.
+"""
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('researchlens', '0005_paper_published_date_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            --m and ef_construction are the pgvector defaults, ef_search is set per query (see RelatedPaperMapper)
+            CREATE INDEX IF NOT EXISTS researchlens_paper_embedding_hnsw_idx
+                ON researchlens_paper USING hnsw (embedding vector_cosine_ops)
+                WITH (m = 16, ef_construction = 64);
+            """,
+            reverse_sql="""
+            DROP INDEX IF EXISTS researchlens_paper_embedding_hnsw_idx;
+            """,
+        ),
+    ]
@@ -0,0 +1,35 @@
+"""
+This migration adds the table with the materialized top-k neighbours of each paper. The related papers of a paper are
+read from this table with a single index lookup instead of a vector search on every request. The table is filled
+incrementally by the similarity stage of the preprocessing pipeline; existing papers can be processed with
+`python manage.py rebuild_neighbours`.
+"""
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('researchlens', '0006_paper_embedding_hnsw_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            --Table for storing the k closest neighbours of each paper
+            CREATE TABLE IF NOT EXISTS researchlens_paperneighbour (
+                paper_id BIGINT NOT NULL REFERENCES researchlens_paper(id) ON DELETE CASCADE,
+                neighbour_id BIGINT NOT NULL REFERENCES researchlens_paper(id) ON DELETE CASCADE,
+                similarity_score FLOAT NOT NULL,
+                PRIMARY KEY (paper_id, neighbour_id)
+            );
+            --The related papers are read ordered by score, the neighbour id is included for index-only scans
+            CREATE INDEX IF NOT EXISTS researchlens_paperneighbour_paper_score_idx
+                ON researchlens_paperneighbour (paper_id, similarity_score DESC) INCLUDE (neighbour_id);
+            """,
+            reverse_sql="""
+            DROP TABLE IF EXISTS researchlens_paperneighbour;
+            """,
+        ),
+    ]
@@ -0,0 +1,46 @@
+"""
+This migration adds explicit pending-work tracking to the papers. Every paper records whether it still needs an
+embedding and keywords, and when a preprocessing stage claimed it. The partial indexes only contain the papers that
+still have work pending, so the stages find their rows without scanning the whole corpus. Existing papers are marked
+according to their current embedding and keywords.
+"""
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('researchlens', '0007_paperneighbour'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            --New papers need an embedding and keywords
+            ALTER TABLE researchlens_paper
+                ADD COLUMN IF NOT EXISTS needs_embedding BOOLEAN NOT NULL DEFAULT TRUE,
+                ADD COLUMN IF NOT EXISTS needs_keywords BOOLEAN NOT NULL DEFAULT TRUE,
+                ADD COLUMN IF NOT EXISTS embedding_claimed_at TIMESTAMPTZ NULL,
+                ADD COLUMN IF NOT EXISTS keywords_claimed_at TIMESTAMPTZ NULL;
+            --Mark the existing papers by their current state
+            UPDATE researchlens_paper
+                SET needs_embedding = embedding IS NULL,
+                    needs_keywords = keywords = '[]'::jsonb;
+            --Only the papers with pending work are indexed
+            CREATE INDEX IF NOT EXISTS researchlens_paper_needs_embedding_idx
+                ON researchlens_paper (id) WHERE needs_embedding;
+            CREATE INDEX IF NOT EXISTS researchlens_paper_needs_keywords_idx
+                ON researchlens_paper (id) WHERE needs_keywords;
+            """,
+            reverse_sql="""
+            DROP INDEX IF EXISTS researchlens_paper_needs_keywords_idx;
+            DROP INDEX IF EXISTS researchlens_paper_needs_embedding_idx;
+            ALTER TABLE researchlens_paper
+                DROP COLUMN IF EXISTS keywords_claimed_at,
+                DROP COLUMN IF EXISTS embedding_claimed_at,
+                DROP COLUMN IF EXISTS needs_keywords,
+                DROP COLUMN IF EXISTS needs_embedding;
+            """,
+        ),
+    ]
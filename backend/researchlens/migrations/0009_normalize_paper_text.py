@@ -0,0 +1,75 @@
+"""
+This migration normalizes the titles, abstracts and author names of the existing papers like new papers are normalized
+when they are stored: line breaks and runs of whitespace become single spaces and the text is trimmed. The mappers read
+the text as it is stored, so it no longer has to be cleaned on every read. Only rows that need it are updated.
+
+The bulk ingest looks up authors by their normalized name, so authors whose names only differ in whitespace are merged
+into the author with the smallest id (like in migration 0003); otherwise the next ingest would create them again. The
+triggers of migration 0004 do not run when links are updated or authors are renamed, so the search vectors of the
+affected papers are recomputed at the end.
+"""
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('researchlens', '0008_paper_processing_state'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            r"""
+            UPDATE researchlens_paper
+                SET title = btrim(regexp_replace(title, '\s+', ' ', 'g')),
+                    abstract = btrim(regexp_replace(abstract, '\s+', ' ', 'g'))
+                WHERE title ~ '(^\s|\s$|\s\s|[\t\r\n])' OR abstract ~ '(^\s|\s$|\s\s|[\t\r\n])';
+            """,
+            #The original line breaks are not kept, so there is nothing to revert
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            r"""
+            --The normalized name of every author and the author that is kept for it. Names that are only whitespace
+            --are left as they are, the ingest does not store such names.
+            CREATE TEMPORARY TABLE researchlens_author_merge ON COMMIT DROP AS
+                SELECT id, normalized_name, min(id) OVER (PARTITION BY normalized_name) AS keep_id,
+                    name <> normalized_name AS renamed
+                FROM (
+                    SELECT id, name, btrim(regexp_replace(name, '\s+', ' ', 'g')) AS normalized_name
+                    FROM researchlens_author
+                ) a
+                WHERE normalized_name <> '';
+            --Remove the links that would point to the same author of a paper twice after merging
+            DELETE FROM researchlens_paper_authors pa
+            USING researchlens_author_merge m, researchlens_paper_authors other, researchlens_author_merge o
+            WHERE pa.author_id = m.id AND other.paper_id = pa.paper_id AND other.author_id = o.id
+                AND o.keep_id = m.keep_id AND other.id < pa.id;
+            --Point the remaining links of duplicate authors to the kept author and remove the duplicates
+            UPDATE researchlens_paper_authors pa
+                SET author_id = m.keep_id
+                FROM researchlens_author_merge m
+                WHERE pa.author_id = m.id AND m.id <> m.keep_id;
+            DELETE FROM researchlens_author a
+            USING researchlens_author_merge m
+            WHERE a.id = m.id AND m.id <> m.keep_id;
+            --Store the normalized names of the kept authors
+            UPDATE researchlens_author a
+                SET name = m.normalized_name
+                FROM researchlens_author_merge m
+                WHERE a.id = m.id AND a.name <> m.normalized_name;
+            --Recompute the search vectors of the papers whose authors were merged or renamed
+            UPDATE researchlens_paper p
+                SET search_vector = researchlens_paper_search_vector(p.title, p.abstract, p.id)
+                WHERE p.id IN (
+                    SELECT pa.paper_id
+                    FROM researchlens_paper_authors pa
+                    INNER JOIN researchlens_author_merge m ON pa.author_id = m.keep_id
+                    WHERE m.id <> m.keep_id OR m.renamed
+                );
+            """,
+            #The merged authors and the original names are not kept, so there is nothing to revert
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
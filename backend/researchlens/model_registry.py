@@ -0,0 +1,162 @@
+"""
+This module provides a process-wide registry for the deep learning models used by the ResearchLens preprocessing
+pipeline. Loading a sentence-transformer takes several seconds and a few hundred MB of memory, so the models are loaded
+once per Celery worker process (in the background when the process starts) and reused by every task that runs in that
+process. KeyBERT is built on top of the same encoder instance, so only one copy of the sentence-transformer is kept in
+memory. The encoder backend (PyTorch, int8-quantized PyTorch or ONNX) is selected with the EMBEDDING_BACKEND setting.
+"""
+
+import os
+import resource
+import threading
+import time
+
+from celery.signals import worker_process_init, worker_process_shutdown
+
+# Name of the sentence-transformer used for document embeddings and keyword extraction
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+
+def resident_memory_mb():
+    """Return the resident set size (RSS) of the current process in MB. We read /proc/self/statm on Linux and fall back
+    to the peak RSS reported by getrusage on other platforms."""
+
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is reported in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ModelRegistry:
+    """This class is responsible for loading the embedding and keyword models once and handing out the shared instances.
+    It also records how long loading took and how much resident memory the models added to the process."""
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, backend=None, num_threads=None):
+        self.model_name = model_name
+        self.backend = backend
+        # Number of threads torch uses for one encode call (None keeps the default of torch, one per core)
+        self.num_threads = num_threads
+        self._encoder = None
+        self._keyword_model = None
+        self._encode_pool = None
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    @property
+    def loaded(self):
+        return self._encoder is not None
+
+    def load(self):
+        """Load and warm up the models if this has not happened yet in the current process."""
+
+        with self._lock:
+            if self.loaded:
+                return self.stats
+
+            # Import lazily, so that processes which never run the pipeline (e.g. the web server) do not pay for torch
+            from django.conf import settings
+            from keybert import KeyBERT
+            from .encoders import load_encoder
+
+            backend = self.backend or settings.EMBEDDING_BACKEND
+            if self.num_threads:
+                import torch
+                torch.set_num_threads(self.num_threads)
+            rss_before = resident_memory_mb()
+            start = time.perf_counter()
+
+            encoder = load_encoder(self.model_name, backend, export_dir=settings.ENCODER_EXPORT_DIR,
+                                   quantization_config=settings.ONNX_QUANTIZATION_CONFIG)
+            # KeyBERT accepts an existing sentence-transformer, so it does not load a second copy of the model
+            keyword_model = KeyBERT(model=encoder)
+            load_seconds = time.perf_counter() - start
+
+            # Warm up the models, so that the first real batch does not pay for lazy initialisation
+            start = time.perf_counter()
+            encoder.encode(["ResearchLens warm-up sentence."])
+            keyword_model.extract_keywords("ResearchLens warm-up sentence.", top_n=1)
+            warmup_seconds = time.perf_counter() - start
+
+            self._encoder = encoder
+            self._keyword_model = keyword_model
+            self.stats = {
+                'model_name': self.model_name,
+                'backend': backend,
+                'num_threads': self.num_threads,
+                'pid': os.getpid(),
+                'load_seconds': round(load_seconds, 3),
+                'warmup_seconds': round(warmup_seconds, 3),
+                'rss_before_mb': round(rss_before, 1),
+                'rss_after_mb': round(resident_memory_mb(), 1),
+            }
+            print(f"Loaded models {self.stats}")
+            return self.stats
+
+    def get_encoder(self):
+        """Return the shared sentence-transformer, loading it on first use."""
+
+        if not self.loaded:
+            self.load()
+        return self._encoder
+
+    def get_keyword_model(self):
+        """Return the shared KeyBERT model, loading it on first use."""
+
+        if not self.loaded:
+            self.load()
+        return self._keyword_model
+
+    def get_encode_pool(self, processes):
+        """Return a multi-process encode pool with the given number of CPU processes, starting it on first use. The
+        pool spawns child processes, so it can only be used from the solo or threads worker pool (prefork children
+        are daemonic and are not allowed to have children)."""
+
+        encoder = self.get_encoder()
+        with self._lock:
+            if self._encode_pool is None:
+                self._encode_pool = encoder.start_multi_process_pool(target_devices=['cpu'] * processes)
+            return self._encode_pool
+
+    def close(self):
+        """Stop the multi-process encode pool if it was started."""
+
+        with self._lock:
+            if self._encode_pool is not None:
+                self._encoder.stop_multi_process_pool(self._encode_pool)
+                self._encode_pool = None
+
+
+# One registry per process. Forked worker processes get their own (empty) copy and load the models on start-up.
+registry = ModelRegistry()
+
+
+@worker_process_init.connect
+def load_models_on_worker_start(**kwargs):
+    """Start loading the models as soon as a prefork worker process starts, so that the first task does not have to
+    wait. The models are loaded in a background thread, because the prefork pool kills a child whose start-up takes
+    longer than worker_proc_alive_timeout (4 seconds), and loading and warming up the models takes longer than that. A
+    task that needs the models earlier waits for the registry lock until they are loaded."""
+
+    from django.conf import settings
+
+    # The prefork children run in parallel, so each one only gets a share of the cores
+    registry.num_threads = settings.TORCH_THREADS_PER_PROCESS or None
+    threading.Thread(target=load_models_in_background, name='load-models', daemon=True).start()
+
+
+def load_models_in_background():
+    try:
+        registry.load()
+    except Exception as e:
+        # The first task loads the models again and reports the error
+        print(f"Could not load the models: {e}")
+
+
+@worker_process_shutdown.connect
+def stop_models_on_worker_shutdown(**kwargs):
+    """Stop the encode pool's child processes when the worker process exits."""
+
+    registry.close()
@@ -1,11 +1,24 @@
 """
 This module defines the data models for the ResearchLens application, including classes for authors, papers, and paper similarities.
 It provides methods for initializing these models and converting them to dictionaries for easy serialization (needed for
-encoding the data into JSON format for the API).
+encoding the data into JSON format for the API). The models use `__slots__`, because every request creates many of them.
+
+Titles, abstracts and author names are normalized once when they are stored (see `normalize_text`), so the models can be
+built from the database rows as they are.
 """
 
+
+def normalize_text(text):
+    """Collapse line breaks and runs of whitespace into single spaces and strip the text."""
+    
+    return ' '.join(text.split()) if text else ''
+
+
 class Author():
-    """Represents an author in the ResearchLens application."""
+    """Represents an author in the ResearchLens application. Two authors are equal if they have the same id (or the same
+    name, if they are not stored yet)."""
+    
+    __slots__ = ('id', 'name', 'institution')
     
     def __init__(self, id="", name="", institution=None):
         self.id = id
@@ -14,11 +27,25 @@ class Author():
 
     def __str__(self):
         return str(self.name)
+    
+    def _key(self):
+        return self.id if self.id not in ("", None) else self.name
+    
+    def __eq__(self, other):
+        if not isinstance(other, Author):
+            return NotImplemented
+        return self._key() == other._key()
+    
+    def __hash__(self):
+        return hash(self._key())
 
 
 class Paper():
     """Represents a research paper in the ResearchLens application."""
     
+    __slots__ = ('id', 'arxiv_id', 'title', 'abstract', 'published_date', 'authors', 'keywords', 'embedding', 'link',
+                 'categories')
+    
     def __init__(self, id="", arxiv_id="", title="", abstract="", published_date=None, authors=None, keywords=None, embedding=None, link=None, categories=""):
         self.id = id
         self.arxiv_id = arxiv_id
@@ -50,6 +77,8 @@ class Paper():
 class PaperSimilarity():
     """Represents the similarity between two research papers in the ResearchLens application."""
     
+    __slots__ = ('source_paper', 'target_paper', 'similarity_score')
+    
     def __init__(self, source_paper=None, target_paper=None, similarity_score=0.0):
         self.source_paper = source_paper
         self.target_paper = target_paper
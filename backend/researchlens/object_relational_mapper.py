@@ -5,16 +5,240 @@ papers, authors, and their relationships in the database. Additionally, it provi
 on search critera as well as to retrieve related papers based on embedding similarity.
 """
 
-from django.db import connection
-from .models import Paper, Author
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from .models import Paper, Author, normalize_text
+# Importing the module registers the pgvector adapters on new database connections
+from .pgvector_types import to_vector, to_matrix
+from .sql_instrumentation import instrument_mapper
+from collections import OrderedDict
 import json
+import threading
 import numpy as np
 
+# Columns of a paper and of its aggregated authors in the order expected by paper_from_row and PaperHydrator
+PAPER_COLUMNS = "p.id, p.arxiv_id, p.title, p.abstract, p.keywords, p.published_date, p.link, p.categories"
+AUTHOR_COLUMNS = "a.ids, a.names, a.institutions"
 
+# The authors of the paper `p` aggregated into arrays (in the order they were linked), so that every paper is exactly
+# one row and LIMIT/OFFSET work on papers. Papers without authors get NULL arrays.
+AUTHORS_LATERAL = (
+    "LEFT JOIN LATERAL ("
+    "SELECT array_agg(a.id ORDER BY pa.id) AS ids, array_agg(a.name ORDER BY pa.id) AS names, "
+    "array_agg(a.institution ORDER BY pa.id) AS institutions "
+    "FROM researchlens_paper_authors pa "
+    "INNER JOIN researchlens_author a ON pa.author_id = a.id "
+    "WHERE pa.paper_id = p.id"
+    ") a ON true"
+)
+
+
+def paper_from_row(row, embedding=None):
+    """Build a Paper (without authors) from a row that starts with the PAPER_COLUMNS. The text columns are normalized
+    when the papers are stored, so they are used as they are."""
+    
+    return Paper(
+        id=row[0],
+        arxiv_id=row[1],
+        title=row[2],
+        abstract=row[3],
+        # psycopg2 (through Django) returns JSONB as text, psycopg 3 returns it decoded
+        keywords=(json.loads(row[4]) if isinstance(row[4], str) else row[4]) if row[4] else [],
+        published_date=row[5],
+        link=row[6],
+        categories=row[7],
+        embedding=embedding
+    )
+
+
+class PaperHydrator:
+    """This class is responsible for turning rows into Paper objects with their authors. It is shared by all mappers
+    that read papers with their authors. Each row is one paper and holds the PAPER_COLUMNS, optionally the embedding,
+    and the AUTHOR_COLUMNS aggregated by AUTHORS_LATERAL. An author that appears in several papers is created once and
+    shared by the papers (keyed by its id)."""
+    
+    def __init__(self, with_embedding=False):
+        self.with_embedding = with_embedding
+        self.author_offset = 9 if with_embedding else 8
+        # Author id -> Author
+        self._authors = {}
+    
+    def paper(self, row):
+        """Build a Paper with its authors from one row."""
+        
+        paper = paper_from_row(row, to_vector(row[8]) if self.with_embedding else None)
+        offset = self.author_offset
+        if row[offset]:
+            authors = self._authors
+            for author_id, name, institution in zip(row[offset], row[offset + 1], row[offset + 2]):
+                author = authors.get(author_id)
+                if author is None:
+                    author = authors[author_id] = Author(id=author_id, name=name, institution=institution)
+                paper.authors.append(author)
+        return paper
+    
+    def hydrate(self, rows):
+        """Build the papers of the rows, in the order of the rows."""
+        
+        return [self.paper(row) for row in rows]
+
+
+class PaperListQuery:
+    """This class is responsible for building the statements of a page of the paper list (see PaperMapper.get). The
+    statements are shared by the synchronous and the asynchronous mapper, which only differ in how they run them."""
+    
+    def __init__(self, page=1, page_size=10, search="", start_date=None, end_date=None, categories=None, order="date",
+                 after=None, count="exact"):
+        self.page = page
+        self.page_size = page_size
+        self.after = after
+        self.count = count
+        
+        # Initialize the where clause filters and parameters
+        # This will be used to build the SQL query dynamically based on the provided search
+        self.filters = []
+        self.filter_params = []
+        self.order_by = "p.published_date DESC, p.id DESC"
+        self.rank_column = ""
+        self.rank_params = []
+        
+        # Apply filters based on search, start_date, end_date, and categories by appending it to the WHERE clause
+        if search != "":
+            # We use the full-text search capabilities of PostgreSQL to search in the title, abstract, and author names.
+            # The search vector of each paper is maintained by triggers and indexed with a GIN index (see migration 0004).
+            self.filters.append("p.search_vector @@ plainto_tsquery('english', %s)")
+            self.filter_params.append(search)
+            if order == "relevance":
+                # The rank is selected as a column, so that the query of the page can order by it twice
+                self.rank_column = ", ts_rank(p.search_vector, plainto_tsquery('english', %s)) AS rank"
+                self.rank_params.append(search)
+                self.order_by = "rank DESC, " + self.order_by
+        if start_date:
+            self.filters.append("p.published_date >= %s")
+            self.filter_params.append(start_date)
+        if end_date:
+            self.filters.append("p.published_date <= %s")
+            self.filter_params.append(end_date)
+        if categories:
+            # We use the IN clause to filter by categories.
+            categories_list = categories.split(',')
+            placeholders = ', '.join(['%s'] * len(categories_list))
+            self.filters.append(f"p.categories IN ({placeholders})")
+            self.filter_params.extend(categories_list)
+    
+    def count_statement(self):
+        """Return the statement that counts the matching papers as a (sql, params) tuple, or None with count="none". An
+        estimated count is taken from the row estimate of the query planner, which does not visit the matching rows."""
+        
+        where = f"WHERE {' AND '.join(self.filters)} " if self.filters else ""
+        if self.count == "none":
+            return None
+        if self.count == "estimated":
+            return f"EXPLAIN (FORMAT JSON) SELECT 1 FROM researchlens_paper p {where}", list(self.filter_params)
+        return f"SELECT count(*) FROM researchlens_paper p {where}", list(self.filter_params)
+    
+    def total_count(self, row):
+        """Return the number of papers from the result row of the count statement."""
+        
+        if self.count == "estimated":
+            plan = row[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+        return row[0]
+    
+    def page_statement(self):
+        """Return the statement of the requested page as a (sql, params) tuple. All filters work on the paper table (the
+        author names are part of the search vector), so the page is selected from the papers alone and the authors are
+        only aggregated for the papers of the page. Every paper is one row, no matter how many authors it has."""
+        
+        page_filters = list(self.filters)
+        page_params = list(self.filter_params)
+        if self.after is not None and not self.rank_params:
+            # Keyset pagination: continue after the last paper of the previous page
+            page_filters.append("(p.published_date, p.id) < (%s, %s)")
+            page_params.extend(self.after)
+            offset = 0
+        else:
+            offset = (self.page - 1) * self.page_size
+        
+        query = (
+            f"SELECT {PAPER_COLUMNS}, {AUTHOR_COLUMNS} "
+            "FROM ("
+            f"SELECT {PAPER_COLUMNS}{self.rank_column} "
+            "FROM researchlens_paper p "
+            f"{'WHERE ' + ' AND '.join(page_filters) if page_filters else ''} "
+            f"ORDER BY {self.order_by} "
+            "LIMIT %s OFFSET %s"
+            ") p "
+            f"{AUTHORS_LATERAL} "
+            f"ORDER BY {'p.rank DESC, ' if self.rank_params else ''}p.published_date DESC, p.id DESC;"
+        )
+        return query, self.rank_params + page_params + [self.page_size, offset]
+
+
+# Statements of the related papers (see RelatedPaperMapper), shared with the asynchronous mapper.
+# The materialized neighbours of a paper with their authors. The neighbours are selected first, so that the authors are
+# only aggregated for them.
+NEIGHBOUR_PAPERS_QUERY = (
+    f"SELECT {PAPER_COLUMNS}, {AUTHOR_COLUMNS} "
+    "FROM ("
+    f"SELECT {PAPER_COLUMNS} "
+    "FROM researchlens_paperneighbour n "
+    "INNER JOIN researchlens_paper p ON p.id = n.neighbour_id "
+    "WHERE n.paper_id = %s "
+    "ORDER BY n.similarity_score DESC "
+    "LIMIT %s"
+    ") p "
+    f"{AUTHORS_LATERAL} "
+    "ORDER BY p.published_date DESC;"
+)
+# Papers with their authors by id
+PAPERS_BY_IDS_QUERY = (
+    f"SELECT {PAPER_COLUMNS}, {AUTHOR_COLUMNS} "
+    "FROM researchlens_paper p "
+    f"{AUTHORS_LATERAL} "
+    "WHERE p.id = ANY(%s) "
+    "ORDER BY p.published_date DESC;"
+)
+PAPER_EMBEDDING_QUERY = "SELECT embedding FROM researchlens_paper WHERE id = %s"
+# The papers closest to an embedding (we sort by cosine distance, <=> is the cosine distance operator of pgvector)
+RELATED_IDS_QUERY = (
+    "SELECT id "
+    "FROM researchlens_paper "
+    "WHERE id <> %s AND embedding IS NOT NULL "
+    "ORDER BY embedding <=> %s::vector ASC "
+    "LIMIT %s;"
+)
+
+
+def vector_search_statements(ef_search=None, probes=None, exact=False):
+    """Return the statements that set the parameters of the vector search for the current transaction, as a list of
+    (sql, params) tuples. `ef_search` and `probes` default to the VECTOR_SEARCH_EF_SEARCH and VECTOR_SEARCH_PROBES
+    settings; exact=True bypasses the index."""
+    
+    if exact:
+        return [("SELECT set_config('enable_indexscan', 'off', true)", [])]
+    statements = [("SELECT set_config('hnsw.ef_search', %s, true)", [str(ef_search or settings.VECTOR_SEARCH_EF_SEARCH)])]
+    probes = probes or settings.VECTOR_SEARCH_PROBES
+    if probes:
+        statements.append(("SELECT set_config('ivfflat.probes', %s, true)", [str(probes)]))
+    return statements
+
+
+@instrument_mapper
 class PaperMapper:
     """This class is responsible for mapping the Paper model to the database and providing methods to fetch, create, 
     and update papers from the database."""
     
+    # Pending-work column, claim column and readiness condition of each preprocessing stage (see claim_pending). The
+    # keywords reuse the stored embedding, so a paper is only ready for them once its embedding is stored.
+    PENDING_STAGES = {
+        'embedding': ('needs_embedding', 'embedding_claimed_at', 'TRUE'),
+        'keywords': ('needs_keywords', 'keywords_claimed_at', 'NOT needs_embedding'),
+    }
+    
     def __init__(self):
         self.paper_table_name = 'researchlens_paper'
         self.author_table_name = 'researchlens_author'
@@ -22,74 +246,51 @@ class PaperMapper:
     
     def get_filtered(self, **kwargs):
         """Fetch all papers from the database ordered by publication date and filtered by the provided filtering elements.
-        Only the embedding and keywords can be filtered at the moment."""
+        Only the embedding and keywords can be filtered at the moment. Use iter_filtered for large result sets."""
+        
+        return [paper for chunk in self.iter_filtered(**kwargs) for paper in chunk]
+    
+    def get_excluded(self, **kwargs):
+        """Fetch all papers from the database ordered by publication date and that excludes paper that matches the given criterion.
+        Currently, only the embedding can be excluded. Use iter_excluded for large result sets."""
+        
+        return [paper for chunk in self.iter_excluded(**kwargs) for paper in chunk]
+    
+    def iter_filtered(self, itersize=None, **kwargs):
+        """Iterate over the papers filtered by the provided filtering elements (see get_filtered) in chunks. The rows are
+        streamed from a server-side cursor, so only one chunk of about `itersize` rows is held in memory at a time."""
         
         # Initialize the where clause filters and the corresponding parameters.
         # This will be used to build the SQL query dynamically based on the provided kwargs (filtering elements).
         filters = []
         filter_params = []
         
-        # Apply filters based on kwargs by appending it to the WHERE clause
+        # Apply filters based on kwargs by appending it to the WHERE clause. NULL can only be compared with IS NULL and
+        # the keywords are compared as JSON, so both need their own SQL.
         for key, value in kwargs.items():
             if key == 'embedding':
-                filters.append("p.embedding is %s")
-                filter_params.append(value)
+                if value is None:
+                    filters.append("p.embedding IS NULL")
+                else:
+                    filters.append("p.embedding = %s::vector")
+                    filter_params.append(value)
             elif key == 'keywords':
-                filters.append("p.keywords = %s")
-                filter_params.append(value)
-        
-        with connection.cursor() as cursor:
-            # Build the query with filters
-            query = (
-                "SELECT p.id, p.arxiv_id, p.title, p.abstract, p.keywords, p.published_date, p.link, p.categories, "
-                "a.id, a.name, a.institution "
-                "FROM researchlens_paper p "
-                "INNER JOIN researchlens_paper_authors pa ON p.id = pa.paper_id "
-                "INNER JOIN researchlens_author a ON pa.author_id = a.id "
-                f"{'WHERE ' + ' AND '.join(filters) if filters else ''} "
-                "ORDER BY p.published_date DESC;"
-            )
-            
-            # Execute the query with arguments (true parameter values)
-            cursor.execute(query, filter_params)
-            
-            # Fetch all rows and construct Paper and Author objects
-            papers = {}
-            rows = cursor.fetchall()
-            for row in rows:
-                paper_id = row[0]
-                
-                # Create a new Paper object if it doesn't exist
-                if paper_id not in papers:
-                    paper = Paper(
-                        id=row[0],
-                        arxiv_id=row[1],
-                        title=row[2].replace('\n', ' ').replace('\r', ' ').strip(),
-                        abstract=row[3].replace('\n', ' ').replace('\r', ' ').strip(),
-                        keywords=json.loads(row[4]) if row[4] else [],
-                        published_date=row[5],
-                        link=row[6],
-                        categories=row[7]
-                    )
-                    paper.authors = []
-                    papers[paper_id] = paper
-                
-                # Create a new Author object
-                author = Author(
-                    id=row[8],
-                    name=row[9],
-                    institution=row[10]
-                )
-                
-                # Avoid duplicate authors
-                if author not in papers[paper_id].authors:
-                    papers[paper_id].authors.append(author)
+                filters.append("p.keywords = %s::jsonb")
+                filter_params.append(json.dumps(value))
         
-        return list(papers.values())
+        # Build the query with filters. Every paper is one row with its authors aggregated.
+        query = (
+            f"SELECT {PAPER_COLUMNS}, NULL, {AUTHOR_COLUMNS} "
+            "FROM researchlens_paper p "
+            f"{AUTHORS_LATERAL} "
+            f"{'WHERE ' + ' AND '.join(filters) if filters else ''} "
+            "ORDER BY p.published_date DESC, p.id;"
+        )
+        return self._iter_chunks(query, filter_params, itersize)
     
-    def get_excluded(self, **kwargs):
-        """Fetch all papers from the database ordered by publication date and that excludes paper that matches the given criterion.
-        Currently, only the embedding can be excluded."""
+    def iter_excluded(self, itersize=None, **kwargs):
+        """Iterate over the papers that do not match the given criterion (see get_excluded) in chunks, including their
+        embeddings. The rows are streamed from a server-side cursor like in iter_filtered."""
         
         # Initialize the where clause filters
         filters = []
@@ -98,175 +299,79 @@ class PaperMapper:
         # Apply filters based on kwargs by appending it to the WHERE clause
         for key, value in kwargs.items():
             if key == 'embedding':
-                filters.append("p.embedding is not %s")
-                filter_params.append(value)
+                if value is None:
+                    filters.append("p.embedding IS NOT NULL")
+                else:
+                    filters.append("p.embedding IS DISTINCT FROM %s::vector")
+                    filter_params.append(value)
         
-        with connection.cursor() as cursor:
-            # Build the query with filters
-            query = (
-                "SELECT p.id, p.arxiv_id, p.title, p.abstract, p.keywords, p.published_date, p.link, p.categories, p.embedding,"
-                "a.id, a.name, a.institution "
-                "FROM researchlens_paper p "
-                "INNER JOIN researchlens_paper_authors pa ON p.id = pa.paper_id "
-                "INNER JOIN researchlens_author a ON pa.author_id = a.id "
-                f"{'WHERE ' + ' AND '.join(filters) if filters else ''} "
-                "ORDER BY p.published_date DESC;"
-            )
-            
-            # Execute the query with parameters
-            cursor.execute(query, filter_params)
-            
-            # Fetch all rows and construct Paper and Author objects
-            papers = {}
-            rows = cursor.fetchall()
-            for row in rows:
-                paper_id = row[0]
-                
-                # Create a new Paper object if it doesn't exist
-                if paper_id not in papers:
-                    paper = Paper(
-                        id=row[0],
-                        arxiv_id=row[1],
-                        title=row[2].replace('\n', ' ').replace('\r', ' ').strip(),
-                        abstract=row[3].replace('\n', ' ').replace('\r', ' ').strip(),
-                        keywords=json.loads(row[4]) if row[4] else [],
-                        published_date=row[5],
-                        link=row[6],
-                        categories=row[7],
-                        embedding=json.loads(row[8]) if row[8] is not None else None
-                    )
-                    paper.authors = []
-                    papers[paper_id] = paper
-                
-                # Create a new Author object
-                author = Author(
-                    id=row[9],
-                    name=row[10],
-                    institution=row[11]
-                )
-                
-                # Avoid duplicate authors
-                if author not in papers[paper_id].authors:
-                    papers[paper_id].authors.append(author)
+        # Build the query with filters
+        query = (
+            f"SELECT {PAPER_COLUMNS}, p.embedding, {AUTHOR_COLUMNS} "
+            "FROM researchlens_paper p "
+            f"{AUTHORS_LATERAL} "
+            f"{'WHERE ' + ' AND '.join(filters) if filters else ''} "
+            "ORDER BY p.published_date DESC, p.id;"
+        )
+        return self._iter_chunks(query, filter_params, itersize)
+    
+    def _iter_chunks(self, query, params, itersize=None):
+        """Yield lists of papers with their authors from the rows of the query (see _iter_rows). Every row is a complete
+        paper, so each batch is hydrated as it arrives."""
         
-        return list(papers.values())
+        for rows in self._iter_rows(query, params, itersize):
+            # A new hydrator per batch, so that the shared authors do not pile up over the whole result
+            yield PaperHydrator(with_embedding=True).hydrate(rows)
+    
+    def _iter_rows(self, query, params, itersize=None):
+        """Execute the query on a named (server-side) cursor and yield the rows in batches of `itersize` rows. Outside a
+        transaction Django declares the cursor WITH HOLD, so writes between two batches do not close it."""
         
-    def get(self, page=1, page_size=10, search="", start_date=None, end_date=None, categories=None):
+        itersize = itersize or settings.DB_ITERSIZE
+        with connection.chunked_cursor() as cursor:
+            # Execute the query with parameters
+            cursor.execute(query, params)
+            
+            while True:
+                rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                yield rows
+    
+    def get(self, page=1, page_size=10, search="", start_date=None, end_date=None, categories=None, order="date",
+            after=None, count="exact"):
         """Fetch a page with papers and their authors from the database ordered by publication date and filtered
-        by the provided filtering elements. The function supports pagination for lazy loading of the papers."""
+        by the provided filtering elements. The function supports pagination for lazy loading of the papers.
+        If a search text is given, the papers can be ordered by relevance (ts_rank) instead with order="relevance".
         
-        papers = {}
+        Pages are either selected with `page` (LIMIT/OFFSET) or, when ordering by date, with the keyset `after`, a
+        (published_date, id) tuple of the last paper of the previous page, so that deep pages cost the same as the first
+        one. The total number of matching papers is counted exactly (count="exact"), estimated from the query plan
+        (count="estimated") or not computed at all (count="none", total_count is None then)."""
+        
+        query = PaperListQuery(page, page_size, search, start_date, end_date, categories, order, after, count)
         with connection.cursor() as cursor:
-            # Initialize the where clause filters and parameters
-            # This will be used to build the SQL query dynamically based on the provided search
-            filters = []
-            filter_params = []
-            
-            # Apply filters based on search, start_date, end_date, and categories by appending it to the WHERE clause
-            if search != "":
-                # We use the full-text search capabilities of PostgreSQL to search in the title, abstract, and author names.
-                filters.append("to_tsvector('english', p.title || ' ' || p.abstract || ' ' || a.name) @@ plainto_tsquery('english', %s)")
-                filter_params.append(search)
-            if start_date:
-                filters.append("p.published_date >= %s")
-                filter_params.append(start_date)
-            if end_date:
-                filters.append("p.published_date <= %s")
-                filter_params.append(end_date)
-            if categories:
-                # We use the IN clause to filter by categories.
-                categories_list = categories.split(',')
-                placeholders = ', '.join(['%s'] * len(categories_list))
-                filters.append(f"p.categories IN ({placeholders})")
-                filter_params.extend(categories_list)
-            
-            if filters:
-                # Query to get the all relevant paper ids. This is needed to count the total number of papers and for
-                # the pagination. One single query for the pagination with LIMIT and OFFSET is not possible here because
-                # we get author-paper pairs and not only papers. Thus, LIMIT and OFFSET would not work correctly and return
-                # to little papers (because one paper can have multiple authors).
-                count_query = (
-                    "SELECT DISTINCT(p.id), p.published_date "
-                    "FROM researchlens_paper p "
-                    "INNER JOIN researchlens_paper_authors pa ON p.id = pa.paper_id "
-                    "INNER JOIN researchlens_author a ON pa.author_id = a.id "
-                    "WHERE " + " AND ".join(filters) + "ORDER BY p.published_date DESC;"
-                )
-            else:
-                # Same as above, but without any filters (needed to get all papers)
-                count_query = (
-                    "SELECT DISTINCT(p.id), p.published_date "
-                    "FROM researchlens_paper p "
-                    "INNER JOIN researchlens_paper_authors pa ON p.id = pa.paper_id "
-                    "INNER JOIN researchlens_author a ON pa.author_id = a.id "
-                    "ORDER BY p.published_date DESC;"
-                )
-            
-            # Execute the count query to get the total number of papers and their IDs
-            count_params = tuple(filter_params)
-            cursor.execute(count_query, count_params)
-            ids = [r[0] for r in cursor.fetchall()]
-            total_count = len(ids)
-            
-            if total_count == 0:
-                return 0, []
-            
-            # Apply pagination to the list of IDs
-            page_ids = ids[(page - 1) * page_size: page * page_size]
-            print(page_ids)
-            
-            # Execute the query with parameters
-            # Fetch papers and their authors in a single query from the database.
-            # This assumes a many-to-many relationship between papers and authors.
-            query = ("SELECT p.id, p.arxiv_id, p.title, p.abstract, p.keywords, p.published_date, p.link, p.categories, "
-                "a.id, a.name, a.institution "
-                "FROM researchlens_paper p "
-                "INNER JOIN researchlens_paper_authors pa ON p.id = pa.paper_id "
-                "INNER JOIN researchlens_author a ON pa.author_id = a.id "
-                f"WHERE p.id IN ({', '.join(['%s'] * len(page_ids))}) "  # Use IN clause for pagination
-                "ORDER BY p.published_date DESC ")
-            cursor.execute(query, page_ids)
+            total_count = None
+            count_statement = query.count_statement()
+            if count_statement:
+                cursor.execute(*count_statement)
+                total_count = query.total_count(cursor.fetchone())
+                if total_count == 0:
+                    return 0, []
             
+            cursor.execute(*query.page_statement())
             
-            # Fetch all rows and construct Paper and Author objects
-            rows = cursor.fetchall()
-            for row in rows:
-                paper_id = row[0]
-                
-                # Create a new Paper object if it doesn't exist
-                if paper_id not in papers:
-                    paper = Paper(
-                        id=row[0],
-                        arxiv_id=row[1],
-                        title=row[2].replace('\n', ' ').replace('\r', ' ').strip(),
-                        abstract=row[3].replace('\n', ' ').replace('\r', ' ').strip(),
-                        keywords=json.loads(row[4]) if row[4] else [],
-                        published_date=row[5],
-                        link=row[6],
-                        categories=row[7]
-                    )
-                    paper.authors = []
-                    papers[paper_id] = paper
-                
-                # Create a new Author object
-                author = Author(
-                    id=row[8],
-                    name=row[9],
-                    institution=row[10]
-                )
-                
-                # Avoid duplicate authors
-                if author not in papers[paper_id].authors:
-                    papers[paper_id].authors.append(author)
-                    
-        return total_count, list(papers.values())
+            # Construct the Paper and Author objects from the rows
+            papers = PaperHydrator().hydrate(cursor.fetchall())
+        
+        return total_count, papers
     
     def get_by_arxiv_id(self, arxiv_id):
         """Fetch a paper by its ID and return it."""
         
         with connection.cursor() as cursor:
             # Query to get the paper
-            query = ("SELECT p.id, p.arxiv_id, p.title, p.abstract, p.keywords, p.published_date, p.link, p.categories "
+            query = (f"SELECT {PAPER_COLUMNS} "
                 "FROM researchlens_paper p "
                 "WHERE p.arxiv_id = %s")
             cursor.execute(query, [arxiv_id])
@@ -275,20 +380,35 @@ class PaperMapper:
             if not row:
                 return None
             
-            # Fetch all rows and construct Paper and Author objects
-            paper = Paper(
-                id=row[0],
-                arxiv_id=row[1],
-                title=row[2].replace('\n', ' ').replace('\r', ' ').strip(),
-                abstract=row[3].replace('\n', ' ').replace('\r', ' ').strip(),
-                keywords=json.loads(row[4]) if row[4] else [],
-                published_date=row[5],
-                link=row[6],
-                categories=row[7]
+        return paper_from_row(row)
+    
+    def get_embeddings(self, paper_ids):
+        """Fetch the embeddings of the given papers. Returns an id array and a contiguous (n, 384) float32 matrix of the
+        papers that have an embedding, in the order of the ids."""
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, embedding FROM researchlens_paper WHERE id = ANY(%s) AND embedding IS NOT NULL ORDER BY id",
+                [list(paper_ids)]
             )
-            paper.authors = []
-            
-        return paper
+            rows = cursor.fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64), to_matrix([row[1] for row in rows])
+    
+    def get_sample_abstracts(self, limit=256):
+        """Fetch the abstracts of the most recently published papers, e.g. to benchmark the encoders."""
+        
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT abstract FROM researchlens_paper ORDER BY published_date DESC LIMIT %s", [limit])
+            return [row[0] for row in cursor.fetchall()]
+    
+    def iter_embedding_blocks(self, block_size=1024):
+        """Iterate over the embeddings of all embedded papers in blocks of `block_size` papers. Each block is a tuple of
+        an id array and a float32 matrix with one row per paper. The rows are streamed from a server-side cursor (see
+        _iter_rows), so only one block is held in memory at a time and the corpus is read with a single query."""
+        
+        query = "SELECT id, embedding FROM researchlens_paper WHERE embedding IS NOT NULL ORDER BY id"
+        for rows in self._iter_rows(query, [], block_size):
+            yield np.array([row[0] for row in rows], dtype=np.int64), to_matrix([row[1] for row in rows])
     
     def get_or_create(self, arxiv_id, defaults):
         """Get or create a paper by arxiv_id. If the paper does not exist, it will be created with the given parameters."""
@@ -300,17 +420,104 @@ class PaperMapper:
             
         with connection.cursor() as cursor:
             # If not found, create a new paper by inserting it into the database
+            title = normalize_text(defaults["title"])
+            abstract = normalize_text(defaults["abstract"])
             cursor.execute(
                 "INSERT INTO researchlens_paper (arxiv_id, title, abstract, published_date, categories, keywords, link)"
                 "VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id",
-                (arxiv_id, defaults["title"], defaults["abstract"], defaults["published_date"], defaults["categories"], [], defaults["link"])
+                (arxiv_id, title, abstract, defaults["published_date"], defaults["categories"], [], defaults["link"])
             )
             paper_id = cursor.fetchone()[0]
             
             # And return newly created paper
             return Paper(id=paper_id, arxiv_id=arxiv_id,
-                         title=defaults["title"], abstract=defaults["abstract"],
-                         published_date=defaults["published_date"], categories=["categories"], link=defaults["link"]), True
+                         title=title, abstract=abstract,
+                         published_date=defaults["published_date"], categories=defaults["categories"], link=defaults["link"]), True
+    
+    def bulk_ingest(self, entries):
+        """Store a whole page of parsed arXiv entries with a few set-based statements instead of several round-trips per
+        entry. Each entry is a dict with the keys arxiv_id, title, abstract, published_date, categories, link and
+        authors (a list of author names). Papers that already exist are kept as they are, but their authors are
+        replaced by the authors of the entry. The titles, abstracts and author names are normalized here, so that they
+        can be read without further processing. Returns the stored papers (with their authors) and the number of newly
+        created papers."""
+        
+        # Remove duplicate entries and duplicate author names within an entry. Concurrent pages may share papers and
+        # authors, so all rows are locked in a fixed order (papers by arXiv id, authors by name, removed links by paper
+        # and author id, new links by paper id and byline position); otherwise two transactions could lock the same rows
+        # in opposite order and deadlock.
+        entries = {entry['arxiv_id']: entry for entry in entries}
+        feed_order = list(entries)
+        entries = [entries[arxiv_id] for arxiv_id in sorted(entries)]
+        if not entries:
+            return [], 0
+        entry_authors = {
+            entry['arxiv_id']: list(dict.fromkeys(
+                name for name in (normalize_text(name)[:255] for name in entry['authors']) if name
+            ))
+            for entry in entries
+        }
+        author_names = sorted({name for names in entry_authors.values() for name in names})
+        arxiv_ids = [entry['arxiv_id'] for entry in entries]
+        
+        with transaction.atomic(), connection.cursor() as cursor:
+            # 1. Resolve the authors of the page (cached names are not looked up again, missing ones are created)
+            authors = author_resolver.resolve_many(author_names)
+            
+            # 2. Insert all new papers and look up the ids of all papers of the page
+            cursor.execute(
+                "INSERT INTO researchlens_paper (arxiv_id, title, abstract, published_date, categories, keywords, link) "
+                "SELECT v.arxiv_id, v.title, v.abstract, v.published_date, v.categories, '[]'::jsonb, v.link "
+                "FROM unnest(%s::text[], %s::text[], %s::text[], %s::date[], %s::text[], %s::text[]) "
+                "AS v(arxiv_id, title, abstract, published_date, categories, link) "
+                "ORDER BY v.arxiv_id "
+                "ON CONFLICT (arxiv_id) DO NOTHING",
+                [arxiv_ids,
+                 [normalize_text(entry['title']) for entry in entries],
+                 [normalize_text(entry['abstract']) for entry in entries],
+                 [entry['published_date'] for entry in entries],
+                 [entry['categories'] for entry in entries],
+                 [entry['link'] for entry in entries]]
+            )
+            created = cursor.rowcount
+            cursor.execute(
+                f"SELECT {PAPER_COLUMNS} FROM researchlens_paper p WHERE p.arxiv_id = ANY(%s)",
+                [arxiv_ids]
+            )
+            papers = {row[1]: paper_from_row(row) for row in cursor.fetchall()}
+            
+            # 3. Replace the paper-author links: remove links that are not part of the page anymore and add new ones
+            # The authors are aggregated in the order their links were inserted (see AUTHORS_LATERAL), so the links
+            # of a paper are inserted in the order of its byline.
+            links = []
+            for entry in entries:
+                paper = papers[entry['arxiv_id']]
+                paper.authors = [authors[name] for name in entry_authors[entry['arxiv_id']]]
+                links.extend((paper.id, position, author.id) for position, author in enumerate(paper.authors))
+            links.sort()
+            link_paper_ids = [paper_id for paper_id, _, _ in links]
+            link_author_ids = [author_id for _, _, author_id in links]
+            
+            # The links to remove are locked in the order of their paper and author id before they are deleted
+            cursor.execute(
+                "DELETE FROM researchlens_paper_authors WHERE id IN ("
+                "SELECT pa.id FROM researchlens_paper_authors pa "
+                "WHERE pa.paper_id = ANY(%s) AND NOT EXISTS ("
+                "SELECT 1 FROM unnest(%s::bigint[], %s::bigint[]) AS l(paper_id, author_id) "
+                "WHERE l.paper_id = pa.paper_id AND l.author_id = pa.author_id) "
+                "ORDER BY pa.paper_id, pa.author_id FOR UPDATE)",
+                [sorted(paper.id for paper in papers.values()), link_paper_ids, link_author_ids]
+            )
+            cursor.execute(
+                "INSERT INTO researchlens_paper_authors (paper_id, author_id) "
+                "SELECT l.paper_id, l.author_id "
+                "FROM unnest(%s::bigint[], %s::bigint[]) WITH ORDINALITY AS l(paper_id, author_id, position) "
+                "ORDER BY l.position "
+                "ON CONFLICT (paper_id, author_id) DO NOTHING",
+                [link_paper_ids, link_author_ids]
+            )
+        
+        return [papers[arxiv_id] for arxiv_id in feed_order], created
     
     def update(self, paper):
         """Add authors, keywords, and embeddings to a paper. If the author does not exist, it will be created."""
@@ -318,8 +525,9 @@ class PaperMapper:
         with connection.cursor() as cursor:
             # Update the keywords and embedding of the paper
             cursor.execute(
-                "UPDATE researchlens_paper SET keywords = %s, embedding = %s WHERE id = %s",
-                [json.dumps(paper.keywords), paper.embedding, paper.id]
+                "UPDATE researchlens_paper SET keywords = %s, embedding = %s, needs_keywords = FALSE, "
+                "needs_embedding = %s, keywords_claimed_at = NULL, embedding_claimed_at = NULL WHERE id = %s",
+                [json.dumps(paper.keywords), paper.embedding, paper.embedding is None, paper.id]
             )
             
             # Remove all existing authors for the paper to avoid duplicates. It also ensures that authors will be removed
@@ -336,8 +544,220 @@ class PaperMapper:
                     "INSERT INTO researchlens_paper_authors (paper_id, author_id) VALUES (%s, %s)",
                     [paper.id, author_obj.id]
                 )
+
+    def claim_pending(self, stage, limit=None, lease_seconds=None):
+        """Claim up to `limit` papers that still need the given stage ('embedding' or 'keywords') and return them with
+        their id, arXiv id, title, abstract and embedding. The pending papers are found through the partial indexes of
+        migration 0008, so the cost depends on the number of claimed papers and not on the size of the corpus. Rows
+        claimed by another worker are skipped; a claim expires after `lease_seconds`, so the papers of a crashed worker
+        are picked up again. The claim is released when the stage stores its results (see bulk_update_embeddings and
+        bulk_update_keywords). Papers are only claimed for their keywords once their embedding is stored, so the keyword
+        stage reuses it and never encodes an abstract that another worker is still embedding."""
+        
+        if stage not in self.PENDING_STAGES:
+            raise ValueError(f"Unknown stage '{stage}', expected one of {', '.join(self.PENDING_STAGES)}")
+        
+        pending_column, claimed_column, ready = self.PENDING_STAGES[stage]
+        limit = limit or settings.DB_ITERSIZE
+        lease_seconds = lease_seconds if lease_seconds is not None else settings.PENDING_CLAIM_LEASE_SECONDS
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE researchlens_paper p SET {claimed_column} = now() "
+                "WHERE p.id IN ("
+                f"SELECT id FROM researchlens_paper WHERE {pending_column} AND {ready} "
+                f"AND ({claimed_column} IS NULL OR {claimed_column} < now() - make_interval(secs => %s)) "
+                "ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED) "
+                "RETURNING p.id, p.arxiv_id, p.title, p.abstract, p.embedding",
+                [lease_seconds, limit]
+            )
+            rows = cursor.fetchall()
+        
+        papers = [
+            Paper(id=row[0], arxiv_id=row[1], title=row[2], abstract=row[3], embedding=to_vector(row[4]))
+            for row in rows
+        ]
+        papers.sort(key=lambda paper: paper.id)
+        return papers
+    
+    def count_pending(self):
+        """Return the number of papers that still need an embedding and keywords."""
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT (SELECT count(*) FROM researchlens_paper WHERE needs_embedding), "
+                "(SELECT count(*) FROM researchlens_paper WHERE needs_keywords)"
+            )
+            row = cursor.fetchone()
+        return {'embedding': row[0], 'keywords': row[1]}
+    
+    def bulk_update_keywords(self, paper_ids, keywords):
+        """Store the keywords of several papers with a single UPDATE statement and mark them as done."""
+        
+        if len(paper_ids) == 0:
+            return 0
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE researchlens_paper p SET keywords = v.keywords::jsonb, needs_keywords = FALSE, "
+                "keywords_claimed_at = NULL "
+                "FROM unnest(%s::bigint[], %s::text[]) AS v(id, keywords) "
+                "WHERE p.id = v.id",
+                [list(paper_ids), [json.dumps(paper_keywords) for paper_keywords in keywords]]
+            )
+            return cursor.rowcount
+    
+    def bulk_update_embeddings(self, paper_ids, embeddings):
+        """Store the embeddings of several papers and mark them as done. With psycopg 3, the vectors are copied in the
+        binary format of pgvector (through the registered dumper) into a temporary table, which is joined to the papers
+        with a single UPDATE. With psycopg2, the NumPy arrays are adapted by the registered pgvector adapter and sent as
+        an array of vectors."""
+        
+        if len(paper_ids) == 0:
+            return 0
+        
+        paper_ids = np.asarray(paper_ids, dtype=np.int64).tolist()
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with transaction.atomic(), connection.cursor() as cursor:
+            if is_psycopg3:
+                # The temporary table is kept for the session and emptied before every batch
+                cursor.execute(
+                    "CREATE TEMPORARY TABLE IF NOT EXISTS embedding_update (id bigint, embedding vector(384))"
+                )
+                cursor.execute("TRUNCATE embedding_update")
+                with cursor.copy("COPY embedding_update (id, embedding) FROM STDIN (FORMAT BINARY)") as copy:
+                    copy.set_types(['int8', 'vector'])
+                    for paper_id, embedding in zip(paper_ids, embeddings):
+                        copy.write_row((paper_id, embedding))
+                cursor.execute(
+                    "UPDATE researchlens_paper p SET embedding = v.embedding, needs_embedding = FALSE, "
+                    "embedding_claimed_at = NULL "
+                    "FROM embedding_update v "
+                    "WHERE p.id = v.id"
+                )
+            else:
+                cursor.execute(
+                    "UPDATE researchlens_paper p SET embedding = v.embedding, needs_embedding = FALSE, "
+                    "embedding_claimed_at = NULL "
+                    "FROM unnest(%s::bigint[], %s::vector[]) AS v(id, embedding) "
+                    "WHERE p.id = v.id",
+                    [paper_ids, list(embeddings)]
+                )
+            return cursor.rowcount
                 
 
+@instrument_mapper
+class AuthorResolver:
+    """This class is responsible for resolving author names to authors. It keeps a bounded least recently used cache of
+    name -> author in the process and resolves (and creates) all names that are not cached with a single query. The
+    hit and miss counters show how well the cache works during large crawls."""
+    
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+    
+    def _store(self, authors):
+        """Add the given authors to the cache and evict the least recently used ones."""
+        
+        with self._lock:
+            for author in authors:
+                self._cache[author.name] = author
+                self._cache.move_to_end(author.name)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+    
+    def resolve_many(self, names):
+        """Return a dict of name -> Author for the given names. Authors that do not exist yet are created."""
+        
+        resolved = {}
+        missing = []
+        with self._lock:
+            for name in dict.fromkeys(names):
+                author = self._cache.get(name)
+                if author is None:
+                    missing.append(name)
+                else:
+                    self._cache.move_to_end(name)
+                    resolved[name] = author
+            self.hits += len(resolved)
+            self.misses += len(missing)
+        
+        if not missing:
+            return resolved
+        
+        with connection.cursor() as cursor:
+            # Insert the names that do not exist yet and return them together with the existing ones. The SELECT does
+            # not see the rows inserted by the same statement, so each author is returned exactly once. The names are
+            # inserted in sorted order, so that concurrent transactions wait for each other instead of deadlocking.
+            cursor.execute(
+                "WITH input AS (SELECT DISTINCT unnest(%s::text[]) AS name), "
+                "inserted AS ("
+                "INSERT INTO researchlens_author (name) "
+                "SELECT i.name FROM input i "
+                "WHERE NOT EXISTS (SELECT 1 FROM researchlens_author a WHERE a.name = i.name) "
+                "ORDER BY i.name "
+                "ON CONFLICT (name) DO NOTHING "
+                "RETURNING id, name, institution) "
+                "SELECT id, name, institution, true FROM inserted "
+                "UNION ALL "
+                "SELECT a.id, a.name, a.institution, false FROM researchlens_author a INNER JOIN input i ON a.name = i.name",
+                [missing]
+            )
+            rows = cursor.fetchall()
+            with self._lock:
+                self.queries += 1
+            
+            # Names inserted by a concurrent transaction are neither inserted nor visible to the statement above
+            found = {row[1] for row in rows}
+            concurrent = [name for name in missing if name not in found]
+            if concurrent:
+                cursor.execute(
+                    "SELECT id, name, institution, false FROM researchlens_author WHERE name = ANY(%s)", [concurrent]
+                )
+                rows += cursor.fetchall()
+                with self._lock:
+                    self.queries += 1
+        
+        existing, created = [], []
+        for row in rows:
+            author = Author(id=row[0], name=row[1], institution=row[2])
+            resolved[author.name] = author
+            (created if row[3] else existing).append(author)
+        
+        # Newly created authors are only cached once the transaction is committed, so that a rollback does not leave
+        # ids in the cache that do not exist in the database
+        self._store(existing)
+        transaction.on_commit(lambda: self._store(created))
+        return resolved
+    
+    def stats(self):
+        """Return the cache counters."""
+        
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+            'queries': self.queries,
+        }
+    
+    def clear(self):
+        """Remove all authors from the cache and reset the counters."""
+        
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = self.queries = 0
+
+
+# One author cache per process
+author_resolver = AuthorResolver(max_size=settings.AUTHOR_CACHE_SIZE)
+
+
+@instrument_mapper
 class AuthorMapper:
     """This class is responsible for mapping the Author model to the database and providing methods to fetch, create,
     and update authors from the database."""
@@ -375,88 +795,166 @@ class AuthorMapper:
             
         # Return the newly created author
         return Author(id=row[0], name=row[1], institution=row[2]), True
+    
+    def resolve_many(self, names):
+        """Resolve several author names at once (creating missing authors) using the process-wide author cache."""
+        
+        return author_resolver.resolve_many(names)
 
 
+@instrument_mapper
 class RelatedPaperMapper:
-    """This class is responsible for fetching related papers based on the embedding similarity (L2 norm) from the database."""
+    """This class is responsible for fetching related papers based on the embedding similarity (cosine distance) from the
+    database. The nearest neighbours are found with the approximate HNSW index on the embeddings (see migration 0006)."""
     
     def __init__(self):
         self.paper_table_name = 'researchlens_paper'
         self.paper_similarity_table_name = 'researchlens_papersimilarity'
     
-    def get(self, paper_id):
-        """Fetch 10 related papers for the paper with the given ID based on the embedding similarity (L2 norm)."""
+    def get_related_ids(self, paper_id, limit=10, ef_search=None, probes=None, exact=False):
+        """Return the ids of the `limit` papers closest to the paper with the given ID (cosine distance). `ef_search`
+        (HNSW) and `probes` (IVFFlat) trade recall for speed and default to the VECTOR_SEARCH_EF_SEARCH and
+        VECTOR_SEARCH_PROBES settings. With exact=True the index is bypassed, which is used to measure the recall."""
         
-        papers = {}
-        with connection.cursor() as cursor:
+        # The search parameters are set for the current transaction only
+        with transaction.atomic(), connection.cursor() as cursor:
             # Load the embedding of the paper
-            cursor.execute("SELECT embedding FROM researchlens_paper WHERE id = %s", [paper_id])
+            cursor.execute(PAPER_EMBEDDING_QUERY, [paper_id])
             row = cursor.fetchone()
-            if not row:
-                return []
-            embedding = row[0]
-            if not embedding:
+            if not row or row[0] is None:
                 return []
             
-            # Query to get the related papers based on the embedding (we sort by cosine similarity)
-            query = (
-                "SELECT id "
-                "FROM researchlens_paper "
-                "WHERE id <> %s "
-                "ORDER BY embedding <-> %s ASC " # <-> is the operator for L2 distance in pgvector
-                "LIMIT 10;" 
+            for statement in vector_search_statements(ef_search, probes, exact):
+                cursor.execute(*statement)
+            
+            # Query to get the related papers based on the embedding
+            cursor.execute(RELATED_IDS_QUERY, [paper_id, row[0], limit])
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get_sample_ids(self, limit=100):
+        """Return the ids of randomly chosen papers that have an embedding, e.g. to measure the recall of the index."""
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM researchlens_paper WHERE embedding IS NOT NULL ORDER BY random() LIMIT %s", [limit]
             )
-            cursor.execute(query, [paper_id, embedding])
-            related_ids = [row[0] for row in cursor.fetchall()]
-            if not related_ids:
-                return []
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get(self, paper_id, ef_search=None, probes=None):
+        """Fetch the 10 (RELATED_PAPERS_K) related papers for the paper with the given ID based on the embedding
+        similarity (cosine distance)."""
+        
+        with connection.cursor() as cursor:
+            # Read the materialized neighbours of the paper together with their authors in one round trip
+            cursor.execute(NEIGHBOUR_PAPERS_QUERY, [paper_id, settings.RELATED_PAPERS_K])
+            rows = cursor.fetchall()
             
-            # Fetch papers and their authors in a single query from the database.
-            # This assumes a many-to-many relationship between papers and authors.
-            query = ("SELECT p.id, p.arxiv_id, p.title, p.abstract, p.keywords, p.published_date, p.link, p.categories, "
-                "a.id, a.name, a.institution "
-                "FROM researchlens_paper p "
-                "INNER JOIN researchlens_paper_authors pa ON p.id = pa.paper_id "
-                "INNER JOIN researchlens_author a ON pa.author_id = a.id "
-                f"WHERE p.id IN ({', '.join(['%s'] * len(related_ids))}) "  # Use IN clause
-                "ORDER BY p.published_date DESC ")
-            cursor.execute(query, related_ids)
+            # Only papers that were not processed by the similarity stage yet fall back to the live vector search
+            if not rows:
+                related_ids = self.get_related_ids(
+                    paper_id, limit=settings.RELATED_PAPERS_K, ef_search=ef_search, probes=probes
+                )
+                if not related_ids:
+                    return []
+                cursor.execute(PAPERS_BY_IDS_QUERY, [related_ids])
+                rows = cursor.fetchall()
             
+            # Construct the Paper and Author objects from the rows
+            return PaperHydrator().hydrate(rows)
+
+
+@instrument_mapper
+class PaperNeighbourMapper:
+    """This class is responsible for the materialized top-k neighbours of each paper, which are used to serve related
+    papers with a single indexed lookup. The lists are maintained incrementally by the similarity stage."""
+    
+    def __init__(self):
+        self.paper_neighbour_table_name = 'researchlens_paperneighbour'
+    
+    def get_neighbour_ids(self, paper_id, limit=10):
+        """Fetch the ids of the closest neighbours of a paper. An empty list means that the paper was not processed yet."""
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT neighbour_id FROM researchlens_paperneighbour "
+                "WHERE paper_id = %s "
+                "ORDER BY similarity_score DESC "
+                "LIMIT %s",
+                [paper_id, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get_thresholds(self, paper_ids, k):
+        """Return a dict of paper id -> score a new neighbour has to beat to enter the top-k list of the paper. Papers
+        with less than k neighbours, including papers without any neighbour rows yet, accept every neighbour."""
+        
+        paper_ids = np.asarray(paper_ids, dtype=np.int64).tolist()
+        if len(paper_ids) == 0:
+            return {}
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT paper_id, count(*), min(similarity_score) FROM researchlens_paperneighbour "
+                "WHERE paper_id = ANY(%s) GROUP BY paper_id",
+                [paper_ids]
+            )
+            thresholds = dict.fromkeys(paper_ids, float('-inf'))
+            thresholds.update({row[0]: row[2] for row in cursor.fetchall() if row[1] >= k})
+            return thresholds
+    
+    def replace(self, paper_ids, source_ids, neighbour_ids, scores):
+        """Replace the neighbour lists of the given papers with the given (paper id, neighbour id, score) rows."""
+        
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM researchlens_paperneighbour WHERE paper_id = ANY(%s)",
+                [np.asarray(paper_ids, dtype=np.int64).tolist()]
+            )
+            if len(source_ids) == 0:
+                return 0
+            cursor.execute(
+                "INSERT INTO researchlens_paperneighbour (paper_id, neighbour_id, similarity_score) "
+                "SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::float8[])",
+                [np.asarray(source_ids, dtype=np.int64).tolist(),
+                 np.asarray(neighbour_ids, dtype=np.int64).tolist(),
+                 np.asarray(scores, dtype=np.float64).tolist()]
+            )
+            return cursor.rowcount
+    
+    def merge(self, paper_ids, neighbour_ids, scores, k=10):
+        """Add the given (paper id, neighbour id, score) rows to the neighbour lists and cut the affected lists back to
+        the k closest neighbours. Returns the number of added or updated rows."""
+        
+        if len(paper_ids) == 0:
+            return 0
+        
+        paper_ids = np.asarray(paper_ids, dtype=np.int64)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO researchlens_paperneighbour (paper_id, neighbour_id, similarity_score) "
+                "SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::float8[]) "
+                "ON CONFLICT (paper_id, neighbour_id) DO UPDATE SET similarity_score = EXCLUDED.similarity_score",
+                [paper_ids.tolist(),
+                 np.asarray(neighbour_ids, dtype=np.int64).tolist(),
+                 np.asarray(scores, dtype=np.float64).tolist()]
+            )
+            merged = cursor.rowcount
             
-            # Fetch all rows and construct Paper and Author objects
-            rows = cursor.fetchall()
-            for row in rows:
-                paper_id = row[0]
-                
-                # Create a new Paper object if it doesn't exist
-                if paper_id not in papers:
-                    paper = Paper(
-                        id=row[0],
-                        arxiv_id=row[1],
-                        title=row[2].replace('\n', ' ').replace('\r', ' ').strip(),
-                        abstract=row[3].replace('\n', ' ').replace('\r', ' ').strip(),
-                        keywords=json.loads(row[4]) if row[4] else [],
-                        published_date=row[5],
-                        link=row[6],
-                        categories=row[7]
-                    )
-                    paper.authors = []
-                    papers[paper_id] = paper
-                
-                # Create a new Author object
-                author = Author(
-                    id=row[8],
-                    name=row[9],
-                    institution=row[10]
-                )
-                
-                # Avoid duplicate authors
-                if author not in papers[paper_id].authors:
-                    papers[paper_id].authors.append(author)
-                    
-        return list(papers.values())
+            # Remove the neighbours that dropped out of the top-k
+            cursor.execute(
+                "DELETE FROM researchlens_paperneighbour n "
+                "USING ("
+                "SELECT paper_id, neighbour_id, "
+                "row_number() OVER (PARTITION BY paper_id ORDER BY similarity_score DESC, neighbour_id) AS position "
+                "FROM researchlens_paperneighbour WHERE paper_id = ANY(%s)"
+                ") r "
+                "WHERE n.paper_id = r.paper_id AND n.neighbour_id = r.neighbour_id AND r.position > %s",
+                [np.unique(paper_ids).tolist(), k]
+            )
+            return merged
 
 
+@instrument_mapper
 class PaperSimilarityMapper:
     """This class is responsible for mapping the PaperSimilarity model to the database and providing methods to fetch, create, and update paper similarities from the database."""
     
@@ -483,6 +981,25 @@ class PaperSimilarityMapper:
                 'similarity_score': row[2]
             }
     
+    def bulk_create(self, source_paper_ids, target_paper_ids, similarity_scores):
+        """Insert several paper similarities with a single statement. Pairs that already exist are skipped (guarded
+        by the unique constraint on source and target paper). Returns the number of inserted pairs."""
+        
+        if len(source_paper_ids) == 0:
+            return 0
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO researchlens_papersimilarity (source_paper_id, target_paper_id, similarity_score) "
+                "SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::float8[]) "
+                "ON CONFLICT (source_paper_id, target_paper_id) DO NOTHING",
+                # Convert NumPy arrays into lists of Python numbers, which the database driver can adapt
+                [np.asarray(source_paper_ids, dtype=np.int64).tolist(),
+                 np.asarray(target_paper_ids, dtype=np.int64).tolist(),
+                 np.asarray(similarity_scores, dtype=np.float64).tolist()]
+            )
+            return cursor.rowcount
+    
     def get_or_create(self, source_paper_id, target_paper_id, similarity_score):
         """Get or create a paper similarity by source and target paper IDs. If the similarity does not exist, it will be created with the given parameters."""
         
@@ -0,0 +1,63 @@
+"""
+This module registers the pgvector type adapters on the Django database connections, so that `vector` columns arrive as
+float32 NumPy arrays instead of their text form, and NumPy arrays can be passed as query parameters. With psycopg 3 the
+adapters also support the binary format, which PaperMapper.bulk_update_embeddings uses to copy the embeddings. It also
+provides the helpers the mappers use to turn vector values into NumPy arrays and matrices, which still accept the text
+form in case the adapters could not be registered (e.g. before the vector extension is created).
+"""
+
+import numpy as np
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Dimension of the all-MiniLM-L6-v2 embeddings
+EMBEDDING_DIMENSION = 384
+
+_registered_globally = False
+
+
+@receiver(connection_created)
+def register_vector_types(sender, connection, **kwargs):
+    """Register the pgvector adapters for every new PostgreSQL connection."""
+
+    global _registered_globally
+    if connection.vendor != 'postgresql':
+        return
+
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    try:
+        if is_psycopg3:
+            # psycopg 3 keeps the adapters per connection
+            from pgvector.psycopg import register_vector
+            register_vector(connection.connection)
+        elif not _registered_globally:
+            # psycopg2 typecasters can be registered once for all connections of the process
+            from pgvector.psycopg2 import register_vector
+            register_vector(connection.connection, globally=True)
+            _registered_globally = True
+    except Exception as e:
+        # The vector extension does not exist yet (e.g. while running the initial migration)
+        print(f"Could not register the pgvector types: {e}")
+
+
+def to_vector(value):
+    """Convert a vector value returned by the database into a float32 NumPy array."""
+
+    if value is None:
+        return None
+    if isinstance(value, np.ndarray):
+        return value.astype(np.float32, copy=False)
+    if hasattr(value, 'to_numpy'):
+        return value.to_numpy().astype(np.float32, copy=False)
+    # Text form '[0.1,0.2,...]'
+    return np.array(value[1:-1].split(','), dtype=np.float32)
+
+
+def to_matrix(values, dimension=EMBEDDING_DIMENSION):
+    """Convert a sequence of vector values into a contiguous (n, dimension) float32 matrix."""
+
+    matrix = np.empty((len(values), dimension), dtype=np.float32)
+    for i, value in enumerate(values):
+        matrix[i] = to_vector(value)
+    return matrix
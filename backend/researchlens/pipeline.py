@@ -0,0 +1,478 @@
+"""
+This module contains the staged ingest pipeline of the ResearchLens preprocessing task. Instead of fetching a page,
+processing it and sleeping before the next request, the pipeline runs three stages concurrently, connected by bounded
+queues:
+
+1. The fetch stage downloads the Atom feed pages of all categories from the arXiv API and parses them while they are
+   being downloaded. The entries are handed on in small batches, so storing starts before a page is complete.
+2. The store stage stores the papers and their authors.
+3. The enrich stage (in the calling thread) computes the embeddings, keywords and similarity graph of the stored papers.
+
+While the models run, the next pages are already being downloaded, so the total crawl time approaches the slower of
+network and compute instead of their sum. The queues are bounded, so the fetch stage never runs far ahead of the
+models. The requests to arXiv are spaced by a rate limiter that is shared by all worker processes (through the Redis
+cache), which keeps us within the politeness interval of the arXiv API across all categories and concurrent crawls.
+The fetch, parse and rate limiting helpers are also used by the Celery sub-tasks in tasks.py.
+"""
+
+import math
+import os
+import queue
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import response_cache
+from .feed_cache import feed_cache
+from .job_progress import JobProgress
+from .embedding import EmbeddingStage
+from .keywords import KeywordStage
+from .object_relational_mapper import PaperMapper, author_resolver
+from .similarity import SimilarityGraphBuilder
+
+# Map categories to human-readable names
+ARXIV_CATEGORY_MAP = {
+    'cs': 'Computer Science',
+    'math': 'Mathematics',
+    'stat': 'Statistics',
+    'econ': 'Economics',
+    'physics': 'Physics',
+    'q-bio': 'Quantitative Biology',
+    'q-fin': 'Quantitative Finance'
+}
+
+# Header to identify our application
+ARXIV_HEADERS = {
+    "User-Agent": "ResearchLens/0.1 (mailto:shahilabdul001@gmail.com,janhagnberger@gmail.com)"
+}
+
+# Qualified names of the Atom elements we read (iterparse reports tags as {namespace}name)
+ATOM = '{http://www.w3.org/2005/Atom}'
+ATOM_ENTRY = ATOM + 'entry'
+ATOM_ID = ATOM + 'id'
+ATOM_TITLE = ATOM + 'title'
+ATOM_SUMMARY = ATOM + 'summary'
+ATOM_PUBLISHED = ATOM + 'published'
+ATOM_AUTHOR = ATOM + 'author'
+ATOM_NAME = ATOM + 'name'
+
+# Errors that can occur while a feed is streamed and parsed
+FEED_ERRORS = (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, ET.ParseError)
+
+# Maximum number of papers per request to the arXiv API
+MAX_RESULTS_PER_PAGE = 100
+
+
+class TokenBucket:
+    """This class is responsible for limiting the rate of requests. A request takes one token from the bucket; tokens
+    are refilled at `rate` tokens per second up to `capacity`. The bucket is thread-safe, so one bucket can govern all
+    fetchers of the process."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a token is available and take it. Returns the number of seconds we waited."""
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class SharedRateLimiter:
+    """This class is responsible for spacing requests across all worker processes and containers. A request may only
+    start after taking the slot, a key in the shared cache that expires after the interval (rounded up to whole seconds,
+    the resolution of cache timeouts). If the cache is not reachable, the limiter falls back to a token bucket of the
+    current process."""
+
+    def __init__(self, key, interval, poll_interval=0.25):
+        self.key = key
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self._local = TokenBucket(rate=1 / interval)
+
+    def acquire(self):
+        """Wait until the slot is free and take it. Returns the number of seconds we waited."""
+
+        waited = 0.0
+        while True:
+            try:
+                if cache.add(self.key, 1, timeout=max(1, math.ceil(self.interval))):
+                    return waited
+            except Exception as e:
+                print(f"Shared rate limiter unavailable, using the local one: {e}")
+                return waited + self._local.acquire()
+            time.sleep(self.poll_interval)
+            waited += self.poll_interval
+
+
+# Shared by all pipelines and fetch tasks, so concurrent crawls together respect the arXiv politeness interval
+arxiv_limiter = SharedRateLimiter('researchlens:arxiv_request_slot', settings.ARXIV_REQUEST_INTERVAL)
+
+
+def create_session():
+    """Create a requests session that retries failed requests with an exponential backoff. The session keeps a pool of
+    open connections, so the TLS connection to arXiv is reused across requests."""
+
+    session = requests.Session()
+    retries = Retry(
+        total=3,               # Retry up to 3 times
+        backoff_factor=1,      # Wait 1s, 2s, then 4s
+        status_forcelist=[429, 500, 502, 503, 504],  # Retry on these codes
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(max_retries=retries, pool_connections=1, pool_maxsize=settings.ARXIV_POOL_SIZE)
+    session.mount("https://", adapter)
+    return session
+
+
+# One session per worker process, shared by the tasks and pipeline threads of the process
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the pooled session of the current worker process, creating it on first use. A forked process does not
+    reuse the connections of its parent."""
+
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = create_session()
+            _session_pid = os.getpid()
+        return _session
+
+
+def page_url(category, start, max_results):
+    """Return the arXiv API query URL of one page of the Atom feed of the category."""
+
+    return (f"https://export.arxiv.org/api/query?search_query=cat:{category}.*"
+            f"&start={start}&max_results={max_results}")
+
+
+def needs_request(url):
+    """Whether fetching the URL goes to the network (and thus has to wait for the rate limiter)."""
+
+    return not feed_cache.offline and not feed_cache.contains(url)
+
+
+def fetch_page(session, url):
+    """Fetch one page of the Atom feed from the arXiv API or the feed cache (see feed_cache.py). Returns a file-like
+    stream of the response body (XML), which is downloaded while it is read, or None if the request failed."""
+
+    cached = feed_cache.open(url)
+    if cached is not None:
+        return cached
+    if feed_cache.offline:
+        print(f"Failed to fetch papers: {url} was not recorded in the arXiv cache")
+        return None
+
+    try:
+        response = session.get(url, headers=ARXIV_HEADERS, timeout=30, stream=True)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to fetch papers from arXiv: {e}")
+        return None
+
+    # Let urllib3 undo a gzip or deflate transfer encoding while the stream is read
+    response.raw.decode_content = True
+    return feed_cache.record(url, response.raw)
+
+
+def iter_entries(source, category_name):
+    """Parse an Atom feed incrementally from a file-like object and yield the details of each paper as soon as its
+    entry is complete, as a dict as expected by PaperMapper.bulk_ingest. Processed elements are removed from the tree,
+    so the memory stays flat no matter how many entries the page has."""
+
+    root = None
+    for event, element in ET.iterparse(source, events=('start', 'end')):
+        if root is None:
+            # The first event is the start of the <feed> element
+            root = element
+            continue
+        if event != 'end' or element.tag != ATOM_ENTRY:
+            continue
+
+        link = (element.findtext(ATOM_ID) or '').strip()
+        yield {
+            'arxiv_id': link.split('/')[-1],
+            'title': (element.findtext(ATOM_TITLE) or '').strip(),
+            'abstract': (element.findtext(ATOM_SUMMARY) or '').strip(),
+            'published_date': (element.findtext(ATOM_PUBLISHED) or '')[:10],
+            'categories': category_name,
+            'link': link,
+            'authors': [(author.findtext(ATOM_NAME) or '').strip() for author in element.iterfind(ATOM_AUTHOR)],
+        }
+        # Drop the entry (and everything before it) from the tree
+        root.clear()
+
+
+def iter_entry_batches(source, category_name, batch_size=None):
+    """Yield the entries of a feed in lists of `batch_size` entries while the feed is still being downloaded."""
+
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    batch = []
+    for entry in iter_entries(source, category_name):
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_pages(categories, number_articles):
+    """Yield the (category, start, max_results) of all pages to fetch, category by category."""
+
+    page_size = min(number_articles, MAX_RESULTS_PER_PAGE)
+    for category in categories:
+        for start in range(0, number_articles, page_size):
+            yield category, start, page_size
+
+
+# Marks the end of the items of a queue
+_DONE = object()
+
+
+class IngestPipeline:
+    """This class is responsible for fetching, storing and enriching the papers of several categories with concurrent
+    stages (see the module docstring). The stages can be injected, e.g. to share the models of the worker."""
+
+    def __init__(self, categories, number_articles, queue_size=None, limiter=None, paper_mapper=None,
+                 embedding_stage=None, keyword_stage=None, similarity_builder=None, progress=None):
+        self.categories = categories
+        self.number_articles = number_articles
+        self.queue_size = queue_size or settings.PIPELINE_QUEUE_SIZE
+        self.limiter = limiter if limiter is not None else arxiv_limiter
+        self.paper_mapper = paper_mapper if paper_mapper is not None else PaperMapper()
+        self.embedding_stage = embedding_stage if embedding_stage is not None else EmbeddingStage(
+            paper_mapper=self.paper_mapper
+        )
+        self.keyword_stage = keyword_stage if keyword_stage is not None else KeywordStage(
+            paper_mapper=self.paper_mapper
+        )
+        self.similarity_builder = similarity_builder if similarity_builder is not None else SimilarityGraphBuilder(
+            paper_mapper=self.paper_mapper
+        )
+        # Progress of the job the pipeline runs for (see job_progress.py)
+        self.progress = progress if progress is not None else JobProgress()
+        self._stop = threading.Event()
+        self._errors = []
+        # Seconds each stage spent working and waiting for the rate limiter
+        self.timings = {'fetch': 0.0, 'rate_limit_wait': 0.0, 'store': 0.0, 'enrich': 0.0}
+
+    def _put(self, target, item):
+        """Put an item into a bounded queue without blocking forever if the pipeline is stopped."""
+
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source):
+        """Take the next item from a queue. Returns _DONE if the pipeline is stopped."""
+
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fetch(self, fetched):
+        """Fetch stage: download and parse all pages and hand the entries to the store stage in batches, while the
+        rest of the page is still being downloaded."""
+
+        session = get_session()
+        try:
+            for category, start, max_results in iter_pages(self.categories, self.number_articles):
+                if self._stop.is_set():
+                    break
+                url = page_url(category, start, max_results)
+                if needs_request(url):
+                    self.timings['rate_limit_wait'] += self.limiter.acquire()
+                fetch_start = time.perf_counter()
+                stream = fetch_page(session, url)
+                if stream is None:
+                    # Stop the crawl like before, the following pages would most likely fail as well
+                    self.progress.incr('pages_failed')
+                    break
+                page_seconds, page_entries = 0.0, 0
+                try:
+                    for entries in iter_entry_batches(stream, ARXIV_CATEGORY_MAP.get(category, category)):
+                        # Only count the time of downloading and parsing, not the time waiting for the store stage
+                        page_seconds += time.perf_counter() - fetch_start
+                        page_entries += len(entries)
+                        if not self._put(fetched, (category, entries)):
+                            break
+                        fetch_start = time.perf_counter()
+                    page_seconds += time.perf_counter() - fetch_start
+                except FEED_ERRORS as e:
+                    print(f"Failed to read papers from arXiv: {e}")
+                    self.progress.incr('pages_failed')
+                    break
+                finally:
+                    stream.close()
+                    self.timings['fetch'] += page_seconds
+                    self.progress.record_stage('fetch', page_seconds, page_entries)
+                self.progress.incr('pages_fetched')
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            self._put(fetched, _DONE)
+
+    def _store(self, fetched, stored):
+        """Store stage: store the papers, their authors and the paper-author links of each batch of entries."""
+
+        try:
+            while True:
+                item = self._get(fetched)
+                if item is _DONE:
+                    break
+                category, entries = item
+                store_start = time.perf_counter()
+                papers, created = self.paper_mapper.bulk_ingest(entries)
+                store_seconds = time.perf_counter() - store_start
+                self.timings['store'] += store_seconds
+                self.progress.record_stage('store', store_seconds, len(entries))
+                self.progress.incr('papers_stored', len(papers))
+                self.progress.incr('papers_inserted', created)
+                print(f"Stored {len(papers)} papers from category {category} ({created} new)")
+                if not self._put(stored, (category, created)):
+                    break
+        except Exception as e:
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            # The stage runs in its own thread, which has its own database connection
+            connection.close()
+            self._put(stored, _DONE)
+
+    def enrich(self):
+        """Enrich stage: compute the embeddings and keywords of all pending papers and update the similarity graph.
+        Returns the number of newly embedded papers."""
+
+        # 1. Generate embeddings for the papers that still need one
+        # Each round claims a batch of pending papers (see PaperMapper.claim_pending), encodes it and writes the
+        # vectors back, which also marks the papers as done. We only keep the ids and vectors for the next stages.
+        embedded_ids, embedded_vectors = [], []
+        while True:
+            chunk = self.paper_mapper.claim_pending('embedding')
+            if not chunk:
+                break
+            with self.progress.timer('embedding', items=len(chunk)):
+                self.embedding_stage.run(chunk)
+            self.progress.incr('embeddings_done', len(chunk))
+            embedded_ids.extend(paper.id for paper in chunk)
+            embedded_vectors.extend(paper.embedding for paper in chunk)
+        doc_embeddings = dict(zip(embedded_ids, embedded_vectors))
+
+        # 2. Extract keywords for the papers that still need them. The keyword stage reuses the document
+        # embeddings from step 1, so each abstract goes through the encoder only once.
+        while True:
+            chunk = self.paper_mapper.claim_pending('keywords')
+            if not chunk:
+                break
+            with self.progress.timer('keywords', items=len(chunk)):
+                self.keyword_stage.run(chunk, doc_embeddings)
+            self.progress.incr('keywords_done', len(chunk))
+
+        # 3. Build similarity graph and update the materialized top-k neighbours used for related papers.
+        # Only the newly embedded papers are compared against the corpus.
+        if embedded_ids:
+            with self.progress.timer('similarity', items=len(embedded_ids)):
+                stats = self.similarity_builder.build(embedded_ids, np.array(embedded_vectors, dtype=np.float32))
+            self.progress.incr('similarity_pairs', stats['inserted'])
+            self.progress.incr('neighbours_updated', stats['updated_neighbours'])
+        return len(embedded_ids)
+
+    def run(self):
+        """Run the pipeline until all pages are fetched and all stored papers are enriched. Returns the timings of
+        the stages."""
+
+        start = time.perf_counter()
+        fetched = queue.Queue(maxsize=self.queue_size)
+        stored = queue.Queue(maxsize=self.queue_size)
+        threads = [
+            threading.Thread(target=self._fetch, args=(fetched,), name='arxiv-fetch', daemon=True),
+            threading.Thread(target=self._store, args=(fetched, stored), name='arxiv-store', daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        self.progress.set_state('running')
+
+        try:
+            done = False
+            while not done:
+                # Wait for a stored page and take all other pages that were stored in the meantime, so that the
+                # models work on larger batches when the fetch and store stages are ahead
+                created = 0
+                categories = []
+                items = [self._get(stored)]
+                while True:
+                    try:
+                        items.append(stored.get_nowait())
+                    except queue.Empty:
+                        break
+                for item in items:
+                    if item is _DONE:
+                        done = True
+                    else:
+                        categories.append(item[0])
+                        created += item[1]
+                if not categories:
+                    continue
+
+                enrich_start = time.perf_counter()
+                embedded = self.enrich()
+                self.timings['enrich'] += time.perf_counter() - enrich_start
+
+                # Invalidate the cached search and related-paper responses if the corpus changed
+                if created or embedded:
+                    response_cache.bump_generation()
+        except Exception as e:
+            self.progress.set_state('failed', error=repr(e))
+            raise
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+        if self._errors:
+            self.progress.set_state('failed', error=repr(self._errors[0]))
+            raise self._errors[0]
+        self.progress.set_state('done')
+
+        stats = {name: round(seconds, 3) for name, seconds in self.timings.items()}
+        stats['total'] = round(time.perf_counter() - start, 3)
+        print(f"Ingest pipeline: {stats}")
+        print(f"Author cache: {author_resolver.stats()}")
+        print(f"arXiv cache: {feed_cache.stats()}")
+        print(f"Pending work: {self.paper_mapper.count_pending()}")
+        return stats
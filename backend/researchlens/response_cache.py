@@ -0,0 +1,133 @@
+"""
+This module provides a read-through cache for the responses of the search and related-paper endpoints. The responses
+are stored in Redis (which already runs as the Celery broker) under a key built from the normalized query parameters
+and the current corpus generation. The preprocessing task bumps the generation whenever it commits new papers, which
+invalidates all cached responses at once without having to find and delete them. The cache also counts hits and misses
+and the time saved by the hits, so that its benefit can be monitored.
+"""
+
+import hashlib
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+GENERATION_KEY = 'researchlens:corpus_generation'
+HITS_KEY = 'researchlens:response_cache:hits'
+MISSES_KEY = 'researchlens:response_cache:misses'
+SAVED_MS_KEY = 'researchlens:response_cache:saved_ms'
+
+
+def normalize_params(params):
+    """Drop the empty query parameters, so that a missing and an empty parameter share one cache entry. The values
+    themselves are normalized by the views (see views.paper_list_params), which pass the same values to the query."""
+
+    return {key: value for key, value in params.items() if value is not None and value != ''}
+
+
+def get_generation():
+    """Return the current corpus generation."""
+
+    return cache.get_or_set(GENERATION_KEY, 0, timeout=None)
+
+
+def bump_generation():
+    """Increment the corpus generation, which invalidates all cached responses. Errors are logged and ignored, so that
+    an unavailable cache does not stop the preprocessing."""
+
+    try:
+        cache.add(GENERATION_KEY, 0, timeout=None)
+        return cache.incr(GENERATION_KEY)
+    except Exception as e:
+        print(f"Could not bump the corpus generation: {e}")
+        return None
+
+
+def _increment(key, delta=1):
+    cache.add(key, 0, timeout=None)
+    cache.incr(key, delta)
+
+
+def _lookup(namespace, params):
+    """Return the cache key of the request and the cached entry (None on a miss). Raises if the cache is unavailable."""
+
+    digest = hashlib.sha1(json.dumps(normalize_params(params), sort_keys=True, default=str).encode()).hexdigest()
+    key = f'researchlens:response:{namespace}:{get_generation()}:{digest}'
+    return key, cache.get(key)
+
+
+def _record_hit(entry, start):
+    # The time saved is the time the response took to compute minus the time of the lookup
+    saved_ms = max(0, int(1000 * (entry['compute_seconds'] - (time.perf_counter() - start))))
+    try:
+        _increment(HITS_KEY)
+        _increment(SAVED_MS_KEY, saved_ms)
+    except Exception as e:
+        print(f"Could not update the response cache metrics: {e}")
+
+
+def _store(key, value, compute_seconds):
+    try:
+        cache.set(key, {'value': value, 'compute_seconds': compute_seconds}, timeout=settings.RESPONSE_CACHE_TTL)
+        _increment(MISSES_KEY)
+    except Exception as e:
+        print(f"Could not store the response in the cache: {e}")
+
+
+def get_or_compute(namespace, params, compute):
+    """Return the cached response for the namespace (e.g. 'papers') and query parameters, or compute, cache and return
+    it. If the cache is not reachable, the response is computed without caching."""
+
+    start = time.perf_counter()
+    try:
+        key, entry = _lookup(namespace, params)
+    except Exception as e:
+        print(f"Response cache unavailable: {e}")
+        return compute()
+
+    if entry is not None:
+        _record_hit(entry, start)
+        return entry['value']
+
+    compute_start = time.perf_counter()
+    value = compute()
+    _store(key, value, time.perf_counter() - compute_start)
+    return value
+
+
+async def aget_or_compute(namespace, params, compute):
+    """Async version of get_or_compute for the async views; `compute` is a coroutine function. The Redis calls run in
+    the thread pool (they are short and thread-safe), so they do not block the event loop."""
+
+    start = time.perf_counter()
+    try:
+        key, entry = await sync_to_async(_lookup, thread_sensitive=False)(namespace, params)
+    except Exception as e:
+        print(f"Response cache unavailable: {e}")
+        return await compute()
+
+    if entry is not None:
+        await sync_to_async(_record_hit, thread_sensitive=False)(entry, start)
+        return entry['value']
+
+    compute_start = time.perf_counter()
+    value = await compute()
+    await sync_to_async(_store, thread_sensitive=False)(key, value, time.perf_counter() - compute_start)
+    return value
+
+
+def stats():
+    """Return the hit ratio and the time saved by the response cache (across all processes)."""
+
+    values = cache.get_many([HITS_KEY, MISSES_KEY, SAVED_MS_KEY, GENERATION_KEY])
+    hits = values.get(HITS_KEY, 0)
+    misses = values.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        'saved_seconds': round(values.get(SAVED_MS_KEY, 0) / 1000, 3),
+        'corpus_generation': values.get(GENERATION_KEY, 0),
+    }
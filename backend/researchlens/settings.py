@@ -47,14 +47,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Async-capable WhiteNoise, so that static files do not force the ASGI requests through a single thread
+    'researchlens.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'corsheaders.middleware.CorsMiddleware'
+    'corsheaders.middleware.CorsMiddleware',
+    'researchlens.sql_instrumentation.SQLInstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'researchlens.urls'
@@ -75,10 +77,14 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'researchlens.wsgi.application'
+ASGI_APPLICATION = 'researchlens.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# Django uses psycopg 3 whenever it is installed, and requirements.txt installs it for the async connection pool (see
+# async_object_relational_mapper.py). So the sync ORM and the mappers run on psycopg 3 as well; psycopg2 is only used
+# where psycopg 3 is missing. The driver-specific code paths check is_psycopg3 (see pgvector_types.py).
 
 DATABASES = {
     'default': {
@@ -137,6 +143,108 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
+# The result backend is needed to coordinate the preprocessing sub-tasks with chords (Redis database 2)
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis:6379/2')
+CELERY_RESULT_EXPIRES = 3600
+# The preprocessing sub-tasks are long and idempotent: take one task at a time and acknowledge it after it finished,
+# so that the task of a crashed worker is redelivered
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ACKS_LATE = True
+
+# Cache for the responses of the search and related-paper endpoints (Redis database 1, next to the Celery broker).
+# Cached responses expire after RESPONSE_CACHE_TTL seconds or when the preprocessing task adds new papers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', 'redis://redis:6379/1'),
+    }
+}
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+
+# Preprocessing pipeline: number of abstracts encoded per batch and number of encoder processes (0 = all CPU cores).
+# More than one process requires the solo or threads Celery pool, because prefork children cannot spawn processes; the
+# embedding stage refuses to start more than one process in a prefork child.
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 64))
+EMBEDDING_PROCESSES = int(os.environ.get('EMBEDDING_PROCESSES', 1))
+# Number of torch threads of each prefork worker process (0 = one per core). The prefork children encode in parallel,
+# so more than one thread per child oversubscribes the CPU unless CELERY_CONCURRENCY is lower than the number of cores.
+TORCH_THREADS_PER_PROCESS = int(os.environ.get('TORCH_THREADS_PER_PROCESS', 1))
+
+# Encoder backend for the embeddings: 'torch', 'torch-int8', 'onnx' or 'onnx-int8' (see researchlens/encoders.py).
+# The ONNX backends need `optimum[onnxruntime]` and export the model once to ENCODER_EXPORT_DIR.
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+ENCODER_EXPORT_DIR = os.environ.get('ENCODER_EXPORT_DIR', os.path.join(BASE_DIR, 'encoder_models'))
+ONNX_QUANTIZATION_CONFIG = os.environ.get('ONNX_QUANTIZATION_CONFIG', 'avx2')
+
+# Maximum number of candidate-word embeddings the keyword stage keeps between batches
+KEYWORD_EMBEDDING_CACHE_SIZE = int(os.environ.get('KEYWORD_EMBEDDING_CACHE_SIZE', 20000))
+
+# Papers with a cosine similarity above the threshold are stored in the similarity graph. The corpus is compared in
+# blocks of SIMILARITY_BLOCK_SIZE papers, which bounds the memory of the similarity stage.
+SIMILARITY_THRESHOLD = float(os.environ.get('SIMILARITY_THRESHOLD', 0.75))
+SIMILARITY_BLOCK_SIZE = int(os.environ.get('SIMILARITY_BLOCK_SIZE', 1024))
+# Number of neighbours materialized per paper and returned as related papers
+RELATED_PAPERS_K = int(os.environ.get('RELATED_PAPERS_K', 10))
+
+# Maximum number of author names kept in the in-process author cache of the ingest path
+AUTHOR_CACHE_SIZE = int(os.environ.get('AUTHOR_CACHE_SIZE', 50000))
+
+# Number of rows fetched at once from the server-side cursors of PaperMapper.iter_filtered / iter_excluded, and the
+# default number of pending papers claimed at once by a preprocessing stage (see PaperMapper.claim_pending)
+DB_ITERSIZE = int(os.environ.get('DB_ITERSIZE', 2000))
+
+# Seconds after which a paper claimed by a preprocessing stage can be claimed again (e.g. after a worker crashed)
+PENDING_CLAIM_LEASE_SECONDS = int(os.environ.get('PENDING_CLAIM_LEASE_SECONDS', 600))
+
+# Minimum number of seconds between two requests to the arXiv API (shared by all categories of a worker process)
+ARXIV_REQUEST_INTERVAL = float(os.environ.get('ARXIV_REQUEST_INTERVAL', 3.0))
+
+# Number of connections to arXiv kept open by the pooled session of each worker process
+ARXIV_POOL_SIZE = int(os.environ.get('ARXIV_POOL_SIZE', 2))
+
+# On-disk cache of arXiv API responses: 'off', 'record' (serve cached pages, store new ones) or 'replay' (only serve
+# cached pages, never use the network). See feed_cache.py.
+ARXIV_CACHE_MODE = os.environ.get('ARXIV_CACHE_MODE', 'off')
+ARXIV_CACHE_DIR = os.environ.get('ARXIV_CACHE_DIR', os.path.join(BASE_DIR, 'arxiv_cache'))
+
+# Number of entry batches the fetch and store stages of the ingest pipeline may run ahead of the enrich stage
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 8))
+
+# Number of parsed feed entries stored at once while a page is still being downloaded
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 25))
+
+# Split the preprocessing into Celery sub-tasks (fetch page, enrich batch, similarity) that run on all worker processes.
+# Without fan-out, a single task runs the in-process pipeline.
+PREPROCESS_FAN_OUT = os.environ.get('PREPROCESS_FAN_OUT', 'true').lower() == 'true'
+
+# Number of pending papers embedded and keyworded by one enrich sub-task
+ENRICH_BATCH_SIZE = int(os.environ.get('ENRICH_BATCH_SIZE', 256))
+
+# Seconds the progress of a preprocessing job stays available on /api/preprocess-status/<task_id>/
+JOB_PROGRESS_TTL = int(os.environ.get('JOB_PROGRESS_TTL', 7 * 24 * 3600))
+
+# SQL instrumentation of the custom ORM: statement counts and database time per request and mapper method (sent in the
+# X-SQL-Stats response header). Statements slower than SLOW_QUERY_MS (0 = off) are written to SLOW_QUERY_LOG, with their
+# EXPLAIN (ANALYZE, BUFFERS) plan if SLOW_QUERY_EXPLAIN is set. ANALYZE runs the slow statement a second time within the
+# request, so it is off by default and meant for profiling sessions; in production use PostgreSQL's auto_explain instead.
+SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', 'true').lower() == 'true'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', os.path.join(BASE_DIR, 'slow_queries.log'))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'false').lower() == 'true'
+
+# Recall/speed trade-off of the approximate nearest neighbour search for related papers. ef_search is used by the HNSW
+# index, probes only by an IVFFlat index. Both can also be set per request on /api/related/<id>/.
+VECTOR_SEARCH_EF_SEARCH = int(os.environ.get('VECTOR_SEARCH_EF_SEARCH', 40))
+VECTOR_SEARCH_PROBES = int(os.environ.get('VECTOR_SEARCH_PROBES', 0)) or None
+
+# Serve the paper list and related papers with the async views and the async mappers (psycopg 3 connection pool of
+# ASYNC_DB_POOL_MIN_SIZE to ASYNC_DB_POOL_MAX_SIZE connections per process). Only useful with an ASGI server, which
+# docker-compose.yml runs with ASYNC_VIEWS=true; WSGI servers and runserver use the synchronous views by default.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'false').lower() == 'true'
+ASYNC_DB_POOL_MIN_SIZE = int(os.environ.get('ASYNC_DB_POOL_MIN_SIZE', 2))
+ASYNC_DB_POOL_MAX_SIZE = int(os.environ.get('ASYNC_DB_POOL_MAX_SIZE', 20))
+# Seconds a request waits for a free pooled connection before it fails
+ASYNC_DB_POOL_TIMEOUT = float(os.environ.get('ASYNC_DB_POOL_TIMEOUT', 30))
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  
@@ -146,6 +254,8 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # CORS (Cross-Origin Resource Sharing) settings
 #ALLOWED_HOSTS=['http://localhost']
 CORS_ORIGIN_ALLOW_ALL = True
+# Let the frontend read the SQL statistics of a response (see sql_instrumentation.py)
+CORS_EXPOSE_HEADERS = ['X-SQL-Stats']
 # CORS_ORIGIN_WHITELIST = (
 #         'http://localhost'
 #        'http://localhost:3000',
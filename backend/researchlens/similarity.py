@@ -0,0 +1,153 @@
+"""
+This module contains the similarity graph stage of the ResearchLens preprocessing pipeline. Instead of comparing every
+pair of papers in a Python loop, only the newly embedded papers are compared against the corpus. The comparison is done
+with blocked matrix products of normalised embeddings, so the memory footprint is bounded by the block size and not by
+the size of the corpus. All pairs above the threshold are written with a single bulk insert.
+
+The same comparison also maintains the materialized top-k neighbours of every paper, which are used to serve related
+papers: the new papers get their complete top-k list, and existing papers get a new paper added to their list if it is
+closer than their current k-th neighbour.
+"""
+
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .object_relational_mapper import PaperMapper, PaperSimilarityMapper, PaperNeighbourMapper
+
+
+def normalize(embeddings):
+    """Scale every row to unit length, so that the dot product of two rows is their cosine similarity."""
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def merge_top_k(top_scores, top_ids, scores, ids, k):
+    """Merge the candidate scores and ids (both of shape (n, m)) into the running top-k scores and ids of shape (n, <=k)
+    and return the new running top-k. The top-k of a row is not sorted."""
+
+    all_scores = np.concatenate([top_scores, scores], axis=1)
+    all_ids = np.concatenate([top_ids, ids], axis=1)
+    if all_scores.shape[1] > k:
+        best = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+        all_scores = np.take_along_axis(all_scores, best, axis=1)
+        all_ids = np.take_along_axis(all_ids, best, axis=1)
+    return all_scores, all_ids
+
+
+def flatten_top_k(paper_ids, top_scores, top_ids):
+    """Turn the top-k matrices into flat (paper id, neighbour id, score) arrays, dropping masked (-inf) entries."""
+
+    keep = np.isfinite(top_scores)
+    rows = np.repeat(np.asarray(paper_ids, dtype=np.int64)[:, np.newaxis], top_scores.shape[1], axis=1)
+    return rows[keep], top_ids[keep], top_scores[keep]
+
+
+class SimilarityGraphBuilder:
+    """This class is responsible for finding pairs of similar papers (cosine similarity above the threshold) and the
+    top-k neighbours of papers between the new papers and the corpus, and storing them in the database."""
+
+    def __init__(self, threshold=None, block_size=None, k=None, paper_mapper=None, similarity_mapper=None,
+                 neighbour_mapper=None):
+        self.threshold = threshold if threshold is not None else settings.SIMILARITY_THRESHOLD
+        self.block_size = block_size or settings.SIMILARITY_BLOCK_SIZE
+        self.k = k or settings.RELATED_PAPERS_K
+        self.paper_mapper = paper_mapper if paper_mapper is not None else PaperMapper()
+        self.similarity_mapper = similarity_mapper if similarity_mapper is not None else PaperSimilarityMapper()
+        self.neighbour_mapper = neighbour_mapper if neighbour_mapper is not None else PaperNeighbourMapper()
+
+    def build(self, new_ids, new_embeddings):
+        """Find and store the similar pairs and the top-k neighbours of the newly embedded papers. Returns a dict with
+        the number of compared papers and written rows."""
+
+        start = time.perf_counter()
+        if len(new_ids) == 0:
+            return {'new_papers': 0, 'pairs': 0, 'inserted': 0, 'neighbours': 0, 'updated_neighbours': 0, 'seconds': 0.0}
+
+        new_ids = np.asarray(new_ids, dtype=np.int64)
+        new_embeddings = normalize(np.asarray(new_embeddings, dtype=np.float32))
+        new_id_set = set(new_ids.tolist())
+        blocks = range(0, len(new_ids), self.block_size)
+
+        sources, targets, pair_scores = [], [], []
+        # Running top-k of the new papers, one entry per block of new papers
+        row_top = {b: (np.empty((len(new_ids[b:b + self.block_size]), 0), dtype=np.float32),
+                       np.empty((len(new_ids[b:b + self.block_size]), 0), dtype=np.int64)) for b in blocks}
+        # Candidates for the neighbour lists of existing papers
+        candidates = []
+
+        for corpus_ids, corpus_embeddings in self.paper_mapper.iter_embedding_blocks(self.block_size):
+            corpus_embeddings = normalize(corpus_embeddings)
+            corpus_is_new = np.fromiter((i in new_id_set for i in corpus_ids.tolist()), dtype=bool, count=len(corpus_ids))
+            # Running top-k of the corpus papers in this block among the new papers
+            column_scores = np.empty((len(corpus_ids), 0), dtype=np.float32)
+            column_ids = np.empty((len(corpus_ids), 0), dtype=np.int64)
+
+            for b in blocks:
+                block_ids = new_ids[b:b + self.block_size]
+                scores = new_embeddings[b:b + self.block_size] @ corpus_embeddings.T
+
+                # 1. Pairs above the threshold. Pairs of two new papers are seen twice, once from each side. We only
+                # keep the one where the new paper has the smaller id (which also drops the paper itself).
+                keep = scores >= self.threshold
+                keep &= ~(corpus_is_new[np.newaxis, :] & (block_ids[:, np.newaxis] >= corpus_ids[np.newaxis, :]))
+                rows, cols = np.nonzero(keep)
+                if len(rows) > 0:
+                    sources.append(np.minimum(block_ids[rows], corpus_ids[cols]))
+                    targets.append(np.maximum(block_ids[rows], corpus_ids[cols]))
+                    pair_scores.append(scores[rows, cols])
+
+                # 2. Top-k neighbours of the new papers (a paper is not its own neighbour)
+                masked = np.where(block_ids[:, np.newaxis] == corpus_ids[np.newaxis, :], -np.inf, scores)
+                row_top[b] = merge_top_k(*row_top[b], masked, np.broadcast_to(corpus_ids, masked.shape), self.k)
+
+                # 3. The closest new papers of each corpus paper
+                column_scores, column_ids = merge_top_k(
+                    column_scores, column_ids, masked.T, np.broadcast_to(block_ids, masked.T.shape), self.k
+                )
+
+            # New papers get their complete list from step 2. Existing papers only take the new papers that beat their
+            # current k-th neighbour; papers with a short or no neighbour list yet take every new paper.
+            existing = ~corpus_is_new
+            if existing.any():
+                paper_ids, neighbour_ids, candidate_scores = flatten_top_k(
+                    corpus_ids[existing], column_scores[existing], column_ids[existing]
+                )
+                thresholds = self.neighbour_mapper.get_thresholds(np.unique(paper_ids), self.k)
+                accept = np.fromiter(
+                    (score > thresholds[paper_id]
+                     for paper_id, score in zip(paper_ids.tolist(), candidate_scores.tolist())),
+                    dtype=bool, count=len(paper_ids)
+                )
+                if accept.any():
+                    candidates.append((paper_ids[accept], neighbour_ids[accept], candidate_scores[accept]))
+
+        # Store the similar pairs
+        if sources:
+            sources, targets, pair_scores = np.concatenate(sources), np.concatenate(targets), np.concatenate(pair_scores)
+        inserted = self.similarity_mapper.bulk_create(sources, targets, pair_scores)
+
+        # Store the neighbour lists of the new papers and merge the new papers into the lists of existing papers
+        flat = [flatten_top_k(new_ids[b:b + self.block_size], *row_top[b]) for b in blocks]
+        neighbours = self.neighbour_mapper.replace(
+            new_ids, *(np.concatenate([part[i] for part in flat]) for i in range(3))
+        )
+        updated = 0
+        if candidates:
+            updated = self.neighbour_mapper.merge(
+                *(np.concatenate([part[i] for part in candidates]) for i in range(3)), k=self.k
+            )
+
+        stats = {
+            'new_papers': len(new_ids),
+            'pairs': len(sources),
+            'inserted': inserted,
+            'neighbours': neighbours,
+            'updated_neighbours': updated,
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+        print(f"Similarity stage: {stats}")
+        return stats
@@ -0,0 +1,248 @@
+"""
+This module instruments the raw SQL of our custom object relational mapper. All statements of the mappers go through
+Django's database connection, so a query recorder is installed as an execute wrapper of the connection. It counts the
+statements, the affected or returned rows and the time spent in the database, in total and per mapper method (the
+mapper classes are decorated with `instrument_mapper`, which records the method that is currently running).
+
+The middleware records every request: the totals are sent in the `X-SQL-Stats` response header and printed together
+with the breakdown per mapper method. The async mappers do not use Django's connection; they report their statements
+with `record_statement` to the stats of the current request (without plans for slow statements). Statements that take
+longer than SLOW_QUERY_MS are written to the slow-query log (SLOW_QUERY_LOG). With SLOW_QUERY_EXPLAIN (off by default,
+because the plan is taken within the request) they come with their plan from `EXPLAIN (ANALYZE, BUFFERS)`. Statements
+that modify data are only explained without ANALYZE, because ANALYZE executes the statement again.
+"""
+
+import contextvars
+import functools
+import inspect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+# The mapper method that is currently running, e.g. 'PaperMapper.get'
+current_method = contextvars.ContextVar('current_mapper_method', default=None)
+# The QueryStats of the current request, used by the async mappers
+current_stats = contextvars.ContextVar('current_query_stats', default=None)
+
+# Statements that change data must not be run again by EXPLAIN ANALYZE
+_WRITE_STATEMENT = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|CREATE|ALTER|DROP)\b', re.IGNORECASE)
+
+_slow_log_lock = threading.Lock()
+
+
+def _attributed(name, generator):
+    """Iterate over a generator and set the mapper method around every step, because the statements of a generator run
+    while it is iterated, after the method itself has returned."""
+
+    while True:
+        token = current_method.set(name)
+        try:
+            item = next(generator)
+        except StopIteration:
+            return
+        finally:
+            current_method.reset(token)
+        yield item
+
+
+def _wrap_method(name, method):
+    """Wrap a mapper method, so that its statements are attributed to it. Generator methods (e.g.
+    iter_embedding_blocks) and methods that return a generator (e.g. of a private helper) are attributed while the
+    generator is iterated. Coroutine methods (of the async mappers) set the method while they are awaited."""
+
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def coroutine_wrapper(*args, **kwargs):
+            token = current_method.set(name)
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                current_method.reset(token)
+        return coroutine_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        token = current_method.set(name)
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            current_method.reset(token)
+        if inspect.isgenerator(result):
+            return _attributed(name, result)
+        return result
+    return wrapper
+
+
+def instrument_mapper(cls):
+    """Class decorator that attributes the statements of all public methods of a mapper to the method. Statements of
+    private helpers count for the public method that called them."""
+
+    for name, member in list(vars(cls).items()):
+        if not name.startswith('_') and inspect.isfunction(member):
+            setattr(cls, name, _wrap_method(f'{cls.__name__}.{name}', member))
+    return cls
+
+
+class QueryStats:
+    """This class is responsible for adding up the statements, rows and database time of one unit of work (e.g. one
+    request), in total and per mapper method."""
+
+    def __init__(self, label=''):
+        self.label = label
+        self.statements = 0
+        self.rows = 0
+        self.seconds = 0.0
+        # Mapper method -> [statements, rows, seconds]
+        self.methods = {}
+
+    def add(self, method, rows, seconds):
+        self.statements += 1
+        self.rows += rows
+        self.seconds += seconds
+        totals = self.methods.setdefault(method, [0, 0, 0.0])
+        totals[0] += 1
+        totals[1] += rows
+        totals[2] += seconds
+
+    def header(self):
+        """Return the totals in the format of the X-SQL-Stats response header."""
+
+        return f"statements={self.statements}; rows={self.rows}; duration_ms={self.seconds * 1000:.1f}"
+
+    def summary(self):
+        return {
+            'label': self.label,
+            'statements': self.statements,
+            'rows': self.rows,
+            'duration_ms': round(self.seconds * 1000, 1),
+            'methods': {
+                method: {'statements': totals[0], 'rows': totals[1], 'duration_ms': round(totals[2] * 1000, 1)}
+                for method, totals in sorted(self.methods.items(), key=lambda item: -item[1][2])
+            },
+        }
+
+
+class QueryRecorder:
+    """This class is responsible for recording every statement of a connection into a QueryStats object. It is
+    installed with `connection.execute_wrapper` and captures the plans of slow statements."""
+
+    def __init__(self, stats, slow_query_ms=None, slow_query_log=None, explain=None):
+        self.stats = stats
+        self.slow_query_ms = slow_query_ms if slow_query_ms is not None else settings.SLOW_QUERY_MS
+        self.slow_query_log = slow_query_log or settings.SLOW_QUERY_LOG
+        self.explain = explain if explain is not None else settings.SLOW_QUERY_EXPLAIN
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        seconds = time.perf_counter() - start
+
+        # The row count of a server-side cursor is only known after fetching, it is counted as 0
+        rowcount = getattr(context['cursor'], 'rowcount', -1)
+        method = current_method.get() or 'other'
+        self.stats.add(method, max(rowcount, 0), seconds)
+
+        if self.slow_query_ms and seconds * 1000 >= self.slow_query_ms and not many:
+            self.log_slow_query(context['connection'], method, sql, params, seconds)
+        return result
+
+    def log_slow_query(self, db_connection, method, sql, params, seconds):
+        """Append the statement and its plan to the slow-query log. Errors are logged and ignored."""
+
+        plan = ''
+        if self.explain and not sql.lstrip().upper().startswith('EXPLAIN'):
+            options = 'ANALYZE, BUFFERS' if not _WRITE_STATEMENT.search(sql) else 'COSTS'
+            try:
+                # The raw cursor of the driver does not go through the execute wrappers, so it is not recorded again
+                with db_connection.connection.cursor() as cursor:
+                    cursor.execute(f"EXPLAIN ({options}) {sql}", params)
+                    plan = '\n'.join(row[0] for row in cursor.fetchall())
+            except Exception as e:
+                plan = f"Could not explain the statement: {e}"
+
+        entry = (
+            f"-- {datetime.now().isoformat(timespec='seconds')} {seconds * 1000:.1f} ms in {method} "
+            f"({self.stats.label})\n{sql}\n-- params: {params!r}\n{plan}\n\n"
+        )
+        print(f"Slow query ({seconds * 1000:.1f} ms) in {method}")
+        try:
+            with _slow_log_lock, open(self.slow_query_log, 'a') as log:
+                log.write(entry)
+        except OSError as e:
+            print(f"Could not write the slow-query log: {e}")
+
+
+def record_statement(sql, params, rows, seconds):
+    """Add a statement that was not run through Django's connection (e.g. by an async mapper) to the stats of the
+    current request. Slow statements are logged without their plan."""
+
+    stats = current_stats.get()
+    if stats is None:
+        return
+    method = current_method.get() or 'other'
+    stats.add(method, rows, seconds)
+    recorder = QueryRecorder(stats, explain=False)
+    if recorder.slow_query_ms and seconds * 1000 >= recorder.slow_query_ms:
+        recorder.log_slow_query(None, method, sql, params, seconds)
+
+
+@contextmanager
+def track_queries(label='', **options):
+    """Record all statements of the current thread's connection within the block. Yields the QueryStats. The options
+    (slow_query_ms, slow_query_log, explain) override the settings of the QueryRecorder."""
+
+    stats = QueryStats(label)
+    token = current_stats.set(stats)
+    try:
+        with connection.execute_wrapper(QueryRecorder(stats, **options)):
+            yield stats
+    finally:
+        current_stats.reset(token)
+
+
+class SQLInstrumentationMiddleware:
+    """This class is responsible for recording the statements of every request. The totals are added to the response
+    as the X-SQL-Stats header and printed together with the breakdown per mapper method. Under ASGI, the statements of
+    the async mappers are recorded; synchronous views run in another thread and are not recorded there."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.SQL_INSTRUMENTATION:
+            return self.get_response(request)
+
+        with track_queries(f"{request.method} {request.path}") as stats:
+            response = self.get_response(request)
+        return self.finish(response, stats)
+
+    async def __acall__(self, request):
+        if not settings.SQL_INSTRUMENTATION:
+            return await self.get_response(request)
+
+        stats = QueryStats(f"{request.method} {request.path}")
+        token = current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(response, stats)
+
+    def finish(self, response, stats):
+        response['X-SQL-Stats'] = stats.header()
+        if stats.statements:
+            print(f"SQL {stats.label}: {stats.summary()}")
+        return response
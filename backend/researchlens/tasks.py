@@ -2,129 +2,286 @@
 This file contains the Celery tasks for the ResearchLens application. The task includes fetching data from the arXiv API,
 processing it to extract relevant information, computing document embeddings and keywords, and storing it in the database.
 We use Celery for asynchronous task processing to handle potentially long-running operations without blocking the main application.
+
+A preprocessing job is split into sub-tasks, so that it uses all worker processes (and worker containers):
+
+1. `ingest_page` fetches, parses and stores one page of one category. All pages run as a group.
+2. `schedule_enrichment` runs when all pages are stored and starts one `enrich_batch` per batch of pending papers.
+3. `schedule_similarity` runs when all batches are enriched and starts one `build_similarity` per batch of new papers.
+4. `finish_preprocess` invalidates the response cache and reports the remaining work.
+
+All sub-tasks are idempotent: storing a page again keeps the existing papers, the enrich batches only take papers that
+still need work (see PaperMapper.claim_pending), and the similarity pairs and neighbours are upserted. The id of the
+`run_data_preprocess` task identifies the job; the sub-tasks record their progress and stage timings under it (see
+job_progress.py). The chords carry an error callback (`mark_job_failed`), so a sub-task that raises marks the job as
+failed instead of leaving it in an intermediate state.
 """
 
-from celery import shared_task
-import requests
-import xml.etree.ElementTree as ET
-from sentence_transformers import SentenceTransformer, util
-from keybert import KeyBERT
-import numpy as np
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 import time
 
+from celery import shared_task, chord, group
+from django.conf import settings
+from django.db import DataError, IntegrityError, OperationalError
+
 # Import our custom mapper
-from .object_relational_mapper import PaperMapper, AuthorMapper, PaperSimilarityMapper
+from .object_relational_mapper import PaperMapper, PaperSimilarityMapper, author_resolver
+# The registry loads the models once per worker process (see model_registry.py)
+from .model_registry import registry
+from .embedding import EmbeddingStage
+from .keywords import KeywordStage
+from .similarity import SimilarityGraphBuilder
+from .pipeline import (
+    IngestPipeline, ARXIV_CATEGORY_MAP, FEED_ERRORS, arxiv_limiter, fetch_page, get_session, iter_entry_batches,
+    iter_pages, needs_request, page_url
+)
+from .job_progress import JobProgress
+from . import response_cache
+
+
+@shared_task(bind=True)
+def run_data_preprocess(self, number_articles, categories, fan_out=None):
+    fan_out = fan_out if fan_out is not None else settings.PREPROCESS_FAN_OUT
+    job_id = self.request.id
+    pages = list(iter_pages(categories, number_articles))
+    progress = JobProgress(job_id)
+    progress.start(pages_total=len(pages))
+
+    if fan_out:
+        # Store all pages in parallel, then enrich the pending papers (see the module docstring)
+        progress.set_state('ingesting')
+        header = [ingest_page.s(cat, start, max_results, job_id=job_id) for cat, start, max_results in pages]
+        result = chord(group(header))(on_error(schedule_enrichment.s(job_id=job_id), job_id))
+        print(f"Started preprocessing of {len(pages)} pages from categories {categories}")
+        return {'pages': len(pages), 'chord_id': result.id}
+
+    # Get the shared models for document embeddings and keyword extraction. They are loaded once per worker process.
+    model = registry.get_encoder()
+    kw_model = registry.get_keyword_model()
 
-@shared_task
-def run_data_preprocess(number_articles, categories):
-    # Initialize models for document embeddings and keyword extraction
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    kw_model = KeyBERT()
-    
-    # Map categories to human-readable names
-    ARXIV_CATEGORY_MAP = {
-        'cs': 'Computer Science',
-        'math': 'Mathematics',
-        'stat': 'Statistics',
-        'econ': 'Economics',
-        'physics': 'Physics',
-        'q-bio': 'Quantitative Biology',
-        'q-fin': 'Quantitative Finance'
-    }
-    
     # Initialize our mappers to interact with the database via Python objects
     paper_mapper = PaperMapper()
-    author_mapper = AuthorMapper()
     paper_similarity_mapper = PaperSimilarityMapper()
+    embedding_stage = EmbeddingStage(encoder=model, paper_mapper=paper_mapper)
+    keyword_stage = KeywordStage(keyword_model=kw_model, encoder=model, paper_mapper=paper_mapper)
+    similarity_builder = SimilarityGraphBuilder(paper_mapper=paper_mapper, similarity_mapper=paper_similarity_mapper)
+
+    # Fetch, store and enrich the papers of all categories. The stages run concurrently and the requests to arXiv are
+    # spaced by the shared rate limiter instead of sleeping after every page (see pipeline.py).
+    pipeline = IngestPipeline(
+        categories,
+        number_articles,
+        paper_mapper=paper_mapper,
+        embedding_stage=embedding_stage,
+        keyword_stage=keyword_stage,
+        similarity_builder=similarity_builder,
+        progress=progress
+    )
+    return pipeline.run()
+
+
+# SQLSTATEs of transactions that PostgreSQL aborted to resolve a conflict with a concurrent transaction
+RETRYABLE_SQLSTATES = ('40P01', '40001')
+
+
+def store_entries(paper_mapper, entries, attempts=3):
+    """Store a batch of entries with bulk_ingest. Concurrent pages lock the shared papers and authors in the same
+    order, but a transaction that is still chosen as deadlock victim (or fails to serialize) is retried."""
+
+    for attempt in range(1, attempts + 1):
+        try:
+            return paper_mapper.bulk_ingest(entries)
+        except OperationalError as e:
+            # psycopg2 reports the SQLSTATE as pgcode, psycopg 3 as sqlstate
+            sqlstate = getattr(e.__cause__, 'pgcode', None) or getattr(e.__cause__, 'sqlstate', None)
+            if sqlstate not in RETRYABLE_SQLSTATES or attempt == attempts:
+                raise
+            print(f"Retrying to store {len(entries)} papers ({e})")
+            time.sleep(0.1 * attempt)
+
+
+def store_batch(paper_mapper, entries):
+    """Store a batch of entries and return the stored papers, the number of new papers and the number of entries that
+    could not be stored. Entries without an arXiv id or publication date are skipped. If the database rejects the batch
+    (e.g. a value that does not fit its column), the entries are stored one by one, so that only the invalid ones are
+    lost."""
+
+    valid = [entry for entry in entries if entry['arxiv_id'] and entry['published_date']]
+    failed = len(entries) - len(valid)
+    if not valid:
+        return [], 0, failed
+    try:
+        papers, created = store_entries(paper_mapper, valid)
+        return papers, created, failed
+    except (DataError, IntegrityError) as e:
+        print(f"Failed to store {len(valid)} papers, storing them one by one ({e})")
+
+    papers, created = [], 0
+    for entry in valid:
+        try:
+            entry_papers, entry_created = store_entries(paper_mapper, [entry])
+        except (DataError, IntegrityError) as e:
+            print(f"Failed to store paper {entry['arxiv_id']}: {e}")
+            failed += 1
+            continue
+        papers += entry_papers
+        created += entry_created
+    return papers, created, failed
+
+
+@shared_task
+def ingest_page(category, start, max_results, job_id=None):
+    """Fetch, parse and store one page of the arXiv feed of a category. The page is parsed while it is downloaded and
+    stored in batches of entries. A failed request and entries that cannot be stored are reported in the result instead
+    of raising, so that the other pages of the job are still enriched."""
+
+    paper_mapper = PaperMapper()
+    progress = JobProgress(job_id)
+    stored, created, failed, failed_entries = 0, 0, False, 0
+    url = page_url(category, start, max_results)
+    if needs_request(url):
+        arxiv_limiter.acquire()
+
+    # The pooled session of the worker process reuses the connection to arXiv across pages. The fetch time covers
+    # downloading and parsing, but not storing the batches of entries.
+    fetch_start = time.perf_counter()
+    stream = fetch_page(get_session(), url)
+    fetch_seconds, entries_read = 0.0, 0
+    if stream is None:
+        failed = True
+    else:
+        try:
+            for entries in iter_entry_batches(stream, ARXIV_CATEGORY_MAP.get(category, category)):
+                fetch_seconds += time.perf_counter() - fetch_start
+                entries_read += len(entries)
+                with progress.timer('store', items=len(entries)):
+                    papers, batch_created, batch_failed = store_batch(paper_mapper, entries)
+                stored += len(papers)
+                created += batch_created
+                failed_entries += batch_failed
+                fetch_start = time.perf_counter()
+        except FEED_ERRORS as e:
+            print(f"Failed to read papers from arXiv: {e}")
+            failed = True
+        finally:
+            stream.close()
+    fetch_seconds += time.perf_counter() - fetch_start
+    progress.record_stage('fetch', fetch_seconds, entries_read)
+
+    progress.incr('pages_failed' if failed else 'pages_fetched')
+    progress.incr('papers_stored', stored)
+    progress.incr('papers_inserted', created)
+    progress.incr('entries_failed', failed_entries)
+    print(f"Stored {stored} papers from category {category} ({created} new, {failed_entries} failed)")
+    return {'category': category, 'start': start, 'stored': stored, 'created': created, 'failed': failed,
+            'failed_entries': failed_entries}
+
+
+@shared_task
+def schedule_enrichment(page_results, batch_size=None, job_id=None):
+    """Start one enrich task per batch of pending papers once all pages are stored."""
+
+    batch_size = batch_size or settings.ENRICH_BATCH_SIZE
+    created = sum(page['created'] for page in page_results)
+    failed = sum(1 for page in page_results if page['failed'])
+    if created:
+        # New papers are searchable right away, so the cached responses are outdated
+        response_cache.bump_generation()
+
+    pending = PaperMapper().count_pending()
+    batches = -(-max(pending.values()) // batch_size)
+    print(f"Stored {len(page_results)} pages ({created} new papers, {failed} failed pages), {pending} pending papers")
+    JobProgress(job_id).set_state('enriching')
+    if batches == 0:
+        on_error(finish_preprocess.s([], job_id=job_id), job_id).delay()
+    else:
+        chord(group(enrich_batch.s(batch_size, job_id=job_id) for _ in range(batches)))(
+            on_error(schedule_similarity.s(job_id=job_id), job_id)
+        )
+    return {'pages': len(page_results), 'created': created, 'failed_pages': failed, 'enrich_batches': batches}
+
+
+@shared_task
+def enrich_batch(batch_size, job_id=None):
+    """Compute the embeddings and keywords of one batch of pending papers. Returns the ids of the embedded papers."""
+
+    paper_mapper = PaperMapper()
+    progress = JobProgress(job_id)
+    model = registry.get_encoder()
+
+    # 1. Generate the embeddings of a batch of papers that still need one
+    papers = paper_mapper.claim_pending('embedding', limit=batch_size)
+    if papers:
+        with progress.timer('embedding', items=len(papers)):
+            EmbeddingStage(encoder=model, paper_mapper=paper_mapper).run(papers)
+        progress.incr('embeddings_done', len(papers))
+
+    # 2. Extract the keywords of a batch of papers that still need them. Only papers with a stored embedding are
+    # claimed (papers embedded in step 1, by other batches or earlier), and the keyword stage reuses that embedding, so
+    # each abstract goes through the encoder only once.
+    keyword_papers = paper_mapper.claim_pending('keywords', limit=batch_size)
+    if keyword_papers:
+        keyword_stage = KeywordStage(keyword_model=registry.get_keyword_model(), encoder=model, paper_mapper=paper_mapper)
+        with progress.timer('keywords', items=len(keyword_papers)):
+            keyword_stage.run(keyword_papers, {paper.id: paper.embedding for paper in papers})
+        progress.incr('keywords_done', len(keyword_papers))
+
+    return [paper.id for paper in papers]
+
+
+@shared_task
+def schedule_similarity(batch_results, job_id=None):
+    """Start one similarity task per block of newly embedded papers once all enrich batches are done. The similarity
+    tasks start after all embeddings are stored, so every task compares its papers against the complete corpus."""
+
+    paper_ids = sorted(paper_id for batch in batch_results for paper_id in batch)
+    block_size = settings.SIMILARITY_BLOCK_SIZE
+    blocks = [paper_ids[i:i + block_size] for i in range(0, len(paper_ids), block_size)]
+    JobProgress(job_id).set_state('similarity')
+    if not blocks:
+        on_error(finish_preprocess.s([], job_id=job_id), job_id).delay()
+    else:
+        chord(group(build_similarity.s(block, job_id=job_id) for block in blocks))(
+            on_error(finish_preprocess.s(job_id=job_id), job_id)
+        )
+    return {'embedded': len(paper_ids), 'similarity_tasks': len(blocks)}
+
+
+@shared_task
+def build_similarity(paper_ids, job_id=None):
+    """Store the similar pairs and the top-k neighbours of the given (newly embedded) papers."""
+
+    paper_mapper = PaperMapper()
+    progress = JobProgress(job_id)
+    ids, embeddings = paper_mapper.get_embeddings(paper_ids)
+    with progress.timer('similarity', items=len(ids)):
+        stats = SimilarityGraphBuilder(paper_mapper=paper_mapper).build(ids, embeddings)
+    progress.incr('similarity_pairs', stats['inserted'])
+    progress.incr('neighbours_updated', stats['updated_neighbours'])
+    return stats
+
+
+@shared_task
+def finish_preprocess(similarity_results, job_id=None):
+    """Invalidate the cached responses and report the remaining work once the job is done."""
+
+    response_cache.bump_generation()
+    JobProgress(job_id).set_state('done')
+    pending = PaperMapper().count_pending()
+    print(f"Preprocessing done ({len(similarity_results)} similarity tasks), pending work: {pending}")
+    print(f"Author cache: {author_resolver.stats()}")
+    return {'similarity_tasks': len(similarity_results), 'pending': pending}
+
+
+@shared_task
+def mark_job_failed(request, exc, traceback, job_id=None):
+    """Error callback of the chords of a job. A chord calls it when one of its sub-tasks or its body raised, and the
+    job is marked as failed, as the following stages will not run."""
+
+    print(f"Preprocessing job {job_id} failed in task {request.id}: {exc!r}")
+    JobProgress(job_id).set_state('failed', error=repr(exc))
+
+
+def on_error(signature, job_id):
+    """Attach the error callback of the job to the signature of a chord body (or a single task)."""
 
-    # Iterate through each category and fetch papers
-    for cat in categories:
-        MAX_RESULTS_PER_PAGE = 100
-        category_name = ARXIV_CATEGORY_MAP.get(cat, cat)
-
-        # 1. Fetch and store papers
-        for start in range(0, number_articles, min(number_articles, MAX_RESULTS_PER_PAGE)):
-            # URL to fetch papers from arXiv and header to identify our application
-            url = f"https://export.arxiv.org/api/query?search_query=cat:{cat}.*&start={start}&max_results={min(number_articles, MAX_RESULTS_PER_PAGE)}"
-            headers = {
-                "User-Agent": "ResearchLens/0.1 (mailto:shahilabdul001@gmail.com,janhagnberger@gmail.com)"
-            }
-
-            session = requests.Session()
-            retries = Retry(
-                total=3,               # Retry up to 3 times
-                backoff_factor=1,      # Wait 1s, 2s, then 4s
-                status_forcelist=[429, 500, 502, 503, 504],  # Retry on these codes
-                raise_on_status=False
-            )
-            adapter = HTTPAdapter(max_retries=retries)
-            session.mount("https://", adapter)
-
-            try:
-                response = session.get(url, headers=headers, timeout=30)
-                response.raise_for_status()
-            except requests.exceptions.RequestException as e:
-                print(f"Failed to fetch papers from arXiv: {e}")
-                return
-
-            # response.content contains the response body, which is XML
-            root = ET.fromstring(response.content)
-            ns = {'atom': 'http://www.w3.org/2005/Atom'}
-
-            # 1.1 Extract paper details from XML response and store in the database
-            for entry in root.findall('atom:entry', ns):
-                arxiv_id = entry.find('atom:id', ns).text.split('/')[-1]
-                title = entry.find('atom:title', ns).text.strip()
-                abstract = entry.find('atom:summary', ns).text.strip()
-                published = entry.find('atom:published', ns).text[:10]
-
-                # Add paper to the paper table
-                paper, _ = paper_mapper.get_or_create(
-                    arxiv_id=arxiv_id,
-                    defaults={'title': title, 'abstract': abstract, 'published_date': published, 'categories': category_name, 'link': entry.find('atom:id', ns).text.strip()}
-                )
-
-                # Add the author(s) to the paper and database
-                authors = list(set(entry.findall('atom:author', ns))) # Use set to avoid duplicates
-                paper_authors = []
-                for author in authors:
-                    name = author.find('atom:name', ns).text.strip()
-                    author_obj, _ = author_mapper.get_or_create(name=name)
-                    paper_authors.append(author_obj)
-                    
-                # Update the paper with the author
-                paper.authors = paper_authors
-                paper_mapper.update(paper)
-
-
-            # 2. Extract keywords if not already done
-            papers = paper_mapper.get_filtered(keywords=[])
-            for paper in papers:
-                keywords = kw_model.extract_keywords(paper.abstract, top_n=10)
-                paper.keywords = [kw[0] for kw in keywords]
-                paper_mapper.update(paper)
-            
-            # 3. Build similarity graph
-            # 3.1 Generate embeddings for each paper if not already done
-            papers = paper_mapper.get_filtered(embedding=None)
-            for paper in papers:
-                embedding = model.encode(paper.abstract).tolist()
-                paper.embedding = embedding
-                paper_mapper.update(paper)
-            
-            # 3.2 Calculate pairwise similarities and store in the database. Currently not used when querying for related papers
-            papers = paper_mapper.get_excluded(embedding=None)
-            for i, paper1 in enumerate(papers):
-                for j, paper2 in enumerate(papers[i+1:]):
-                    score = float(util.cos_sim(np.array(paper1.embedding), np.array(paper2.embedding)))
-                    if score >= 0.75:
-                        paper_similarity_mapper.get_or_create(
-                            source_paper_id=paper1.id,
-                            target_paper_id=paper2.id,
-                            similarity_score=score
-                        )
-            
-            # 4. Wait for a while before the next fetch to avoid hitting rate limits
-            time.sleep(3)
+    return signature.on_error(mark_job_failed.s(job_id=job_id))
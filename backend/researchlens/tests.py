@@ -0,0 +1,359 @@
+"""
+Tests of the SQL instrumentation of the mappers (see sql_instrumentation.py), of the database driver that Django uses
+and of the statements the mappers send. The statements are passed to a QueryRecorder with a fake execute function or to
+a cursor that records them, so the tests do not need a database. Run them with `python manage.py test`.
+"""
+
+import asyncio
+import contextlib
+import json
+from datetime import date
+from unittest import mock
+
+import numpy as np
+from django.db import connection
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.test import SimpleTestCase
+
+from . import object_relational_mapper
+from .models import Author
+from .object_relational_mapper import PaperListQuery, PaperMapper, PaperNeighbourMapper, paper_from_row
+from .similarity import SimilarityGraphBuilder
+from .sql_instrumentation import QueryRecorder, QueryStats, current_method, instrument_mapper
+
+
+class FakeCursor:
+    rowcount = 1
+
+
+@instrument_mapper
+class FakeMapper:
+    """A mapper whose statements are only recorded, in the shapes of methods the real mappers have."""
+
+    def __init__(self, stats):
+        self.recorder = QueryRecorder(stats, slow_query_ms=0, slow_query_log='unused', explain=False)
+
+    def _execute(self, sql="SELECT 1"):
+        self.recorder(lambda sql, params, many, context: None, sql, [], False, {'cursor': FakeCursor()})
+
+    def get(self):
+        self._execute()
+
+    def iter_blocks(self, blocks=2):
+        # A generator method like PaperMapper.iter_embedding_blocks
+        for block in range(blocks):
+            self._execute()
+            yield block
+
+    def iter_delegated(self, blocks=2):
+        # A plain method that returns the generator of a private helper
+        return self._iter_blocks(blocks)
+
+    def _iter_blocks(self, blocks):
+        for block in range(blocks):
+            self._execute()
+            yield block
+
+    async def aget(self):
+        await asyncio.sleep(0)
+        self._execute()
+
+
+class InstrumentMapperTests(SimpleTestCase):
+
+    def setUp(self):
+        self.stats = QueryStats('test')
+        self.mapper = FakeMapper(self.stats)
+
+    def statements(self):
+        return {method: totals[0] for method, totals in self.stats.methods.items()}
+
+    def test_method(self):
+        self.mapper.get()
+        self.assertEqual(self.statements(), {'FakeMapper.get': 1})
+
+    def test_generator_method(self):
+        blocks = self.mapper.iter_blocks()
+        # Nothing runs before the generator is iterated
+        self.assertEqual(self.statements(), {})
+        self.assertEqual(list(blocks), [0, 1])
+        self.assertEqual(self.statements(), {'FakeMapper.iter_blocks': 2})
+
+    def test_method_returning_generator(self):
+        self.assertEqual(list(self.mapper.iter_delegated(3)), [0, 1, 2])
+        self.assertEqual(self.statements(), {'FakeMapper.iter_delegated': 3})
+
+    def test_interleaved_methods(self):
+        # Statements of other methods between the steps of a generator count for those methods
+        for _ in self.mapper.iter_blocks():
+            self.assertIsNone(current_method.get())
+            self.mapper.get()
+        self.assertEqual(self.statements(), {'FakeMapper.iter_blocks': 2, 'FakeMapper.get': 2})
+
+    def test_coroutine_method(self):
+        asyncio.run(self.mapper.aget())
+        self.assertEqual(self.statements(), {'FakeMapper.aget': 1})
+
+    def test_statement_outside_mapper(self):
+        self.mapper._execute()
+        self.assertEqual(self.statements(), {'other': 1})
+
+
+class DatabaseDriverTests(SimpleTestCase):
+    """psycopg 3 is installed for the async connection pool, which also switches Django's sync backend to it."""
+
+    def test_sync_driver_is_psycopg3(self):
+        self.assertTrue(is_psycopg3)
+        self.assertEqual(connection.Database.__name__, 'psycopg')
+
+    def test_keywords_of_both_drivers(self):
+        # psycopg 3 decodes JSONB, psycopg2 returns it as text
+        row = [1, '2401.00001', 'Title', 'Abstract', None, None, 'link', 'cs']
+        for keywords in (['a', 'b'], json.dumps(['a', 'b'])):
+            row[4] = keywords
+            self.assertEqual(paper_from_row(row).keywords, ['a', 'b'])
+
+
+class RecordingCursor:
+    """A cursor that records the statements and returns the given results of the fetch calls in order."""
+
+    def __init__(self, results=()):
+        self.statements = []
+        self.results = list(results)
+        self.rowcount = 0
+        self.fetch_sizes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        return self.results.pop(0) if self.results else []
+
+    def statement(self, prefix):
+        """Return the (sql, params) of the first recorded statement that starts with the prefix."""
+
+        return next(statement for statement in self.statements if statement[0].startswith(prefix))
+
+
+@contextlib.contextmanager
+def mapper_cursor(cursor):
+    """Let the mappers run their statements (on plain and on server-side cursors) on the given cursor."""
+
+    with mock.patch.object(object_relational_mapper, 'connection') as connection, \
+            mock.patch.object(object_relational_mapper, 'transaction'):
+        connection.cursor.return_value = cursor
+        connection.chunked_cursor.return_value = cursor
+        yield
+
+
+class BulkIngestTests(SimpleTestCase):
+    """The feed lists the papers and their authors in an order that differs from their ids on purpose."""
+
+    def setUp(self):
+        self.entries = [
+            {'arxiv_id': '2401.00002', 'title': ' Second\n paper ', 'abstract': 'B', 'published_date': '2024-01-02',
+             'categories': 'cs', 'link': 'link2', 'authors': ['Zoe Zed', 'Amy Ash', ' Zoe  Zed']},
+            {'arxiv_id': '2401.00001', 'title': 'First paper', 'abstract': 'A', 'published_date': '2024-01-01',
+             'categories': 'cs', 'link': 'link1', 'authors': ['Bob Bell', 'Amy Ash']},
+        ]
+        self.authors = {'Zoe Zed': Author(id=1, name='Zoe Zed'), 'Amy Ash': Author(id=2, name='Amy Ash'),
+                        'Bob Bell': Author(id=3, name='Bob Bell')}
+        # The paper of the later arXiv id has the smaller paper id
+        rows = [(7, '2401.00001', 'First paper', 'A', [], date(2024, 1, 1), 'link1', 'cs'),
+                (5, '2401.00002', 'Second paper', 'B', [], date(2024, 1, 2), 'link2', 'cs')]
+        self.cursor = RecordingCursor([rows])
+
+    def ingest(self):
+        resolve_many = lambda names: {name: self.authors[name] for name in names}
+        with mapper_cursor(self.cursor), mock.patch.object(
+                object_relational_mapper.author_resolver, 'resolve_many', side_effect=resolve_many) as resolve:
+            papers, _ = PaperMapper().bulk_ingest(self.entries)
+        return papers, resolve
+
+    def test_rows_are_locked_in_a_fixed_order(self):
+        _, resolve = self.ingest()
+        resolve.assert_called_once_with(['Amy Ash', 'Bob Bell', 'Zoe Zed'])
+        sql, params = self.cursor.statement("INSERT INTO researchlens_paper ")
+        self.assertIn("ORDER BY v.arxiv_id", sql)
+        self.assertEqual(params[0], ['2401.00001', '2401.00002'])
+        self.assertEqual(params[1], ['First paper', 'Second paper'])
+        sql, params = self.cursor.statement("DELETE FROM researchlens_paper_authors")
+        self.assertIn("ORDER BY pa.paper_id, pa.author_id FOR UPDATE", sql)
+        self.assertEqual(params[0], [5, 7])
+
+    def test_links_are_inserted_in_byline_order(self):
+        self.ingest()
+        sql, (paper_ids, author_ids) = self.cursor.statement("INSERT INTO researchlens_paper_authors")
+        self.assertIn("ORDER BY l.position", sql)
+        # By paper id, and by position in the byline within a paper (duplicate names are dropped)
+        self.assertEqual(paper_ids, [5, 5, 7, 7])
+        self.assertEqual(author_ids, [1, 2, 3, 2])
+
+    def test_papers_are_returned_in_feed_order(self):
+        papers, _ = self.ingest()
+        self.assertEqual([paper.arxiv_id for paper in papers], ['2401.00002', '2401.00001'])
+        self.assertEqual([[author.name for author in paper.authors] for paper in papers],
+                         [['Zoe Zed', 'Amy Ash'], ['Bob Bell', 'Amy Ash']])
+
+
+class PaperListQueryTests(SimpleTestCase):
+
+    def test_offset_pages(self):
+        query = PaperListQuery(page=3, page_size=10, categories='cs,math')
+        sql, params = query.page_statement()
+        self.assertIn("p.categories IN (%s, %s)", sql)
+        self.assertNotIn("(p.published_date, p.id) <", sql)
+        self.assertEqual(params, ['cs', 'math', 10, 20])
+
+    def test_keyset_pages(self):
+        query = PaperListQuery(page=3, page_size=10, search='graph', after=(date(2024, 1, 2), 7))
+        sql, params = query.page_statement()
+        self.assertIn("(p.published_date, p.id) < (%s, %s)", sql)
+        # The keyset replaces the offset
+        self.assertEqual(params, ['graph', date(2024, 1, 2), 7, 10, 0])
+
+    def test_relevance_order_ignores_the_keyset(self):
+        query = PaperListQuery(page=2, page_size=10, search='graph', order='relevance', after=(date(2024, 1, 2), 7))
+        sql, params = query.page_statement()
+        self.assertNotIn("(p.published_date, p.id) <", sql)
+        self.assertIn("ORDER BY rank DESC", sql)
+        self.assertEqual(params, ['graph', 'graph', 10, 10])
+
+    def test_exact_count(self):
+        query = PaperListQuery(search='graph', count='exact')
+        sql, params = query.count_statement()
+        self.assertTrue(sql.startswith("SELECT count(*) FROM researchlens_paper p WHERE"))
+        self.assertEqual(params, ['graph'])
+        self.assertEqual(query.total_count((42,)), 42)
+
+    def test_estimated_count(self):
+        query = PaperListQuery(search='graph', count='estimated')
+        sql, params = query.count_statement()
+        self.assertTrue(sql.startswith("EXPLAIN (FORMAT JSON) SELECT 1 FROM researchlens_paper p WHERE"))
+        self.assertEqual(params, ['graph'])
+        plan = [{'Plan': {'Plan Rows': 1234}}]
+        # psycopg 3 decodes the JSON plan, psycopg2 returns it as text
+        self.assertEqual(query.total_count((plan,)), 1234)
+        self.assertEqual(query.total_count((json.dumps(plan),)), 1234)
+
+    def test_no_count(self):
+        self.assertIsNone(PaperListQuery(count='none').count_statement())
+
+
+class StreamingReaderTests(SimpleTestCase):
+    """The readers fetch their rows from a server-side cursor in batches."""
+
+    def test_iter_filtered(self):
+        row = lambda paper_id: (paper_id, str(paper_id), 'Title', 'Abstract', [], date(2024, 1, 1), 'link', 'cs', None,
+                                [1], ['Amy Ash'], [None])
+        cursor = RecordingCursor([[row(1), row(2)], [row(3)]])
+        with mapper_cursor(cursor):
+            chunks = PaperMapper().iter_filtered(itersize=2, embedding=None)
+            self.assertEqual(cursor.statements, [])
+            chunks = [[paper.id for paper in chunk] for chunk in chunks]
+        self.assertEqual(chunks, [[1, 2], [3]])
+        self.assertEqual(cursor.fetch_sizes, [2, 2, 2])
+        sql, params = cursor.statements[0]
+        self.assertIn("p.embedding IS NULL", sql)
+        self.assertEqual(params, [])
+
+    def test_iter_embedding_blocks(self):
+        # The registered pgvector adapter returns the vectors as NumPy arrays
+        vectors = np.eye(3, 384, dtype=np.float32)
+        cursor = RecordingCursor([[(1, vectors[0]), (4, vectors[1])], [(9, vectors[2])]])
+        with mapper_cursor(cursor):
+            blocks = list(PaperMapper().iter_embedding_blocks(block_size=2))
+        self.assertEqual([ids.tolist() for ids, _ in blocks], [[1, 4], [9]])
+        self.assertEqual([embeddings.shape for _, embeddings in blocks], [(2, 384), (1, 384)])
+        # One query for the whole corpus, fetched one block at a time
+        self.assertEqual(len(cursor.statements), 1)
+        self.assertEqual(cursor.fetch_sizes, [2, 2, 2])
+
+
+class FakeCorpusMapper:
+    """Streams the embeddings of an in-memory corpus like PaperMapper.iter_embedding_blocks."""
+
+    def __init__(self, ids, embeddings):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+
+    def iter_embedding_blocks(self, block_size):
+        for start in range(0, len(self.ids), block_size):
+            yield self.ids[start:start + block_size], self.embeddings[start:start + block_size]
+
+
+class FakeSimilarityMapper:
+
+    def bulk_create(self, source_ids, target_ids, scores):
+        self.pairs = sorted(zip(np.asarray(source_ids).tolist(), np.asarray(target_ids).tolist()))
+        return len(self.pairs)
+
+
+class FakeNeighbourMapper:
+    """Keeps the neighbour lists in memory. `thresholds` are the current k-th scores of the existing papers."""
+
+    def __init__(self, thresholds):
+        self.thresholds = thresholds
+        self.replaced, self.merged = {}, {}
+
+    def get_thresholds(self, paper_ids, k):
+        return {paper_id: self.thresholds.get(paper_id, float('-inf')) for paper_id in paper_ids.tolist()}
+
+    def replace(self, paper_ids, source_ids, neighbour_ids, scores):
+        for source_id, neighbour_id in zip(source_ids.tolist(), neighbour_ids.tolist()):
+            self.replaced.setdefault(source_id, set()).add(neighbour_id)
+        return len(source_ids)
+
+    def merge(self, paper_ids, neighbour_ids, scores, k=10):
+        for paper_id, neighbour_id in zip(paper_ids.tolist(), neighbour_ids.tolist()):
+            self.merged.setdefault(paper_id, set()).add(neighbour_id)
+        return len(paper_ids)
+
+
+class SimilarityGraphBuilderTests(SimpleTestCase):
+    """Papers 1 and 2 exist, papers 3 and 4 are new. All four are similar to each other, the blocks of two papers split
+    the corpus and the new papers differently."""
+
+    def setUp(self):
+        self.embeddings = np.zeros((4, 384), dtype=np.float32)
+        self.embeddings[:, 0] = 1.0
+        self.embeddings[:, 1] = [0.0, 0.1, 0.05, 0.3]
+        self.similarity_mapper = FakeSimilarityMapper()
+        # Paper 1 has no neighbour rows yet, the list of paper 2 is full of closer papers
+        self.neighbour_mapper = FakeNeighbourMapper({2: 1.5})
+        self.builder = SimilarityGraphBuilder(
+            threshold=0.75, block_size=2, k=2, paper_mapper=FakeCorpusMapper([1, 2, 3, 4], self.embeddings),
+            similarity_mapper=self.similarity_mapper, neighbour_mapper=self.neighbour_mapper
+        )
+
+    def test_pairs_are_stored_once(self):
+        self.builder.build([4, 3], self.embeddings[[3, 2]])
+        # Every pair with a new paper once (smaller id first), no pair of a paper with itself or of two existing papers
+        self.assertEqual(self.similarity_mapper.pairs, [(1, 3), (1, 4), (2, 3), (2, 4), (3, 4)])
+
+    def test_neighbour_lists(self):
+        self.builder.build([3, 4], self.embeddings[[2, 3]])
+        # The new papers get their complete top-k list without themselves
+        self.assertEqual(self.neighbour_mapper.replaced, {3: {1, 2}, 4: {2, 3}})
+        # Paper 1 has no neighbours yet and takes the new papers, paper 2 keeps its closer neighbours
+        self.assertEqual(self.neighbour_mapper.merged, {1: {3, 4}})
+
+
+class NeighbourThresholdTests(SimpleTestCase):
+
+    def test_thresholds(self):
+        # Paper 1 has a full list, paper 2 a short one and paper 3 no neighbour rows
+        cursor = RecordingCursor([[(1, 2, 0.8), (2, 1, 0.9)]])
+        with mapper_cursor(cursor):
+            thresholds = PaperNeighbourMapper().get_thresholds(np.array([1, 2, 3]), k=2)
+        self.assertEqual(thresholds, {1: 0.8, 2: float('-inf'), 3: float('-inf')})
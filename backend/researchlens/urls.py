@@ -14,13 +14,22 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from .views import start_fetch, RelatedPapersView, PaperListView
+from .views import (start_fetch, preprocess_status, preprocess_metrics, RelatedPapersView, PaperListView, cache_stats,
+                    AsyncPaperListView, AsyncRelatedPapersView)
+
+# The async views need an ASGI server (see ASYNC_VIEWS in settings.py)
+paper_list_view = AsyncPaperListView if settings.ASYNC_VIEWS else PaperListView
+related_papers_view = AsyncRelatedPapersView if settings.ASYNC_VIEWS else RelatedPapersView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/start-preprocess/', start_fetch, name='start_fetch'),
-    path("api/paper/", PaperListView.as_view()),
-    path("api/related/<int:paper_id>/", RelatedPapersView.as_view()),
+    path('api/preprocess-status/<str:task_id>/', preprocess_status, name='preprocess_status'),
+    path('api/metrics/', preprocess_metrics, name='preprocess_metrics'),
+    path("api/paper/", paper_list_view.as_view()),
+    path("api/related/<int:paper_id>/", related_papers_view.as_view()),
+    path("api/cache-stats/", cache_stats),
 ]
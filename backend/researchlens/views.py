@@ -3,6 +3,12 @@ This file contains the views for the ResearchLens application, including API end
 The file contains only little code because the actual logic is implemented in the our custom object relational mapper (ORM).
 """
 
+import base64
+from datetime import date
+
+from celery.result import AsyncResult
+from django.http import HttpResponse, JsonResponse
+from django.views import View
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from .tasks import run_data_preprocess
@@ -10,6 +16,9 @@ from rest_framework.views import APIView
 
 # custom object relational mappers (ORMs) to explicitly handle database interactions
 from .object_relational_mapper import PaperMapper, RelatedPaperMapper
+from .async_object_relational_mapper import AsyncPaperMapper, AsyncRelatedPaperMapper
+from .job_progress import JobProgress, prometheus_metrics
+from . import response_cache
 
 @api_view(['POST'])
 def start_fetch(request):
@@ -18,44 +27,200 @@ def start_fetch(request):
     number_articles = int(request.GET.get("number_articles", 10))
     categories = request.GET.get("categories", ",".join(['cs', 'math'])).split(',')
     print(f"Starting data fetch with {number_articles} articles from categories: {categories}")
-    run_data_preprocess.delay(number_articles, categories)
-    return Response({"status": "Data fetching and preprocessing started"})
+    result = run_data_preprocess.delay(number_articles, categories)
+    return Response({
+        "status": "Data fetching and preprocessing started",
+        "task_id": result.id,
+        "status_url": f"/api/preprocess-status/{result.id}/",
+    })
+
+
+@api_view(['GET'])
+def preprocess_status(request, task_id):
+    """Returns the progress of a preprocessing job: its state ('done' or 'failed' with the error once it is over), the
+    work done so far and the wall time and throughput of every stage."""
+    
+    progress = JobProgress(task_id).snapshot()
+    if progress is None:
+        return Response({"error": f"Unknown preprocessing task: {task_id}"}, status=404)
+    # In fan-out mode the task that started the job succeeds as soon as the sub-tasks are dispatched, so the state of
+    # the job is the one recorded by the sub-tasks. Only a failure of that task (before the job could record one) is
+    # taken from its result.
+    result = AsyncResult(task_id)
+    if result.state == 'FAILURE' and progress['state'] != 'failed':
+        progress['state'] = 'failed'
+        progress['error'] = repr(result.result)
+    return Response(progress)
+
+
+def preprocess_metrics(request):
+    """Returns the totals of all preprocessing jobs in the Prometheus text format."""
+    
+    return HttpResponse(prometheus_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def encode_cursor(paper):
+    """Encode the keyset (publication date and id) of the last paper of a page into an opaque cursor string."""
+    
+    return base64.urlsafe_b64encode(f"{paper.published_date.isoformat()}|{paper.id}".encode()).decode()
+
+
+def decode_cursor(value):
+    """Decode a cursor string into a (publication date, id) tuple. Raises ValueError for invalid cursors."""
+    
+    try:
+        published_date, paper_id = base64.urlsafe_b64decode(value.encode()).decode().split('|')
+        return date.fromisoformat(published_date), int(paper_id)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {value}") from e
+
+
+PAGE_SIZE = 10  # Default page size of the paper list
+
+
+def paper_list_params(query):
+    """Read the parameters of the paper list from the query string (shared by the sync and the async view). Raises
+    ValueError with the message for the client if a parameter is invalid. The values are normalized here and used as
+    they are by both the query and the response cache key, so that equivalent requests share one cache entry: the
+    whitespace and case of the search text (the full-text search ignores both) and the order of the categories do not
+    matter."""
+    
+    count = query.get('count', 'exact')  # 'exact', 'estimated' or 'none'
+    if count not in ('exact', 'estimated', 'none'):
+        raise ValueError("count must be one of 'exact', 'estimated' or 'none'")
+    categories = sorted({category.strip() for category in query.get('categories', '').split(',') if category.strip()})
+    return {
+        'search': ' '.join(query.get('search', '').lower().split()),
+        'start_date': query.get('start_date', ''),
+        'end_date': query.get('end_date', ''),
+        'categories': ','.join(categories),
+        'page': int(query.get('page', 1)),
+        'order': query.get('order', 'date'),  # 'date' or 'relevance' (only used with a search text)
+        'count': count,
+        'cursor': query.get('cursor'),
+    }
+
+
+def paper_list_arguments(params):
+    """Turn the parameters of the paper list into the arguments of PaperMapper.get (and AsyncPaperMapper.get)."""
+    
+    return {
+        'page': params['page'], 'page_size': PAGE_SIZE, 'search': params['search'], 'start_date': params['start_date'],
+        'end_date': params['end_date'], 'categories': params['categories'], 'order': params['order'],
+        'after': decode_cursor(params['cursor']) if params['cursor'] else None, 'count': params['count'],
+    }
+
+
+def paper_list_response(params, total_count, papers):
+    """Serialize a page of the paper list."""
+    
+    # Serialize the papers into JSON format
+    serialized_papers = [paper.to_dict() for paper in papers]
+    
+    # The cursor of the next page is only available when ordering by date (the keyset is date and id)
+    next_cursor = None
+    if len(papers) == PAGE_SIZE and not (params['search'] and params['order'] == 'relevance'):
+        next_cursor = encode_cursor(papers[-1])
+    
+    return {
+        'current_page': params['page'],
+        'total_pages': total_count//PAGE_SIZE + (1 if total_count % PAGE_SIZE > 0 else 0) if total_count is not None else None,
+        'total_items': total_count,
+        'next_cursor': next_cursor,
+        'results': serialized_papers
+    }
+
+
+def related_params(query):
+    """Read the optional recall/speed parameters of the approximate nearest neighbour search. Raises ValueError with
+    the message for the client if a parameter is invalid."""
+    
+    try:
+        ef_search = int(query['ef_search']) if query.get('ef_search') else None
+        probes = int(query['probes']) if query.get('probes') else None
+    except ValueError:
+        raise ValueError("ef_search and probes must be integers")
+    if (ef_search is not None and not 1 <= ef_search <= 1000) or (probes is not None and probes < 1):
+        raise ValueError("ef_search must be between 1 and 1000 and probes must be positive")
+    return ef_search, probes
 
 
 class PaperListView(APIView):
     def get(self, request):
-        """Fetches a paginated list of papers based on search criteria."""
+        """Fetches a paginated list of papers based on search criteria. Besides the page number, the view supports
+        cursor-based pagination: pass the `next_cursor` of the previous response as `cursor` to get the next page.
+        The total number of papers can be counted exactly (default), estimated, or skipped with `count=none`."""
         
-        search = request.GET.get('search', '')
-        start = request.GET.get('start_date', '')
-        end = request.GET.get('end_date', '')
-        cat = request.GET.get('categories', '')
-        page = int(request.GET.get('page', 1))
-        PAGE_SIZE = 10  # Default page size
-
-        # Use the custom ORM to fetch papers
-        paper_mapper = PaperMapper()
-        total_count, papers = paper_mapper.get(page=page, page_size=PAGE_SIZE, search=search, start_date=start, end_date=end, categories=cat)
-
-        # Serialize the papers into JSON format
-        serialized_papers = [paper.to_dict() for paper in papers]
+        try:
+            params = paper_list_params(request.GET)
+            arguments = paper_list_arguments(params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        def load():
+            # Use the custom ORM to fetch papers
+            total_count, papers = PaperMapper().get(**arguments)
+            return paper_list_response(params, total_count, papers)
         
-        # Return the paginated response
-        return Response({
-            'current_page': page,
-            'total_pages': total_count//PAGE_SIZE + (1 if total_count % PAGE_SIZE > 0 else 0),
-            'total_items': total_count,
-            'results': serialized_papers
-        })
+        # Return the paginated response, popular queries are served from the response cache
+        return Response(response_cache.get_or_compute('papers', params, load))
 
 
 class RelatedPapersView(APIView):
     """Fetches related papers based on a given paper ID."""
     
     def get(self, request, paper_id):
-        mapper = RelatedPaperMapper()
-        related_papers = mapper.get(paper_id)
+        try:
+            ef_search, probes = related_params(request.GET)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
         
-        serialized_papers = [paper.to_dict() for paper in related_papers]
+        def load():
+            mapper = RelatedPaperMapper()
+            related_papers = mapper.get(paper_id, ef_search=ef_search, probes=probes)
+            return [paper.to_dict() for paper in related_papers]
+
+        params = {'paper_id': paper_id, 'ef_search': ef_search, 'probes': probes}
+        return Response(response_cache.get_or_compute('related', params, load))
 
-        return Response(serialized_papers)
+
+class AsyncPaperListView(View):
+    """Async version of PaperListView for the ASGI deployment. While the queries of a request wait for PostgreSQL, the
+    process serves other requests."""
+    
+    async def get(self, request):
+        try:
+            params = paper_list_params(request.GET)
+            arguments = paper_list_arguments(params)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        async def load():
+            total_count, papers = await AsyncPaperMapper().get(**arguments)
+            return paper_list_response(params, total_count, papers)
+        
+        return JsonResponse(await response_cache.aget_or_compute('papers', params, load))
+
+
+class AsyncRelatedPapersView(View):
+    """Async version of RelatedPapersView for the ASGI deployment."""
+    
+    async def get(self, request, paper_id):
+        try:
+            ef_search, probes = related_params(request.GET)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
+        async def load():
+            related_papers = await AsyncRelatedPaperMapper().get(paper_id, ef_search=ef_search, probes=probes)
+            return [paper.to_dict() for paper in related_papers]
+
+        params = {'paper_id': paper_id, 'ef_search': ef_search, 'probes': probes}
+        return JsonResponse(await response_cache.aget_or_compute('related', params, load), safe=False)
+
+
+@api_view(['GET'])
+def cache_stats(request):
+    """Returns the hit ratio and the time saved by the response cache."""
+    
+    return Response(response_cache.stats())